@@ -0,0 +1,369 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# bpsTsIdxAsync.py
+#
+# imports
+#
+# system related
+import asyncio
+
+# numerical manipulation libraries
+import numpy as np
+import pandas as pd
+
+# Local application and user library imports
+# TimeStamped Indexed Data Class
+from bpsTsIdxData import TsIdxData
+
+
+class AsyncTsIdxWriter(object):
+    """
+    Class: AsyncTsIdxWriter
+    File: bpsTsIdxAsync.py
+
+    Asyncio front end for appending samples to a TsIdxData
+
+    Samples from sockets, message queues, and the like are put into a buffer
+    without blocking the event loop. A flush task sends them to
+    TsIdxData.appendData in batches. The append (sorting, removing duplicates,
+    and merging) runs in an executor, off the event loop. Only one batch is
+    appended at a time, so the TsIdxData is only ever changed by one thread.
+
+    The buffer is limited to maxBuffer samples, counting the batch being
+    appended. When it is full, put() and putMany() wait for room
+    (backpressure), so fast producers are slowed to the rate the data can be
+    appended.
+
+    The constructor (ctor) has these arguments:
+      tsIdxData -- The TsIdxData object (or subclass) to append to. Use a
+                   TsIdxRingData for long running feeds.
+
+      maxBuffer -- The most samples held before producers have to wait.
+                   Default is 100000.
+
+      batchSize -- A batch is appended as soon as this many samples are
+                   buffered. Default is 10000.
+
+      flushInterval -- Seconds to wait for a full batch before appending the
+                       samples buffered so far. Default is 1.0.
+
+      executor -- The concurrent.futures executor to append in. Default is
+                  None, the event loop default executor.
+
+    Methods (all are coroutines)
+        start()
+            Start the flush task. Called by put() and putMany() if needed.
+
+        put(ts, value)
+            Add one sample, waiting if the buffer is full.
+
+        putMany(times, values)
+            Add many samples, waiting if the buffer is full. A dataframe or
+            series with a time index can be passed as times, with values
+            left as None.
+
+        flush()
+            Append everything buffered so far, and wait until it is done.
+
+        snapshot()
+            Flush, and return a TsIdxSnapshot with every sample put so far,
+            and no partly appended batch. Other readers can call
+            tsIdxData.snapshot() at any time, without waiting.
+
+        close()
+            Flush, and stop the flush task. The writer can also be used as an
+            async context manager (async with), which closes it on exit.
+
+    The following read only properties are implemented
+        tsIdxData
+            the TsIdxData object appended to
+
+        pending
+            the number of samples buffered or being appended
+
+        maxBuffer
+            the most samples held before producers wait
+
+        appendedCount
+            the number of samples appended so far
+
+        batchCount
+            the number of batches appended so far
+
+    An error while appending a batch is printed, and raised by the next call
+    to put(), putMany(), flush(), snapshot(), or close(). Samples in that
+    batch are lost.
+    """
+
+    def __init__(
+        self,
+        tsIdxData,
+        maxBuffer=100000,
+        batchSize=10000,
+        flushInterval=1.0,
+        executor=None,
+    ):
+        """
+        AsyncTsIdxWriter constructor (ctor). Details are in above class
+        description.
+        """
+        if not isinstance(tsIdxData, TsIdxData):
+            print("    ERROR: AsyncTsIdxWriter needs a TsIdxData object.")
+            raise TypeError(
+                "tsIdxData must be a TsIdxData, not " + type(tsIdxData).__name__
+            )
+        self._tsIdxData = tsIdxData
+        self._maxBuffer = max(int(maxBuffer), 1)
+        self._batchSize = min(max(int(batchSize), 1), self._maxBuffer)
+        self._flushInterval = float(flushInterval)
+        self._executor = executor
+
+        # Samples waiting to be appended, as lists of int64 ns timestamps and
+        # float values. Lists are cheap to append to one sample at a time.
+        self._bufTs = []
+        self._bufVals = []
+        # Samples in the batch being appended
+        self._inFlight = 0
+        self._appendedCount = 0
+        self._batchCount = 0
+        self._error = None
+        self._closing = False
+        self._flushTask = None
+        # Made when started, so they belong to the running event loop
+        self._changed = None
+        self._appendLock = None
+
+    def __repr__(self):
+        outputMsg = "{:13} {}".format("\nWriter for: ", self._tsIdxData.name + "\n")
+        outputMsg += "{:13} {}".format("Pending: ", str(self.pending) + "\n")
+        outputMsg += "{:13} {}".format("Appended: ", str(self._appendedCount) + "\n")
+        outputMsg += "{:13} {}".format("Batches: ", str(self._batchCount) + "\n")
+        return outputMsg
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, excType, excValue, traceback):
+        await self.close()
+        return False
+
+    async def start(self):
+        """
+        Start the flush task, if it is not running.
+        """
+        if self._flushTask is not None and not self._flushTask.done():
+            return
+        if self._changed is None:
+            # One condition is used for "samples were buffered" (wakes the
+            # flush task) and "a batch was appended" (wakes the producers).
+            self._changed = asyncio.Condition()
+            self._appendLock = asyncio.Lock()
+        self._closing = False
+        self._flushTask = asyncio.get_running_loop().create_task(self.__flushLoop())
+
+    async def put(self, ts, value):
+        """
+        Add one sample. ts is anything pandas.Timestamp understands, and value
+        is a number. Waits while the buffer is full.
+        """
+        await self.__waitForRoom(1)
+        self._bufTs.append(pd.Timestamp(ts).value)
+        self._bufVals.append(float(value))
+        await self.__notify()
+
+    async def putMany(self, times, values=None):
+        """
+        Add many samples. times is anything pandas.DatetimeIndex understands,
+        and values the same number of numbers. If times is a series or a
+        dataframe (the first column is used) with a time index, values can be
+        left as None. Waits while the buffer is full. Large groups of samples
+        are added a buffer full at a time.
+        """
+        if values is None:
+            if isinstance(times, pd.DataFrame):
+                times = times.iloc[:, 0]
+            values = times.to_numpy(dtype="float64")
+            times = times.index
+        tsNs = pd.DatetimeIndex(times).asi8
+        vals = np.asarray(values, dtype="float64")
+        if len(tsNs) != len(vals):
+            print("    ERROR: putMany needs the same number of times and values.")
+            raise ValueError(
+                str(len(tsNs)) + " times and " + str(len(vals)) + " values"
+            )
+        start = 0
+        while start < len(tsNs):
+            room = await self.__waitForRoom(1)
+            stop = min(start + room, len(tsNs))
+            self._bufTs.extend(tsNs[start:stop].tolist())
+            self._bufVals.extend(vals[start:stop].tolist())
+            start = stop
+            await self.__notify()
+
+    async def flush(self):
+        """
+        Append everything buffered so far, and wait until it is appended.
+        """
+        await self.start()
+        await self.__appendBuffered()
+        self.__raiseError()
+
+    async def snapshot(self):
+        """
+        Flush, and return a TsIdxSnapshot (see TsIdxData.snapshot) with every
+        sample put before the call. The snapshot does not change with later
+        appends, and can be handed to other tasks or threads.
+        """
+        await self.flush()
+        async with self._appendLock:
+            if self._tsIdxData._lazy:
+                # Run the plan (off the loop), which publishes the data
+                loop = asyncio.get_running_loop()
+                await loop.run_in_executor(
+                    self._executor, lambda: self._tsIdxData.count
+                )
+            return self._tsIdxData.snapshot()
+
+    async def close(self):
+        """
+        Append everything buffered, and stop the flush task.
+        """
+        if self._flushTask is None:
+            return
+        self._closing = True
+        await self.__notify()
+        await self._flushTask
+        self._flushTask = None
+        # Anything put while closing
+        await self.__appendBuffered()
+        self.__raiseError()
+
+    async def __waitForRoom(self, count):
+        """
+        Private member function to wait until there is room in the buffer for
+        at least count samples (at most maxBuffer). Returns the room there is.
+        """
+        self.__raiseError()
+        await self.start()
+        count = min(count, self._maxBuffer)
+        async with self._changed:
+            await self._changed.wait_for(
+                lambda: self._maxBuffer - self.pending >= count
+                or self._error is not None
+            )
+        self.__raiseError()
+        return self._maxBuffer - self.pending
+
+    async def __notify(self):
+        """
+        Private member function to wake the flush task and any waiting
+        producers.
+        """
+        async with self._changed:
+            self._changed.notify_all()
+
+    async def __flushLoop(self):
+        """
+        Private member function run as the flush task. Appends a batch when
+        batchSize samples are buffered, or flushInterval seconds have passed.
+        """
+        while True:
+            async with self._changed:
+                try:
+                    await asyncio.wait_for(
+                        self._changed.wait_for(
+                            lambda: len(self._bufTs) >= self._batchSize or self._closing
+                        ),
+                        self._flushInterval,
+                    )
+                except asyncio.TimeoutError:
+                    pass
+            await self.__appendBuffered()
+            if self._closing:
+                return
+
+    async def __appendBuffered(self):
+        """
+        Private member function to append the buffered samples in an
+        executor. The lock makes sure only one batch is appended at a time,
+        in the order the samples were put.
+        """
+        async with self._appendLock:
+            if not self._bufTs:
+                return
+            tsNs = self._bufTs
+            vals = self._bufVals
+            self._bufTs = []
+            self._bufVals = []
+            self._inFlight = len(tsNs)
+            loop = asyncio.get_running_loop()
+            try:
+                await loop.run_in_executor(
+                    self._executor, self.__appendBatch, tsNs, vals
+                )
+                self._appendedCount += len(tsNs)
+                self._batchCount += 1
+            except Exception as e:
+                print(
+                    "    ERROR: "
+                    + self._tsIdxData.name
+                    + ": Unable to append a batch of "
+                    + str(len(tsNs))
+                    + " samples. "
+                    + type(e).__name__
+                    + ": "
+                    + str(e)
+                )
+                self._error = e
+            finally:
+                self._inFlight = 0
+        # wake producers waiting for room
+        await self.__notify()
+
+    def __appendBatch(self, tsNs, vals):
+        """
+        Private member function run in the executor. Builds a dataframe from a
+        batch of samples, and appends it. appendData sorts the batch and
+        removes duplicate timestamps, keeping the last.
+        """
+        tsIdxData = self._tsIdxData
+        dfBatch = pd.DataFrame(
+            {tsIdxData.yName: np.asarray(vals, dtype="float64")},
+            index=pd.DatetimeIndex(
+                np.asarray(tsNs, dtype="int64").view("datetime64[ns]"),
+                name=tsIdxData.tsName,
+            ),
+        )
+        tsIdxData.appendData(dfBatch, IgnoreFirstRows=0)
+
+    def __raiseError(self):
+        """
+        Private member function to raise the error from a failed append, once.
+        """
+        if self._error is not None:
+            error = self._error
+            self._error = None
+            raise error
+
+    # read only properties
+    @property
+    def tsIdxData(self):
+        return self._tsIdxData
+
+    @property
+    def pending(self):
+        return len(self._bufTs) + self._inFlight
+
+    @property
+    def maxBuffer(self):
+        return self._maxBuffer
+
+    @property
+    def appendedCount(self):
+        return self._appendedCount
+
+    @property
+    def batchCount(self):
+        return self._batchCount
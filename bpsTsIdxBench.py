@@ -0,0 +1,629 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+bpsTsIdxBench.py
+
+Benchmarks for TsIdxData.
+
+Synthetic series (regular, jittered, duplicated, and gappy) are made at
+the requested sizes, and each public operation (build, append, filter,
+resample) is timed on them. The throughput (rows/s) and peak memory of
+each operation are recorded, and can be saved to a json file.
+
+A saved file can be used as a baseline. Results which are slower, or use
+more memory, than the baseline by more than a tolerance are flagged as
+regressions, and the program exits with a status of 1, so it can be used
+to check a pandas upgrade or a local change. Quick checks that the data
+and snapshots do not share arrays with the caller's data, and that
+conditioning the data does not copy it more than expected, are run first,
+and also set the exit status if they fail.
+"""
+
+# imports
+#
+# Standard library and system imports
+import sys
+import platform
+from contextlib import redirect_stdout
+import io
+import json
+import gc
+
+# date and time stuff
+from datetime import datetime
+import time
+
+# memory use
+import tracemalloc
+
+# arg parser
+import argparse
+
+# numerical manipulation libraries
+import numpy as np
+import pandas as pd
+
+# Local application and user library imports
+#
+# Note: May need PYTHONPATH (set in ~/.profile?) to be set depending
+# on the location of the imported files
+# TimeStamped Indexed Data Class
+from bpsTsIdxData import TsIdxData
+
+# Kinds of synthetic series. See makeSeries.
+SERIES_KINDS = ("regular", "jittered", "duplicated", "gappy")
+
+# The operations timed, in the order they are run. See _benchOps.
+BENCH_OPS = (
+    "ctor",
+    "ctorText",
+    "ctorQuery",
+    "appendNewer",
+    "appendOverlap",
+    "filter",
+    "resampleDown",
+    "resampleUp",
+)
+
+# Start time of the synthetic series
+SERIES_START = pd.Timestamp("2024-01-01")
+
+
+def makeSeries(rows, kind="regular", period="1S", seed=0):
+    """
+    Return a dataframe with rows samples of a synthetic series, indexed by a
+    timestamp named "ts", with a float value column named "val". The values
+    are a random walk. The same arguments always give the same series.
+      regular -- one sample every period.
+      jittered -- each timestamp is moved by up to a quarter period (to the
+                  millisecond), like a polled device.
+      duplicated -- about 5% of the timestamps are repeated, and blocks of
+                    rows are out of order, like a feed which resends data.
+      gappy -- about 1% of the samples start an outage of 10 to 1000
+               periods, like a device which drops off line.
+    """
+    rng = np.random.default_rng(seed)
+    periodNs = pd.Timedelta(period).value
+    steps = np.full(rows, periodNs, dtype="int64")
+    if kind == "gappy":
+        gapStarts = rng.random(rows) < 0.01
+        steps[gapStarts] += rng.integers(10, 1000, gapStarts.sum()) * periodNs
+    steps[0] = 0
+    tsNs = SERIES_START.value + np.cumsum(steps)
+    if kind == "jittered":
+        jitterMs = rng.integers(-periodNs // 4, periodNs // 4 + 1, rows) // 1000000
+        tsNs = tsNs + jitterMs * 1000000
+    elif kind == "duplicated":
+        # repeat the timestamp of the row before
+        repeats = np.flatnonzero(rng.random(rows) < 0.05)
+        repeats = repeats[repeats > 0]
+        tsNs[repeats] = tsNs[repeats - 1]
+        # swap neighboring blocks of 100 rows here and there
+        blockCount = rows // 100
+        if blockCount > 1:
+            order = np.arange(blockCount)
+            # even blocks only, so no block is in two swaps
+            swaps = 2 * np.flatnonzero(rng.random((blockCount - 1) // 2) < 0.04)
+            order[swaps], order[swaps + 1] = order[swaps + 1], order[swaps]
+            rowOrder = np.concatenate(
+                (
+                    (order[:, None] * 100 + np.arange(100)).ravel(),
+                    np.arange(blockCount * 100, rows),
+                )
+            )
+            tsNs = tsNs[rowOrder]
+    elif kind not in SERIES_KINDS:
+        raise ValueError(
+            'Unknown series kind "'
+            + str(kind)
+            + '". Use one of '
+            + ", ".join(SERIES_KINDS)
+        )
+    vals = np.cumsum(rng.normal(0.0, 1.0, rows))
+    return pd.DataFrame(
+        {"val": vals},
+        index=pd.DatetimeIndex(tsNs.view("datetime64[ns]"), name="ts"),
+    )
+
+
+def _quietly(func, *args, **kwargs):
+    """
+    Run func without printing its warnings (like irregular timestamps),
+    which would be timed along with it.
+    """
+    with redirect_stdout(io.StringIO()):
+        return func(*args, **kwargs)
+
+
+def _newData(srcDf, **kwargs):
+    """
+    Return a TsIdxData built from srcDf.
+    """
+    return TsIdxData("bench", "ts", "val", srcDf, **kwargs)
+
+
+def _benchOps(srcDf, period):
+    """
+    Return a dictionary of the operations to time on srcDf. Each is a tuple of
+    a setup function, which is not timed and returns the arguments, and the
+    function to time.
+    """
+    rows = len(srcDf.index)
+    tsIndex = srcDf.index.sort_values()
+    periodTd = pd.Timedelta(period)
+    midTs = tsIndex[rows // 2]
+    quarterTs = tsIndex[rows // 4]
+    tailRows = max(rows // 10, 1)
+
+    def _newerChunk():
+        # rows after the end of the series
+        chunk = makeSeries(tailRows, "regular", period, seed=1)
+        chunk.index = chunk.index + (tsIndex[-1] - SERIES_START) + periodTd
+        return chunk
+
+    def _overlapChunk():
+        # rows in the middle of the series, half on existing timestamps
+        chunk = makeSeries(tailRows, "regular", period, seed=2)
+        chunk.index = chunk.index + (midTs - SERIES_START) + periodTd / 2
+        chunk.index = chunk.index.floor(periodTd).where(
+            np.arange(tailRows) % 2 == 0, chunk.index
+        )
+        chunk.index.name = "ts"
+        return chunk
+
+    def _textFrame():
+        return pd.DataFrame(
+            {
+                "ts": srcDf.index.strftime("%m/%d/%Y %H:%M:%S.%f"),
+                "val": srcDf["val"].to_numpy(),
+            }
+        )
+
+    return {
+        # massage (sort, de-duplicate, convert) and filter the source data
+        "ctor": (lambda: (srcDf,), lambda df: _newData(df)),
+        # the same, with text timestamps to parse
+        "ctorText": (lambda: (_textFrame(),), lambda df: _newData(df)),
+        # the same, with value and time queries to filter on
+        "ctorQuery": (
+            lambda: (srcDf,),
+            lambda df: _newData(
+                df, valueQuery="val > 0", startQuery=quarterTs, endQuery=midTs
+            ),
+        ),
+        "appendNewer": (
+            lambda: (_quietly(_newData, srcDf), _newerChunk()),
+            lambda obj, chunk: obj.appendData(chunk, IgnoreFirstRows=0),
+        ),
+        "appendOverlap": (
+            lambda: (_quietly(_newData, srcDf), _overlapChunk()),
+            lambda obj, chunk: obj.appendData(chunk, IgnoreFirstRows=0),
+        ),
+        "filter": (
+            lambda: (_quietly(_newData, srcDf),),
+            lambda obj: obj.filter("val > 0 and val < 50", quarterTs, midTs),
+        ),
+        "resampleDown": (
+            lambda: (_quietly(_newData, srcDf),),
+            lambda obj: obj.resample(periodTd * 60, "vixms"),
+        ),
+        # upsampling makes 4 times the rows
+        "resampleUp": (
+            lambda: (_quietly(_newData, srcDf),),
+            lambda obj: obj.resample(periodTd / 4, ""),
+        ),
+    }
+
+
+def checkIsolation(rows=1000):
+    """
+    Check that TsIdxData data and snapshots do not share arrays with the
+    caller's data, which changes in pandas copy and view rules could break.
+    In lazy mode, the data is not loaded or appended until it is used, so
+    this also checks the plan does not hold the caller's data.
+    Returns a list of the problems found (empty if there are none).
+    """
+    problems = []
+    modes = [("", {}), ("compact ", {"compact": True}), ("lazy ", {"lazy": True})]
+    for label, kwargs in modes:
+        lazy = kwargs.get("lazy", False)
+        srcDf = makeSeries(rows, "regular")
+        # Quarters are exact as float32, so compact data holds the same values
+        srcDf["val"] = np.round(srcDf["val"] * 4.0) / 4.0
+        firstVal = srcDf.iloc[0, 0]
+        tsData = _quietly(_newData, srcDf, **kwargs)
+        # A lazy snapshot does not run the plan, so it is taken after the data
+        # is read.
+        snap = None if lazy else tsData.snapshot()
+        # Changing the caller's data, before or after the data is read, is
+        # not seen by the data or the snapshot, and is allowed.
+        srcDf.iloc[0, 0] = firstVal + 1000.0
+        dfData = _quietly(lambda: tsData.data)
+        if snap is None:
+            snap = tsData.snapshot()
+        try:
+            srcDf.iloc[1, 0] = firstVal + 1000.0
+        except ValueError:
+            problems.append(label + "data made the caller's data read only")
+        if dfData.iloc[0, 0] != firstVal or dfData.iloc[1, 0] == firstVal + 1000.0:
+            problems.append(label + "data changed with the caller's data")
+        if (
+            snap.data.iloc[0, 0] != firstVal
+            or snap.data.iloc[1, 0] == firstVal + 1000.0
+        ):
+            problems.append(label + "snapshot changed with the caller's data")
+        try:
+            # the same value, so the data type does not change
+            dfData.iloc[0, 0] = dfData.iloc[0, 0]
+            problems.append(label + "data is not read only")
+        except ValueError:
+            pass
+        # Appending publishes a new snapshot, and does not change the old one.
+        # Changing the appended data before it is used is not seen.
+        chunk = makeSeries(10, "regular", seed=1)
+        chunk.index = chunk.index + (srcDf.index[-1] - SERIES_START) * 2
+        chunk["val"] = np.round(chunk["val"] * 4.0) / 4.0
+        chunkVal = chunk.iloc[0, 0]
+        _quietly(tsData.appendData, chunk, IgnoreFirstRows=0)
+        chunk.iloc[0, 0] = chunkVal + 1000.0
+        dfData = _quietly(lambda: tsData.data)
+        if snap.count != rows or tsData.snapshot().count != rows + 10:
+            problems.append(label + "snapshot changed with an append")
+        if dfData.iloc[rows, 0] != chunkVal:
+            problems.append(label + "data changed with the caller's appended data")
+    return problems
+
+
+def checkIngestMemory(rows=100000, maxRatio=3.8):
+    """
+    Check the peak memory of building a TsIdxData from each kind of series
+    is at most maxRatio times the size of the source data. Conditioning the
+    data copies the values once (see TsIdxData.__massageData). Checking the
+    sample period, and for duplicated data the sort order and the positions
+    of the rows kept, make up the rest of the peak. A larger peak means an
+    extra copy. tests/test_bpsTsIdxMemory.py checks each operation with
+    tighter limits. Returns a list of the problems found (empty if there are
+    none).
+    """
+    problems = []
+    for kind in SERIES_KINDS:
+        srcDf = makeSeries(rows, kind)
+        srcBytes = srcDf.memory_usage(index=True, deep=True).sum()
+        gc.collect()
+        tracemalloc.start()
+        tsData = _quietly(_newData, srcDf)
+        peakBytes = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        del tsData
+        if peakBytes > maxRatio * srcBytes:
+            problems.append(
+                "building from {} data peaked at {:.1f} times the source size \
+(at most {:.1f} expected)".format(
+                    kind, peakBytes / srcBytes, maxRatio
+                )
+            )
+    return problems
+
+
+def runBench(sizes, kinds, ops, repeat=3, period="1S", memory=True, verbose=False):
+    """
+    Time each operation in ops on each kind of series at each size. Returns a
+    dictionary of results keyed by "op|kind|rows", each with the best time
+    of repeat runs (sec), the throughput (rowsPerSec, the series rows over
+    the best time), and the peak memory allocated during one more run, done
+    first (peakMB, measured with tracemalloc, which numpy and pandas report
+    to).
+    """
+    results = {}
+    for rows in sizes:
+        for kind in kinds:
+            srcDf = makeSeries(rows, kind, period)
+            benchOps = _benchOps(srcDf, period)
+            for op in ops:
+                setup, func = benchOps[op]
+                # The memory run is first, so it also warms up (imports,
+                # caches) before the timed runs.
+                peakMB = None
+                if memory:
+                    args = setup()
+                    gc.collect()
+                    tracemalloc.start()
+                    _quietly(func, *args)
+                    peakMB = tracemalloc.get_traced_memory()[1] / 2**20
+                    tracemalloc.stop()
+                    del args
+                times = []
+                for run in range(repeat):
+                    args = setup()
+                    gc.collect()
+                    startTime = time.perf_counter()
+                    _quietly(func, *args)
+                    times.append(time.perf_counter() - startTime)
+                    del args
+                bestSec = min(times)
+                key = op + "|" + kind + "|" + str(rows)
+                results[key] = {
+                    "sec": bestSec,
+                    "rowsPerSec": rows / bestSec if bestSec > 0 else None,
+                    "peakMB": peakMB,
+                }
+                if verbose:
+                    print(_resultLine(key, results[key]))
+            del srcDf, benchOps
+    return results
+
+
+def compareResults(results, baseline, tolerance=0.2, minSec=0.005):
+    """
+    Return a list of (key, measure, baseline value, new value) for each result
+    which is worse than the baseline result with the same key by more than
+    tolerance (0.2 is 20%). Time (sec) and peak memory (peakMB) are compared.
+    Times must also be worse by more than minSec seconds, as very short
+    times are noisy. Results which are not in the baseline are skipped.
+    """
+    regressions = []
+    for key, result in results.items():
+        baseResult = baseline.get(key)
+        if baseResult is None:
+            continue
+        for measure in ("sec", "peakMB"):
+            newVal = result.get(measure)
+            baseVal = baseResult.get(measure)
+            if newVal is None or baseVal is None:
+                continue
+            if measure == "sec" and newVal - baseVal <= minSec:
+                continue
+            if newVal > baseVal * (1.0 + tolerance):
+                regressions.append((key, measure, baseVal, newVal))
+    return regressions
+
+
+def _resultLine(key, result):
+    """
+    Return a result formatted as one line of the results table.
+    """
+    op, kind, rows = key.split("|")
+    return "    {:14} {:11} {:>10} {:>10.4f} s {:>14} rows/s {:>10} MB".format(
+        op,
+        kind,
+        rows,
+        result["sec"],
+        "{:,.0f}".format(result["rowsPerSec"]) if result["rowsPerSec"] else "-",
+        "{:.1f}".format(result["peakMB"]) if result["peakMB"] is not None else "-",
+    )
+
+
+def intRows(rowsArg):
+    """
+    Return a list of row counts from a comma separated string like
+    "1e4,1e5,1e6".
+    """
+    try:
+        sizes = [int(float(size)) for size in str(rowsArg).split(",") if size]
+    except ValueError:
+        sizes = []
+    if not sizes or min(sizes) < 10:
+        msg = "The --sizes argument, value %r, is not a list of sizes >= 10" % rowsArg
+        raise argparse.ArgumentTypeError(msg)
+    return sizes
+
+
+def listChoices(choices):
+    """
+    Return a function which converts a comma separated string into a list,
+    checking each item is one of choices.
+    """
+
+    def _toList(listArg):
+        items = [item for item in str(listArg).split(",") if item]
+        bad = [item for item in items if item not in choices]
+        if not items or bad:
+            msg = "%r is not a list of: %s" % (listArg, ", ".join(choices))
+            raise argparse.ArgumentTypeError(msg)
+        return items
+
+    return _toList
+
+
+# Main function to execute when script is run
+def main():
+    """Benchmark TsIdxData operations.
+
+    Synthetic regular, jittered, duplicated, and gappy series are made at each
+    size, and the build (ctor), append, filter, and resample operations are
+    timed on them. The best time of several runs, the throughput (rows/s),
+    and the peak memory are reported.
+
+    Use -o to save the results as json, and -b to compare with saved results.
+    Results more than the tolerance worse than the baseline are flagged, and
+    the exit status is 1.
+    """
+    # Description string will show up in help.
+    DESC_STR = main.__doc__
+    # The epilogue will show up at the bottom of the help
+    EPL_STR = """Example: python bpsTsIdxBench.py --sizes 1e4,1e5,1e6 -o base.json
+Then, after a change: python bpsTsIdxBench.py --sizes 1e4,1e5,1e6 -b base.json
+Large sizes (1e7, 1e8) need a lot of memory and time. Use --ops and --kinds
+to limit what is run."""
+
+    # **** argument parsing
+    # define the arguments
+    parser = argparse.ArgumentParser(
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        description=DESC_STR,
+        epilog=EPL_STR,
+    )
+    parser.add_argument(
+        "--sizes",
+        default=[10000, 100000, 1000000],
+        type=intRows,
+        metavar="",
+        help="Comma separated series sizes (rows). Default is 1e4,1e5,1e6.",
+    )
+    parser.add_argument(
+        "--kinds",
+        default=list(SERIES_KINDS),
+        type=listChoices(SERIES_KINDS),
+        metavar="",
+        help="Comma separated series kinds. Default is all: "
+        + ", ".join(SERIES_KINDS)
+        + ".",
+    )
+    parser.add_argument(
+        "--ops",
+        default=list(BENCH_OPS),
+        type=listChoices(BENCH_OPS),
+        metavar="",
+        help="Comma separated operations. Default is all: "
+        + ", ".join(BENCH_OPS)
+        + ".",
+    )
+    parser.add_argument(
+        "-r",
+        "--repeat",
+        default=3,
+        type=int,
+        metavar="",
+        help="Number of timed runs of each operation. The best is kept. Default is 3.",
+    )
+    parser.add_argument(
+        "-o",
+        "--outFile",
+        default=None,
+        metavar="",
+        help="Save the results to this json file.",
+    )
+    parser.add_argument(
+        "-b",
+        "--baseline",
+        default=None,
+        metavar="",
+        help="Compare the results with this json file, saved using -o.",
+    )
+    parser.add_argument(
+        "-t",
+        "--tolerance",
+        default=0.2,
+        type=float,
+        metavar="",
+        help="How much worse than the baseline is a regression. Default is 0.2 (20%%).",
+    )
+    parser.add_argument(
+        "--minSec",
+        default=0.005,
+        type=float,
+        metavar="",
+        help="Times must also be worse than the baseline by more than this many \
+seconds to be a regression, as very short times are noisy. Default is 0.005.",
+    )
+    parser.add_argument(
+        "--noMemory",
+        action="store_true",
+        default=False,
+        help="Do not measure the peak memory, which takes one more run of each \
+operation.",
+    )
+    parser.add_argument(
+        "-v",
+        "--verbose",
+        action="store_true",
+        default=False,
+        help="Verbose output, prints each result as it is measured.",
+    )
+    # parse the arguments
+    args = parser.parse_args()
+
+    # Put the begin mark here, after the arg parsing, so argument problems are
+    # reported first.
+    print("**** Begin Processing ****")
+    # get start processing time
+    procStart = datetime.now()
+    print("    Process start time: " + procStart.strftime("%m/%d/%Y %H:%M:%S"))
+
+    # Read the baseline first, so a bad file is found before the long part
+    baseline = None
+    if args.baseline is not None:
+        try:
+            with open(args.baseline, "r") as baseFile:
+                baseline = json.load(baseFile)["results"]
+        except (OSError, ValueError, KeyError) as e:
+            print(
+                "\nERROR: The baseline file: "
+                + args.baseline
+                + " could not be read. Exiting."
+            )
+            print(e)
+            sys.exit(2)
+
+    # Quick checks of the data the timed operations rely on, and of the
+    # memory used to condition it
+    problems = checkIsolation() + checkIngestMemory()
+    for problem in problems:
+        print("    CHECK FAILED: " + problem)
+
+    results = runBench(
+        args.sizes,
+        args.kinds,
+        args.ops,
+        repeat=max(args.repeat, 1),
+        memory=not args.noMemory,
+        verbose=args.verbose,
+    )
+
+    print("\nResults (best of " + str(max(args.repeat, 1)) + " runs):")
+    for key, result in results.items():
+        print(_resultLine(key, result))
+
+    if args.outFile is not None:
+        with open(args.outFile, "w") as outFile:
+            json.dump(
+                {
+                    "meta": {
+                        "date": procStart.isoformat(),
+                        "python": platform.python_version(),
+                        "pandas": pd.__version__,
+                        "numpy": np.__version__,
+                        "machine": platform.machine(),
+                        "repeat": max(args.repeat, 1),
+                    },
+                    "results": results,
+                },
+                outFile,
+                indent=1,
+            )
+        print("\n    Results saved to " + args.outFile)
+
+    regressions = []
+    if baseline is not None:
+        regressions = compareResults(results, baseline, args.tolerance, args.minSec)
+        print(
+            "\nCompared with "
+            + args.baseline
+            + " (tolerance {:.0%}):".format(args.tolerance)
+        )
+        if not regressions:
+            print("    No regressions.")
+        for key, measure, baseVal, newVal in regressions:
+            print(
+                "    REGRESSION: {} {}: {:.4g} -> {:.4g} ({:+.0%})".format(
+                    key.replace("|", " "),
+                    measure,
+                    baseVal,
+                    newVal,
+                    newVal / baseVal - 1.0,
+                )
+            )
+
+    # get end  processing time
+    procEnd = datetime.now()
+    print("\n**** End Processing ****")
+    print("    Process end time: " + procEnd.strftime("%m/%d/%Y %H:%M:%S"))
+    print("    Duration: " + str(procEnd - procStart) + "\n")
+    if regressions or problems:
+        sys.exit(1)
+
+
+# Tell python to run main if this program is executed directly (i.e. not imported)
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,427 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# bpsTsIdxCollection.py
+#
+# imports
+#
+# numerical manipulation libraries
+import numpy as np
+import pandas as pd
+from pandas.tseries.frequencies import to_offset
+
+# Local application and user library imports
+# TimeStamped Indexed Data Class
+from bpsTsIdxData import (
+    TsIdxData,
+    _compileValueQuery,
+    _toQueryTs,
+    _readOnlyView,
+    _statFlags,
+    _timeWeightedFlags,
+    _downsampleStats,
+    _interpolateColumns,
+    _INTERPOLATE_MODES,
+)
+
+
+class TsIdxCollection(object):
+    """
+    Class: TsIdxCollection
+    File: bpsTsIdxCollection.py
+
+    Collection of Timestamped Indexed Data
+
+    This holds many tags (TsIdxData objects) together. Tags with the same
+    time offset (sampling period) share one time index, and their values are
+    held as the columns of one dataframe. This way the index is stored once
+    per sampling period rather than once per tag, and operations are done
+    on all the tags with the same period in one vectorized step.
+
+    A name to column lookup is kept so the data for a tag can be found
+    quickly.
+
+    The constructor (ctor) has these arguments:
+      name -- The name to give the collection.
+
+      tags -- Optional list of TsIdxData objects to add. See addTags().
+
+    Methods
+        addTag(tsIdxData)
+            Add the value column of a TsIdxData object, using the object name as
+            the tag name. A tag with the same name is replaced.
+
+        addTags(tsIdxDataList)
+            Add the value columns of many TsIdxData objects. Each group of
+            tags with the same time offset is built once.
+
+        getTag(tag)
+            Return a TsIdxData object with the data of a tag.
+
+        resample(resampleArg, stats, verbose, interpolate)
+            Resample all the tags at once. The arguments are the same as
+            TsIdxData.resample(), and so are the results for each tag. After
+            resampling, all tags share one index.
+
+        filter(valueQuery=None, startQuery=None, endQuery=None)
+            Filter all the tags at once. The arguments work the same as the
+            TsIdxData ctor arguments. Filtered out values become NaN, as the
+            index is shared.
+
+        toCsv(path)
+            Write all the tags to one csv file, aligned on time.
+
+    The following read only properties are implemented
+        name
+            string -- collection name
+
+        tags
+            list of the tag names
+
+        columns
+            dictionary with tag names as the key, and a list of column names
+            holding the tag data as the value {tag : [col name, ...], ...}
+
+        timeOffsets
+            list of the time offsets (sampling periods) of the shared indexes
+
+        data
+            a read only dataframe with all the tags aligned on time (see
+            TsIdxData.data)
+
+        count
+            the number of tags
+    """
+
+    def __init__(self, name, tags=None):
+        """
+        TsIdxCollection constructor (ctor). Details are in above class
+        description.
+        """
+        self._name = str(name)
+        # One dataframe per time offset. The offset freqstr is the key.
+        self._groups = {}
+        # tag name -> (group key, [column names])
+        self._lookup = {}
+        if tags is not None:
+            self.addTags(tags)
+
+    def __repr__(self):
+        outputMsg = "{:13} {}".format("\nName: ", self._name + "\n")
+        outputMsg += "{:13} {}".format("Tags: ", str(self.count) + "\n")
+        for groupKey, dfGroup in self._groups.items():
+            outputMsg += "{:13} {:10} {:8} {}".format(
+                "Period: ",
+                groupKey,
+                len(dfGroup.index),
+                "rows, tags: "
+                + ", ".join(
+                    [
+                        tag
+                        for tag, (tagGroup, cols) in self._lookup.items()
+                        if tagGroup == groupKey
+                    ]
+                )
+                + "\n",
+            )
+        return outputMsg
+
+    def addTag(self, tsIdxData):
+        """
+        Add the value column of a TsIdxData object to the collection, using the
+        object name as the tag name. The tag is aligned with the other tags that
+        have the same time offset. If a tag with the same name is already in the
+        collection, it is replaced. To add many tags, use addTags().
+        """
+        self.addTags([tsIdxData])
+        return
+
+    def addTags(self, tsIdxDataList):
+        """
+        Add the value columns of many TsIdxData objects, the same as calling
+        addTag() for each. The tags are sorted into groups by time offset
+        first, and then each group is built once, with one concat aligning
+        all of its columns on the union of their timestamps, rather than
+        aligning the group again for each tag. If a tag name is repeated, the
+        last one is used.
+        """
+        # group key -> {tag : value column}, and tag -> group key in the
+        # order added
+        newCols = {}
+        newTags = {}
+        for tsIdxData in tsIdxDataList:
+            tag = tsIdxData.name
+            if tag in self._lookup:
+                self.removeTag(tag)
+            if tag in newTags:
+                del newCols[newTags.pop(tag)][tag]
+
+            if isinstance(tsIdxData.timeOffset, pd.DateOffset):
+                groupKey = tsIdxData.timeOffset.freqstr
+            else:
+                # no data, so no offset
+                groupKey = "None"
+
+            dfTag = tsIdxData.data
+            if tsIdxData.yName in dfTag.columns:
+                tagCol = dfTag[tsIdxData.yName]
+            else:
+                tagCol = dfTag.iloc[:, 0]
+            newCols.setdefault(groupKey, {})[tag] = tagCol.astype(
+                "float64", copy=False
+            ).rename(tag)
+            newTags[tag] = groupKey
+
+        for groupKey, groupCols in newCols.items():
+            if not groupCols:
+                continue
+            colList = list(groupCols.values())
+            if groupKey in self._groups:
+                colList.insert(0, self._groups[groupKey])
+            if len(colList) == 1:
+                dfGroup = colList[0].to_frame()
+            else:
+                # Align on the union of the timestamps
+                dfGroup = pd.concat(colList, axis=1, sort=True)
+            self._groups[groupKey] = dfGroup
+        for tag, groupKey in newTags.items():
+            self._lookup[tag] = (groupKey, [tag])
+        return
+
+    def removeTag(self, tag):
+        """
+        Remove a tag from the collection.
+        """
+        groupKey, cols = self._lookup.pop(tag)
+        dfGroup = self._groups[groupKey].drop(columns=cols)
+        if len(dfGroup.columns) == 0:
+            del self._groups[groupKey]
+        else:
+            self._groups[groupKey] = dfGroup
+        return
+
+    def getTag(self, tag):
+        """
+        Return a TsIdxData object with the data of a tag. Rows where the tag
+        has no data (because the index is shared) are not included.
+        """
+        groupKey, cols = self._lookup[tag]
+        dfTag = self._groups[groupKey][cols].dropna(how="all")
+        return TsIdxData(
+            tag,
+            tsName=dfTag.index.name,
+            yName=cols[0],
+            df=dfTag,
+            forceColNames=True,
+        )
+
+    def resample(self, resampleArg="S", stats="m", verbose=False, interpolate="step"):
+        """
+        Resample all the tags to the specified time offset. The arguments are
+        the same as TsIdxData.resample(), and each tag gets the values
+        TsIdxData.resample() would give it. Like TsIdxData, only the first
+        column of a tag is resampled, and rows where a tag has no data
+        (because the index is shared) are not used for it. The values of the
+        tags sharing an index are one 2-D block, and all of them are
+        resampled in one vectorized step: binned once and reduced together
+        when downsampling (see _downsampleStats), or interpolated together
+        when upsampling (see _interpolateColumns). Only the time weighted
+        stats are found one tag at a time, as each tag has its own sample
+        times. The columns are named the same as TsIdxData.resample() names
+        them (tag, min_tag, max_tag, mean_tag, std_tag, twmean_tag, twstd_tag,
+        total_tag). After resampling, all tags share one index.
+        """
+        try:
+            resampleTo = to_offset(resampleArg if resampleArg is not None else "S")
+        except ValueError as ve:
+            print(
+                "    WARNING: "
+                + self._name
+                + ": Invalid resample period specified. Using 1 second."
+            )
+            print(ve)
+            resampleTo = to_offset("S")
+        interpolate = str(interpolate).lower()
+        if interpolate not in _INTERPOLATE_MODES:
+            print(
+                '    WARNING: Unknown interpolate mode "'
+                + interpolate
+                + '". Use one of '
+                + ", ".join(_INTERPOLATE_MODES)
+                + '. Using "step".'
+            )
+            interpolate = "step"
+
+        # stat flags, the same as TsIdxData.resample()
+        stats, statFlags = _statFlags(stats)
+        twFlags = _timeWeightedFlags(stats)
+
+        dfResampled = []
+        newLookup = {}
+        for groupKey, dfGroup in self._groups.items():
+            groupTags = [
+                tag
+                for tag, (tagGroup, cols) in self._lookup.items()
+                if tagGroup == groupKey
+            ]
+            # Tags with no offset are kept as they are. A group emptied by a
+            # filter is still resampled, so its tags are kept, as all NaN
+            # columns on the new index.
+            if groupKey == "None":
+                continue
+            groupOffset = to_offset(groupKey)
+            groupTsNs = dfGroup.index.asi8
+            # The first column of each tag, as one block of values
+            valCols = [self._lookup[tag][1][0] for tag in groupTags]
+            valBlock = dfGroup[valCols].to_numpy(dtype="float64")
+
+            if resampleTo < groupOffset:
+                # upsample every tag at once, on one grid
+                newIndex = dfGroup.iloc[:, 0].resample(resampleTo).asfreq().index
+                newBlock = _interpolateColumns(
+                    groupTsNs, valBlock, newIndex.asi8, interpolate
+                )
+                newCols = {
+                    valCol: newBlock[:, colNum] for colNum, valCol in enumerate(valCols)
+                }
+                for tag, valCol in zip(groupTags, valCols):
+                    newLookup[tag] = [valCol]
+                action = ": Upsampled "
+            elif resampleTo > groupOffset:
+                # downsample every tag at once, in one binning pass
+                newIndex = (
+                    dfGroup.iloc[:, 0]
+                    .resample(resampleTo, label="right", closed="right")
+                    .size()
+                    .index
+                )
+                statCols = _downsampleStats(
+                    groupTsNs,
+                    valBlock,
+                    newIndex,
+                    resampleTo,
+                    statFlags,
+                    twFlags,
+                    interpolate,
+                )
+                # columns ordered by tag, then by stat
+                newCols = {}
+                for colNum, (tag, valCol) in enumerate(zip(groupTags, valCols)):
+                    tagCols = []
+                    for prefix, statCol in statCols.items():
+                        colName = valCol if prefix == "" else prefix + tag
+                        newCols[colName] = statCol[:, colNum]
+                        tagCols.append(colName)
+                    newLookup[tag] = tagCols
+                action = ": Downsampled "
+            else:
+                for tag in groupTags:
+                    newLookup[tag] = self._lookup[tag][1]
+                dfResampled.append(dfGroup)
+                continue
+
+            dfNew = pd.DataFrame(newCols, index=newIndex, dtype="float64")
+            dfNew.index.name = dfGroup.index.name
+            dfResampled.append(dfNew)
+            if verbose:
+                print(
+                    "    "
+                    + self._name
+                    + action
+                    + str(len(groupTags))
+                    + " tags from "
+                    + str(groupOffset)
+                    + " to "
+                    + str(resampleTo)
+                )
+
+        if not dfResampled:
+            return
+        # Everything now has the same offset, so it shares one index.
+        dfAll = (
+            pd.concat(dfResampled, axis=1) if len(dfResampled) > 1 else dfResampled[0]
+        )
+        groupKey = resampleTo.freqstr
+        emptyGroup = self._groups.get("None")
+        self._groups = {groupKey: dfAll}
+        self._lookup = {tag: (groupKey, cols) for tag, cols in newLookup.items()}
+        if emptyGroup is not None:
+            self._groups["None"] = emptyGroup
+            for col in emptyGroup.columns:
+                self._lookup[col] = ("None", [col])
+        return
+
+    def filter(self, valueQuery=None, startQuery=None, endQuery=None):
+        """
+        Filter all the tags at once. valueQuery, startQuery, and endQuery work
+        the same as the TsIdxData ctor arguments. Rows outside the start/end
+        times are removed. Values that do not pass the value query become NaN,
+        since the index is shared with other tags.
+        """
+        # Convert the start and end times the same way as TsIdxData.
+        startTs = _toQueryTs(startQuery)
+        endTs = _toQueryTs(endQuery, isEnd=True)
+
+        valueMask = None
+        if valueQuery is not None and str(valueQuery) != "":
+            valueMask = _compileValueQuery(str(valueQuery).lower())
+            if valueMask is None:
+                print(
+                    "    WARNING: "
+                    + self._name
+                    + ": Value query could not be compiled. Only simple \
+comparisons, between, and, or, and not can be used for a collection. Ignoring it."
+                )
+
+        for groupKey, dfGroup in self._groups.items():
+            dfGroup = dfGroup.loc[startTs:endTs]
+            if valueMask is not None and not dfGroup.empty:
+                # one vectorized pass over all the tag values
+                vals = dfGroup.to_numpy(dtype="float64")
+                dfGroup = pd.DataFrame(
+                    np.where(valueMask(vals), vals, np.nan),
+                    index=dfGroup.index,
+                    columns=dfGroup.columns,
+                )
+            self._groups[groupKey] = dfGroup
+        return
+
+    def toCsv(self, path, **toCsvArgs):
+        """
+        Write all the tags to one csv file, aligned on time. Additional keyword
+        arguments are passed to DataFrame.to_csv.
+        """
+        self.data.to_csv(path, **toCsvArgs)
+        return
+
+    # read only properties
+    @property
+    def name(self):
+        return self._name
+
+    @property
+    def tags(self):
+        return list(self._lookup.keys())
+
+    @property
+    def columns(self):
+        return {tag: list(cols) for tag, (groupKey, cols) in self._lookup.items()}
+
+    @property
+    def timeOffsets(self):
+        return [to_offset(groupKey) for groupKey in self._groups if groupKey != "None"]
+
+    @property
+    def data(self):
+        if not self._groups:
+            return pd.DataFrame()
+        if len(self._groups) == 1:
+            # read only, as it shares the data of the collection
+            return _readOnlyView(next(iter(self._groups.values())))
+        return _readOnlyView(
+            pd.concat(list(self._groups.values()), axis=1).sort_index()
+        )
+
+    @property
+    def count(self):
+        return len(self._lookup)
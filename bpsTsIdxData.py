@@ -6,9 +6,17 @@
 #
 # system related
 # import sys
+from collections import OrderedDict, deque
+
 # date and time stuff
 from datetime import datetime, time
 
+# saving settings with the data
+import json
+
+# compiling value queries
+import re
+
 # numerical manipulation libraries
 import numpy as np
 import pandas as pd
@@ -16,6 +24,1136 @@ from dateutil import parser as duparser
 from pandas.tseries.frequencies import to_offset
 
 
+def _readOnlyView(srcDf):
+    """
+    Return a dataframe with the same index and columns as srcDf, which shares
+    its data, with read only views of the column arrays. Writing values in
+    place raises an error rather than changing the shared data. Setting or
+    adding a column only changes the returned dataframe. Only the views are
+    read only, so srcDf (and anything else sharing its arrays) can still be
+    written. Columns with a pandas extension type (like categoricals) cannot
+    be made read only, so they are copied.
+    """
+    viewCols = {}
+    for colNum in range(len(srcDf.columns)):
+        colData = srcDf.iloc[:, colNum]
+        if isinstance(colData.dtype, np.dtype):
+            values = colData.to_numpy().view()
+            values.setflags(write=False)
+        else:
+            values = colData.array.copy()
+        viewCols[colNum] = values
+    # Built from the arrays without a copy, and keyed by position, so
+    # duplicate column names are kept.
+    dfView = pd.DataFrame(viewCols, index=srcDf.index, copy=False)
+    dfView.columns = srcDf.columns
+    return dfView
+
+
+def _importPyarrow():
+    """
+    Import and return the pyarrow and pyarrow.parquet modules. They are only
+    needed to save and load data, so they are not required to use TsIdxData.
+    """
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError as ie:
+        print(
+            "    ERROR: The pyarrow library is needed to save or load TsIdxData \
+data. Install it, for example with: pip install pyarrow"
+        )
+        raise ie
+    return pa, pq
+
+
+# Round units the estimated sample period is snapped to, largest first (see
+# estimateFrequency). Day, hour, minute, second, 100 ms, 10 ms, and ms.
+_ROUND_PERIODS_NS = [
+    86400 * 10**9,
+    3600 * 10**9,
+    60 * 10**9,
+    10**9,
+    10**8,
+    10**7,
+    10**6,
+]
+
+
+def estimateFrequency(tsIndex, sampleSize=100000, tolerance=0.1, minConfidence=0.8):
+    """
+    Estimate the sample period of a sorted datetime index. Return a dictionary:
+        period -- Timedelta of the dominant period between samples
+        confidence -- fraction (0 to 1) of the periods within tolerance of the
+                      dominant period
+        jitter -- Timedelta standard deviation of those periods
+        irregular -- True if confidence is less than minConfidence
+
+    The periods between consecutive timestamps are found in one vectorized
+    pass. For long indexes, only sampleSize randomly chosen periods are used,
+    so the cost stays bounded. The dominant period starts as the most common
+    period (the mode of a histogram of the periods), which is not thrown off
+    by a few glitches or by two groups of periods. The histogram bins are a
+    fixed fraction of the period wide, so jittered periods fall in the same
+    few bins at any period. It is refined to the median of the periods within
+    tolerance (a fraction of the period) of it, and then snapped to the
+    largest round unit (day, hour, minute, second, 100 ms, 10 ms, or ms) it is
+    a whole number of, within the jitter of the periods. So 1 sec data with a
+    lot of jitter gives 1 sec, and 1.05 sec data gives 1.05 sec.
+    """
+    tsNs = pd.DatetimeIndex(tsIndex).asi8
+    result = {
+        "period": pd.NaT,
+        "confidence": 0.0,
+        "jitter": pd.NaT,
+        "irregular": True,
+    }
+    if len(tsNs) < 2:
+        return result
+
+    if len(tsNs) - 1 > sampleSize:
+        # Sample periods at random positions. Fixed seed so the estimate is
+        # repeatable.
+        positions = np.random.default_rng(0).integers(0, len(tsNs) - 1, sampleSize)
+        periods = tsNs[positions + 1] - tsNs[positions]
+    else:
+        periods = np.diff(tsNs)
+
+    # Histogram of the periods, with bins tolerance / 2 of the period wide
+    # (equal widths on a log scale). Periods of 0 (repeated timestamps) fall
+    # in the bin of 1 ns. The most common bin is the mode. On a tie, the
+    # shortest period is used, and taken as the middle of its bin. The bin
+    # numbers are found in place, in one array.
+    binWidth = np.log1p(tolerance / 2)
+    binNums = np.maximum(periods, 1, dtype="float64")
+    np.log(binNums, out=binNums)
+    np.floor(binNums / binWidth, out=binNums)
+    bins, binCounts = np.unique(binNums, return_counts=True)
+    del binNums
+    mode = np.exp((bins[np.argmax(binCounts)] + 0.5) * binWidth)
+
+    # The mode is only known to within a bin. It is moved to the median of
+    # the periods within half the mode of it, which holds jittered periods,
+    # but not skipped or doubled ones. If no period is within tolerance of the
+    # median (two groups of periods close together), the middle of the bin is
+    # kept. Every period in the bin is within tolerance of it, so periodsIn is
+    # never empty.
+    inCluster = np.abs(periods - mode) <= max(abs(mode) / 2, 1000000)
+    for center in (np.median(periods[inCluster], overwrite_input=True), mode):
+        inTolerance = np.abs(periods - center) <= max(tolerance * center, 1000000)
+        if inTolerance.any():
+            mode = center
+            break
+    periodsIn = periods[inTolerance]
+
+    # Snap to the largest round unit that is within the jitter of the periods
+    # (their standard deviation, at most half the tolerance) of the median.
+    # This is at least 0.5 ms, so ms always fits.
+    snapTolerance = max(min(np.std(periodsIn), tolerance * abs(mode) / 2), 500000)
+    for unitNs in _ROUND_PERIODS_NS:
+        period = np.round(mode / unitNs) * unitNs
+        if period > 0 and abs(mode - period) <= snapTolerance:
+            break
+    result["period"] = pd.Timedelta(int(period), "ns")
+    result["confidence"] = float(np.mean(inTolerance))
+    result["jitter"] = pd.Timedelta(int(np.round(np.std(periodsIn))), "ns")
+    result["irregular"] = result["confidence"] < minConfidence
+    return result
+
+
+def _toQueryTs(queryTs, isEnd=False):
+    """
+    Convert a query time (datetime or string) to a Timestamp the same way the
+    TsIdxData ctor converts startQuery and endQuery. An end time without time
+    information is moved to the end of the day. Return None if queryTs is None.
+    """
+    if queryTs is None:
+        return None
+    if not isinstance(queryTs, datetime):
+        queryTs = duparser.parse(queryTs, fuzzy=True)
+    if isEnd and queryTs.time() == time(0, 0, 0, 0):
+        queryTs = queryTs.replace(hour=23, minute=59, second=59, microsecond=999999)
+    return pd.Timestamp(queryTs)
+
+
+# Tokens understood by _compileValueQuery: numbers, names, comparison
+# operators, symbolic and/or/not, and parentheses.
+_VQ_TOKEN_RE = re.compile(
+    r"\s*(?:(\d+\.?\d*(?:e[+-]?\d+)?|\.\d+(?:e[+-]?\d+)?)|([a-z_]+)|(<=|>=|==|!=|<|>)|([&|~()-]))"
+)
+_VQ_COMPARE = {
+    "<": np.less,
+    "<=": np.less_equal,
+    ">": np.greater,
+    ">=": np.greater_equal,
+    "==": np.equal,
+    "!=": np.not_equal,
+}
+
+
+def _compileValueQuery(queryStr):
+    """
+    Compile a value query string, like "val >= 0 and val <= 100", into a
+    function that takes an array of values and returns a boolean mask of the
+    values to keep. The query is parsed once, and the returned function is a
+    single vectorized pass over the values.
+
+    Understood are "val", numbers, the comparisons <, <=, >, >=, ==, and !=
+    (which can be chained like "0 <= val < 100"), "val between a and b"
+    (inclusive), and, or, not (or &, |, ~), and parentheses.
+
+    Return None if the query uses anything else, so DataFrame.query can be
+    used instead.
+    """
+    # Split the query into tokens. Anything not understood means the query
+    # cannot be compiled.
+    tokens = []
+    pos = 0
+    queryStr = queryStr.strip()
+    while pos < len(queryStr):
+        match = _VQ_TOKEN_RE.match(queryStr, pos)
+        if match is None or match.end() == pos:
+            return None
+        number, word, compare, symbol = match.groups()
+        if number is not None:
+            tokens.append(("num", float(number)))
+        elif word is not None:
+            if word not in ("val", "and", "or", "not", "between"):
+                return None
+            tokens.append((word, word))
+        elif compare is not None:
+            tokens.append(("cmp", compare))
+        else:
+            tokens.append((symbol, symbol))
+        pos = match.end()
+
+    # Recursive descent parser. Each parse function returns a function which
+    # takes the values array and returns a result for it.
+    position = [0]
+
+    def peek():
+        return tokens[position[0]][0] if position[0] < len(tokens) else None
+
+    def take():
+        token = tokens[position[0]]
+        position[0] += 1
+        return token
+
+    def parseOr():
+        terms = [parseAnd()]
+        while peek() in ("or", "|"):
+            take()
+            terms.append(parseAnd())
+        if len(terms) == 1:
+            return terms[0]
+        return lambda vals: np.logical_or.reduce([term(vals) for term in terms])
+
+    def parseAnd():
+        terms = [parseNot()]
+        while peek() in ("and", "&"):
+            take()
+            terms.append(parseNot())
+        if len(terms) == 1:
+            return terms[0]
+        return lambda vals: np.logical_and.reduce([term(vals) for term in terms])
+
+    def parseNot():
+        if peek() in ("not", "~"):
+            take()
+            term = parseNot()
+            return lambda vals: np.logical_not(term(vals))
+        return parseAtom()
+
+    def parseOperand():
+        # val or a (possibly negative) number
+        kind = peek()
+        if kind == "val":
+            take()
+            return lambda vals: vals
+        negate = False
+        if kind == "-":
+            take()
+            negate = True
+            kind = peek()
+        if kind != "num":
+            raise SyntaxError("operand expected")
+        number = -take()[1] if negate else take()[1]
+        return lambda vals: number
+
+    def parseAtom():
+        if peek() == "(":
+            take()
+            term = parseOr()
+            if peek() != ")":
+                raise SyntaxError("missing )")
+            take()
+            return term
+
+        left = parseOperand()
+        if peek() == "between":
+            take()
+            low = parseOperand()
+            if peek() != "and":
+                raise SyntaxError("between needs and")
+            take()
+            high = parseOperand()
+            return lambda vals: np.logical_and(
+                np.greater_equal(left(vals), low(vals)),
+                np.less_equal(left(vals), high(vals)),
+            )
+
+        # one or more (chained) comparisons
+        compares = []
+        operands = [left]
+        while peek() == "cmp":
+            compares.append(_VQ_COMPARE[take()[1]])
+            operands.append(parseOperand())
+        if not compares:
+            raise SyntaxError("comparison expected")
+
+        def compareChain(vals):
+            mask = np.ones(np.shape(vals), dtype=bool)
+            for i, compare in enumerate(compares):
+                mask &= compare(operands[i](vals), operands[i + 1](vals))
+            return mask
+
+        return compareChain
+
+    try:
+        maskFunc = parseOr()
+    except (SyntaxError, IndexError):
+        return None
+    if position[0] != len(tokens):
+        return None
+
+    def valueMask(vals):
+        vals = np.asarray(vals, dtype="float64")
+        # Broadcast in case the query only compares constants
+        return np.broadcast_to(maskFunc(vals), vals.shape)
+
+    return valueMask
+
+
+# Widths of the fixed width strptime directives understood by
+# _parseFixedLayout. %f is handled separately since its width varies.
+_FIXED_LAYOUT_WIDTHS = {"m": 2, "d": 2, "Y": 4, "y": 2, "H": 2, "M": 2, "S": 2}
+
+
+def _parseFixedLayout(tsValues, timeFormat):
+    """
+    Convert an array of timestamp strings which all have the same fixed width
+    layout, like "%m/%d/%Y %H:%M:%S.%f", to int64 nanoseconds since the epoch.
+    The digits are read directly from the string bytes, so the conversion is
+    vectorized and much faster than a general parser.
+
+    Only the %m, %d, %Y, %y, %H, %M, %S, and %f directives and ascii
+    separators are understood. Return None if the format uses anything else,
+    or if any string does not match the layout or is not a valid date and time,
+    so that a general parser can be used instead.
+    """
+    if len(tsValues) == 0:
+        return np.empty(0, dtype="int64")
+    # Only plain ascii strings can be read as bytes
+    if pd.api.types.infer_dtype(tsValues, skipna=False) != "string":
+        return None
+    try:
+        tsBytes = np.asarray(tsValues, dtype="S")
+    except UnicodeEncodeError:
+        return None
+    width = tsBytes.dtype.itemsize
+    if (np.char.str_len(tsBytes) != width).any():
+        return None
+    tsChars = tsBytes.view(np.uint8).reshape(len(tsBytes), width)
+
+    # Walk the format to find the position of each field and separator.
+    # The width of %f is found from the first string.
+    sample = str(tsValues[0])
+    fields = {}
+    separators = []
+    pos = 0
+    i = 0
+    while i < len(timeFormat):
+        if timeFormat[i] == "%":
+            if i + 1 >= len(timeFormat):
+                return None
+            directive = timeFormat[i + 1]
+            i += 2
+            if directive in _FIXED_LAYOUT_WIDTHS:
+                fieldWidth = _FIXED_LAYOUT_WIDTHS[directive]
+            elif directive == "f":
+                if i >= len(timeFormat):
+                    fieldWidth = width - pos
+                elif timeFormat[i] == "%":
+                    return None
+                else:
+                    fieldWidth = sample.find(timeFormat[i], pos) - pos
+                if fieldWidth < 1 or fieldWidth > 9:
+                    return None
+            else:
+                return None
+            fields[directive] = (pos, fieldWidth)
+            pos += fieldWidth
+        else:
+            if ord(timeFormat[i]) > 127:
+                return None
+            separators.append((pos, ord(timeFormat[i])))
+            pos += 1
+            i += 1
+    if pos != width or "m" not in fields or "d" not in fields:
+        return None
+    if "Y" not in fields and "y" not in fields:
+        return None
+
+    # Check the separators, and read the numeric fields.
+    for sepPos, sepChar in separators:
+        if (tsChars[:, sepPos] != sepChar).any():
+            return None
+    values = {}
+    for directive, (fieldPos, fieldWidth) in fields.items():
+        digits = tsChars[:, fieldPos : fieldPos + fieldWidth].astype("int64") - 48
+        if ((digits < 0) | (digits > 9)).any():
+            return None
+        values[directive] = digits @ (10 ** np.arange(fieldWidth - 1, -1, -1))
+
+    if "Y" in values:
+        year = values["Y"]
+    else:
+        # same pivot as strptime: 69-99 are 1900s, 00-68 are 2000s
+        year = np.where(values["y"] < 69, 2000, 1900) + values["y"]
+    month = values["m"]
+    day = values["d"]
+    hour = values.get("H", 0)
+    minute = values.get("M", 0)
+    second = values.get("S", 0)
+
+    # Make sure the values make a valid date and time.
+    if ((month < 1) | (month > 12)).any():
+        return None
+    monthStart = ((year - 1970) * 12 + month - 1).astype("datetime64[M]")
+    daysInMonth = (
+        (monthStart + 1).astype("datetime64[D]") - monthStart.astype("datetime64[D]")
+    ).astype("int64")
+    if ((day < 1) | (day > daysInMonth)).any():
+        return None
+    if (np.asarray(hour) > 23).any() or (np.asarray(minute) > 59).any():
+        return None
+    if (np.asarray(second) > 59).any():
+        return None
+
+    tsNs = (
+        (monthStart.astype("datetime64[D]") + (day - 1))
+        .astype("datetime64[ns]")
+        .astype("int64")
+    )
+    tsNs += ((hour * 60 + minute) * 60 + second) * 1000000000
+    if "f" in values:
+        tsNs += values["f"] * 10 ** (9 - fields["f"][1])
+    return tsNs
+
+
+# Nanoseconds in a day. Pyramid levels, and resample periods answered from
+# the pyramid, must divide a day so the bins line up with the pandas bins.
+_DAY_NS = 86400 * 1000000000
+
+# Columns of the pyramid bin stats arrays
+_PYR_N, _PYR_SUM, _PYR_M2, _PYR_MIN, _PYR_MAX, _PYR_LAST = range(6)
+
+
+def _rawBinStats(tsNs, vals):
+    """
+    Return the timestamps and bin stats arrays of raw samples, treating each
+    sample as a bin of one. NaN values are left out.
+    """
+    isValid = ~np.isnan(vals)
+    vals = vals[isValid]
+    binStats = np.empty((len(vals), 6))
+    binStats[:, _PYR_N] = 1.0
+    binStats[:, _PYR_SUM] = vals
+    binStats[:, _PYR_M2] = 0.0
+    binStats[:, _PYR_MIN] = vals
+    binStats[:, _PYR_MAX] = vals
+    binStats[:, _PYR_LAST] = vals
+    return tsNs[isValid], binStats
+
+
+def _binAggregate(labels, binStats, periodNs):
+    """
+    Combine sorted bins (or raw samples, see _rawBinStats) into bins of
+    periodNs nanoseconds. Bins are closed and labeled on the right, the same
+    as resample(label="right", closed="right"), so a bin labeled t holds
+    timestamps after t - periodNs up to and including t.
+
+    Each bin has a count, sum, M2 (sum of squared differences from the bin
+    mean), min, max, and last value. M2 is combined using the parallel
+    variance formula, which does not lose precision the way a sum of squares
+    does. Only bins with values are returned.
+    """
+    if len(labels) == 0:
+        return labels, binStats
+    newLabels = -((-labels) // periodNs) * periodNs
+    starts = np.flatnonzero(np.concatenate(([True], newLabels[1:] != newLabels[:-1])))
+    sizes = np.diff(np.concatenate((starts, [len(labels)])))
+    n = np.add.reduceat(binStats[:, _PYR_N], starts)
+    sums = np.add.reduceat(binStats[:, _PYR_SUM], starts)
+    d = binStats[:, _PYR_SUM] / binStats[:, _PYR_N] - np.repeat(sums / n, sizes)
+    newStats = np.empty((len(starts), 6))
+    newStats[:, _PYR_N] = n
+    newStats[:, _PYR_SUM] = sums
+    newStats[:, _PYR_M2] = np.add.reduceat(
+        binStats[:, _PYR_M2] + binStats[:, _PYR_N] * d * d, starts
+    )
+    newStats[:, _PYR_MIN] = np.minimum.reduceat(binStats[:, _PYR_MIN], starts)
+    newStats[:, _PYR_MAX] = np.maximum.reduceat(binStats[:, _PYR_MAX], starts)
+    newStats[:, _PYR_LAST] = binStats[starts + sizes - 1, _PYR_LAST]
+    return newLabels[starts], newStats
+
+
+class _PyramidLevel(object):
+    """
+    One level of the TsIdxData pre-aggregate pyramid. Holds the bin labels
+    (int64 ns) and bin stats (see _binAggregate) of the bins with values, in
+    arrays that grow geometrically, so appending costs the size of the new
+    data.
+    """
+
+    def __init__(self, periodNs, labels, binStats):
+        self.periodNs = periodNs
+        self.count = len(labels)
+        self._labels = np.empty(max(2 * self.count, 64), dtype="int64")
+        self._stats = np.empty((len(self._labels), 6))
+        self._labels[: self.count] = labels
+        self._stats[: self.count] = binStats
+
+    @property
+    def labels(self):
+        return self._labels[: self.count]
+
+    @property
+    def stats(self):
+        return self._stats[: self.count]
+
+    def append(self, labels, binStats):
+        """
+        Add bins which are all at or after the last bin. A bin with the same
+        label as the last bin is combined with it.
+        """
+        if len(labels) == 0:
+            return
+        if self.count > 0 and labels[0] == self._labels[self.count - 1]:
+            labels, binStats = _binAggregate(
+                np.concatenate((self._labels[self.count - 1 : self.count], labels)),
+                np.concatenate((self._stats[self.count - 1 : self.count], binStats)),
+                self.periodNs,
+            )
+            self.count -= 1
+        newCount = self.count + len(labels)
+        if newCount > len(self._labels):
+            size = max(2 * newCount, 64)
+            oldLabels = self._labels
+            oldStats = self._stats
+            self._labels = np.empty(size, dtype="int64")
+            self._stats = np.empty((size, 6))
+            self._labels[: self.count] = oldLabels[: self.count]
+            self._stats[: self.count] = oldStats[: self.count]
+        self._labels[self.count : newCount] = labels
+        self._stats[self.count : newCount] = binStats
+        self.count = newCount
+
+
+def _statFlags(stats):
+    """
+    Return the stats string (lower case) and the flags for the value, min,
+    max, mean, and std stats, as used by TsIdxData.resample. If no stat is
+    found, the mean is used, and the stats string is "m".
+    """
+    stats = "" if stats is None else str(stats).lower()
+    valStat = stats.find("v") > -1  # value
+    minStat = stats.find("i") > -1  # minimum
+    maxStat = stats.find("x") > -1  # maximum
+    # mean or average
+    meanStat = stats.find("m") > -1 or stats.find("a") > -1
+    # standard deviation
+    stdStat = stats.find("s") > -1 or stats.find("d") > -1
+    if not (valStat or minStat or maxStat or meanStat or stdStat) and not any(
+        _timeWeightedFlags(stats)
+    ):
+        meanStat = True
+        stats = "m"
+    return stats, (valStat, minStat, maxStat, meanStat, stdStat)
+
+
+def _timeWeightedFlags(stats):
+    """
+    Return the flags for the time weighted mean, time weighted std, and time
+    integral (total) stats, as used by TsIdxData.resample.
+    """
+    stats = "" if stats is None else str(stats).lower()
+    twMeanStat = stats.find("w") > -1  # time weighted mean
+    twStdStat = stats.find("q") > -1  # time weighted std (quadratic mean)
+    twTotalStat = stats.find("z") > -1  # totalizer (time integral)
+    return twMeanStat, twStdStat, twTotalStat
+
+
+# Interpolate modes understood by TsIdxData.resample when upsampling, and
+# for the time weighted stats when downsampling
+_INTERPOLATE_MODES = ("step", "linear", "nearest")
+
+
+def _interpolateAt(tsNs, vals, atNs, interpolate="step"):
+    """
+    Return the values at the times atNs (int64 ns, sorted or not), found by
+    binary search of the sorted sample times tsNs.
+      step -- the value of the last sample at or before the time. A NaN value
+              is held like any other value, the same as a forward fill.
+      linear -- interpolated in time between the samples either side.
+      nearest -- the value of the nearest sample. Ties go to the later one.
+    NaN values are skipped by linear and nearest. Times before the first
+    sample or after the last sample are NaN.
+    """
+    atNs = np.asarray(atNs, dtype="int64")
+    result = np.full(len(atNs), np.nan)
+    if interpolate != "step":
+        isValid = ~np.isnan(vals)
+        if not isValid.all():
+            tsNs = tsNs[isValid]
+            vals = vals[isValid]
+    if len(tsNs) == 0:
+        return result
+    inRange = (atNs >= tsNs[0]) & (atNs <= tsNs[-1])
+    atIn = atNs[inRange]
+    # position of the last sample at or before each time
+    before = np.searchsorted(tsNs, atIn, side="right") - 1
+    if interpolate == "linear":
+        # Interpolate on times relative to the first sample, so the float
+        # times do not lose precision.
+        result[inRange] = np.interp(
+            (atIn - tsNs[0]).astype("float64"),
+            (tsNs - tsNs[0]).astype("float64"),
+            vals,
+        )
+    elif interpolate == "nearest":
+        after = np.minimum(before + 1, len(tsNs) - 1)
+        useAfter = (tsNs[after] - atIn) <= (atIn - tsNs[before])
+        result[inRange] = vals[np.where(useAfter, after, before)]
+    else:
+        result[inRange] = vals[before]
+    return result
+
+
+def _interpolateColumns(tsNs, vals, atNs, interpolate="step"):
+    """
+    Return the values of each column of the 2-D block vals at the times atNs
+    (int64 ns), the same as _interpolateAt on each column with its NaN values
+    removed. The block is for series sharing the sorted sample times tsNs,
+    where a NaN means the series has no sample at that time (like the tags of
+    a TsIdxCollection). Times before the first sample or after the last
+    sample of a column are NaN. All the columns are done at once: the
+    previous and next samples of each column are found by accumulating the
+    positions of the non-NaN values.
+    """
+    atNs = np.asarray(atNs, dtype="int64")
+    rowCount, colCount = vals.shape
+    result = np.full((len(atNs), colCount), np.nan)
+    if rowCount == 0 or len(atNs) == 0:
+        return result
+    isValid = ~np.isnan(vals)
+    rowPos = np.arange(rowCount)[:, None]
+    # the last non-NaN row at or before each row (-1 if none), and the first
+    # non-NaN row at or after each row (rowCount if none), for each column
+    prevValid = np.maximum.accumulate(np.where(isValid, rowPos, -1), axis=0)
+    nextValid = np.minimum.accumulate(
+        np.where(isValid, rowPos, rowCount)[::-1], axis=0
+    )[::-1]
+    # position of the last row at or before each time
+    before = np.searchsorted(tsNs, atNs, side="right") - 1
+    prevPos = np.where(before[:, None] >= 0, prevValid[np.maximum(before, 0)], -1)
+    nextPos = np.where(
+        before[:, None] + 1 < rowCount,
+        nextValid[np.minimum(before + 1, rowCount - 1)],
+        rowCount,
+    )
+    hasPrev = prevPos >= 0
+    prevPosC = np.maximum(prevPos, 0)
+    nextPosC = np.minimum(nextPos, rowCount - 1)
+    prevTs = tsNs[prevPosC]
+    nextTs = tsNs[nextPosC]
+    atCol = atNs[:, None]
+    onSample = hasPrev & (prevTs == atCol)
+    hasNext = nextPos < rowCount
+    inRange = hasPrev & (onSample | hasNext)
+    prevVals = np.take_along_axis(vals, prevPosC, axis=0)
+    if interpolate == "linear":
+        nextVals = np.take_along_axis(vals, nextPosC, axis=0)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            slope = (nextVals - prevVals) / (nextTs - prevTs).astype("float64")
+            values = np.where(onSample, prevVals, prevVals + slope * (atCol - prevTs))
+    elif interpolate == "nearest":
+        nextVals = np.take_along_axis(vals, nextPosC, axis=0)
+        useNext = hasNext & ~onSample & ((nextTs - atCol) <= (atCol - prevTs))
+        values = np.where(useNext, nextVals, prevVals)
+    else:
+        values = prevVals
+    result[inRange] = values[inRange]
+    return result
+
+
+def _upsampleGrid(firstNs, lastNs, periodNs):
+    """
+    Return the first and last times (int64 ns) of the upsample grid with a
+    period of periodNs covering firstNs to lastNs. The grid starts at the
+    start of the first day, the same as pandas resample.
+    """
+    dayStartNs = (firstNs // _DAY_NS) * _DAY_NS
+    gridFirstNs = dayStartNs + ((firstNs - dayStartNs) // periodNs) * periodNs
+    gridLastNs = gridFirstNs + ((lastNs - gridFirstNs) // periodNs) * periodNs
+    return gridFirstNs, gridLastNs
+
+
+def _timeWeightedBins(tsNs, vals, edgesNs, interpolate="step"):
+    """
+    Return the time integral of the values, the time integral of the squared
+    deviation from the time weighted mean, and the time covered (seconds)
+    for each bin. edgesNs are the bin edges (int64 ns, one more than the
+    number of bins), and the bins are closed on the right.
+
+    Between samples, the value is held (step), changes linearly (linear), or
+    changes half way to the next sample (nearest). NaN values are skipped.
+    Time before the first sample and after the last sample is not covered.
+    Samples and bin edges are merged into one sorted grid, so each piece
+    between grid points is in exactly one bin, and the pieces are summed into
+    the bins in one vectorized step.
+    """
+    binCount = len(edgesNs) - 1
+    integrals = np.zeros(binCount)
+    sqIntegrals = np.zeros(binCount)
+    durations = np.zeros(binCount)
+    isValid = ~np.isnan(vals)
+    tsNs = tsNs[isValid]
+    vals = vals[isValid]
+    if len(tsNs) < 2 or binCount < 1:
+        return integrals, sqIntegrals, durations
+    if interpolate == "nearest":
+        # The same as a step at the midpoints between the samples
+        tsNs = np.concatenate(
+            ([tsNs[0]], tsNs[:-1] + (tsNs[1:] - tsNs[:-1]) // 2, [tsNs[-1]])
+        )
+        vals = np.concatenate((vals, [vals[-1]]))
+    linear = interpolate == "linear"
+
+    # Split the signal at the bin edges inside the data
+    innerEdges = edgesNs[(edgesNs > tsNs[0]) & (edgesNs < tsNs[-1])]
+    gridNs = np.union1d(tsNs, innerEdges)
+    if linear:
+        gridVals = np.interp(
+            (gridNs - tsNs[0]).astype("float64"),
+            (tsNs - tsNs[0]).astype("float64"),
+            vals,
+        )
+    else:
+        gridVals = vals[np.searchsorted(tsNs, gridNs, side="right") - 1]
+
+    # Work relative to a reference value, so the squares keep their precision
+    refVal = vals.mean()
+    left = gridVals[:-1] - refVal
+    right = gridVals[1:] - refVal if linear else left
+    dt = np.diff(gridNs) / 1e9
+    # exact integrals of a held or straight line value over each piece
+    pieceIntegrals = (left + right) / 2.0 * dt
+    pieceSqIntegrals = (left * left + left * right + right * right) / 3.0 * dt
+    binPos = np.searchsorted(edgesNs, gridNs[1:], side="left") - 1
+    integrals = np.bincount(binPos, pieceIntegrals, minlength=binCount)
+    sqIntegrals = np.bincount(binPos, pieceSqIntegrals, minlength=binCount)
+    durations = np.bincount(binPos, dt, minlength=binCount)
+
+    # Move the squares to be about the time weighted mean of each bin, and
+    # the integrals back from the reference value.
+    with np.errstate(divide="ignore", invalid="ignore"):
+        binMeans = np.where(durations > 0, integrals / durations, 0.0)
+    sqIntegrals = np.maximum(sqIntegrals - binMeans * binMeans * durations, 0.0)
+    integrals = integrals + refVal * durations
+    return integrals, sqIntegrals, durations
+
+
+def _downsampleStats(
+    tsNs, vals, binLabels, resampleTo, statFlags, twFlags, interpolate="step"
+):
+    """
+    Return the downsampled stats of the sorted samples (tsNs int64 ns, vals)
+    in the bins labeled binLabels, which are closed and labeled on the right,
+    the same as resample(resampleTo, label="right", closed="right").
+    statFlags and twFlags are from _statFlags and _timeWeightedFlags. vals is
+    one column of values, or a 2-D block with a column for each series
+    sharing the sample times (like the tags of a TsIdxCollection).
+
+    All the requested stats are calculated in a single binning pass, for
+    every column at once. The samples are sorted, so the samples in each bin
+    are contiguous, and are found by binary search of the bin edges. Returns
+    a dictionary of the stat column prefix ("" for the value, then min_,
+    max_, mean_, std_, twmean_, twstd_, total_) to an array with a value for
+    each bin (and a column for each column of vals). Like the pandas stats,
+    NaN values are skipped, so a NaN is the same as no sample. Bins before
+    the first sample or after the last one of a column are NaN. The time
+    weighted stats use _timeWeightedBins on the same bins, one column at a
+    time, as each column has its own (non-NaN) sample times.
+    """
+    valStat, minStat, maxStat, meanStat, stdStat = statFlags
+    twMeanStat, twStdStat, twTotalStat = twFlags
+    vals = np.asarray(vals, dtype="float64")
+    oneCol = vals.ndim == 1
+    if oneCol:
+        vals = vals[:, None]
+    colCount = vals.shape[1]
+    binCount = len(binLabels)
+    statCols = {}
+    if binCount > 0:
+        # bin edges, from the left edge of the first bin
+        edgesNs = np.concatenate(
+            ([(binLabels[0] - resampleTo).value], binLabels.asi8)
+        ).astype("int64")
+        edgePos = np.searchsorted(tsNs, edgesNs, side="right")
+        counts = np.diff(edgePos)
+        starts = edgePos[:-1]
+    else:
+        edgesNs = np.empty(0, dtype="int64")
+        counts = np.empty(0, dtype="int64")
+        starts = counts
+    # reduceat needs non-empty segments. Reduce over those, and leave empty
+    # bins as NaN.
+    notEmpty = counts > 0
+    segStarts = starts[notEmpty]
+    isValid = ~np.isnan(vals)
+
+    def _expand(reduced):
+        # spread the reduced non-empty bin results back over all the bins
+        result = np.full((binCount, colCount), np.nan)
+        result[notEmpty] = reduced
+        return result
+
+    if len(segStarts) == 0:
+        # no data, so no bins with values
+        for include, prefix in zip(
+            statFlags + twFlags,
+            ("", "min_", "max_", "mean_", "std_", "twmean_", "twstd_", "total_"),
+        ):
+            if include:
+                statCols[prefix] = np.full((binCount, colCount), np.nan)
+    else:
+        # Only the samples in the bins are used
+        firstPos = edgePos[0]
+        lastPos = edgePos[-1]
+        if firstPos > 0 or lastPos < len(tsNs):
+            tsNs = tsNs[firstPos:lastPos]
+            vals = vals[firstPos:lastPos]
+            isValid = isValid[firstPos:lastPos]
+            segStarts = segStarts - firstPos
+
+        # Number of non-NaN values in each bin.
+        n = np.add.reduceat(isValid.astype("int64"), segStarts, axis=0)
+
+        if valStat:
+            # last non-NaN value in each bin
+            lastIdx = np.maximum.reduceat(
+                np.where(isValid, np.arange(len(vals))[:, None], -1),
+                segStarts,
+                axis=0,
+            )
+            lastVals = np.where(
+                lastIdx >= 0,
+                np.take_along_axis(vals, np.maximum(lastIdx, 0), axis=0),
+                np.nan,
+            )
+            statCols[""] = _expand(lastVals)
+
+        if minStat or meanStat or stdStat:
+            # fmin ignores NaN unless the whole bin is NaN
+            mins = np.fmin.reduceat(vals, segStarts, axis=0)
+        if minStat:
+            statCols["min_"] = _expand(mins)
+
+        if maxStat:
+            statCols["max_"] = _expand(np.fmax.reduceat(vals, segStarts, axis=0))
+
+        if meanStat or stdStat:
+            # Accumulate relative to the bin minimum to avoid losing precision
+            # in the sum of squares.
+            shift = np.where(np.isnan(mins), 0.0, mins)
+            shifted = np.where(
+                isValid, vals - np.repeat(shift, counts[notEmpty], axis=0), 0.0
+            )
+            sums = np.add.reduceat(shifted, segStarts, axis=0)
+            with np.errstate(divide="ignore", invalid="ignore"):
+                if meanStat:
+                    means = np.where(n > 0, shift + sums / n, np.nan)
+                    statCols["mean_"] = _expand(means)
+                if stdStat:
+                    sumSqs = np.add.reduceat(shifted * shifted, segStarts, axis=0)
+                    variance = (sumSqs - sums * sums / n) / (n - 1)
+                    stds = np.where(n > 1, np.sqrt(np.maximum(variance, 0.0)), np.nan)
+                    statCols["std_"] = _expand(stds)
+
+        if twMeanStat or twStdStat or twTotalStat:
+            # bins with a sample of each column
+            hasSample = np.zeros((binCount, colCount), dtype=bool)
+            hasSample[notEmpty] = n > 0
+            twCols = [
+                prefix
+                for include, prefix in zip(twFlags, ("twmean_", "twstd_", "total_"))
+                if include
+            ]
+            for prefix in twCols:
+                statCols[prefix] = np.full((binCount, colCount), np.nan)
+            for colNum in range(colCount):
+                samplePos = np.flatnonzero(hasSample[:, colNum])
+                if len(samplePos) == 0:
+                    continue
+                integrals, sqIntegrals, durations = _timeWeightedBins(
+                    tsNs, vals[:, colNum], edgesNs, interpolate
+                )
+                # bins outside the samples are not covered at all
+                inside = slice(samplePos[0], samplePos[-1] + 1)
+                with np.errstate(divide="ignore", invalid="ignore"):
+                    if twMeanStat:
+                        statCols["twmean_"][inside, colNum] = np.where(
+                            durations > 0, integrals / durations, np.nan
+                        )[inside]
+                    if twStdStat:
+                        statCols["twstd_"][inside, colNum] = np.where(
+                            durations > 0, np.sqrt(sqIntegrals / durations), np.nan
+                        )[inside]
+                if twTotalStat:
+                    statCols["total_"][inside, colNum] = integrals[inside]
+
+    if oneCol:
+        statCols = {prefix: statCol[:, 0] for prefix, statCol in statCols.items()}
+    return statCols
+
+
+def _compressKeep(t, vals, errorBound, swingingDoor, maxInterval=None):
+    """
+    Return the positions of the rows kept by TsIdxData.compress. t is the
+    time of each row (float, from the first row) and vals the values, with
+    no NaN values.
+
+    From each kept row (the anchor), the rows after it are searched in a
+    window, which doubles in size until the next row to keep is found. Each
+    search is vectorized, so there is one vectorized step per kept row, and
+    the rows are looked at about twice in all.
+      swingingdoor -- the upper door is the smallest slope from the anchor to
+                      (value + errorBound) of the rows so far, and the lower
+                      door the largest slope to (value - errorBound). The
+                      furthest row whose own slope is inside the doors of the
+                      rows before it is kept, once the doors cross. A line
+                      from the anchor to it is within errorBound of every
+                      row between.
+      deadband -- the first row more than errorBound from the anchor value is
+                  kept.
+    With maxInterval, the search also stops at the first row more than
+    maxInterval after the anchor.
+    """
+    rowCount = len(vals)
+    keptPos = [0]
+    anchor = 0
+    while anchor < rowCount - 1:
+        width = 64
+        while True:
+            stop = min(anchor + 1 + width, rowCount)
+            dt = t[anchor + 1 : stop] - t[anchor]
+            dv = vals[anchor + 1 : stop] - vals[anchor]
+            if swingingDoor:
+                upper = np.minimum.accumulate((dv + errorBound) / dt)
+                lower = np.maximum.accumulate((dv - errorBound) / dt)
+                isStop = lower > upper
+                # Slope of each row, against the doors of the rows before it
+                slope = dv / dt
+                isValid = np.ones(len(dt), dtype=bool)
+                isValid[1:] = (slope[1:] >= lower[:-1]) & (slope[1:] <= upper[:-1])
+            else:
+                isStop = np.abs(dv) > errorBound
+            if maxInterval is not None:
+                isStop |= dt > maxInterval
+            if isStop.any() or stop == rowCount:
+                found = int(np.argmax(isStop)) if isStop.any() else len(dt)
+                if not swingingDoor or found == 0:
+                    # the stopping row is kept. At the end, the last row.
+                    anchor += min(found, len(dt) - 1) + 1
+                else:
+                    # the last valid row before the stopping row is kept
+                    anchor += int(np.flatnonzero(isValid[:found])[-1]) + 1
+                keptPos.append(anchor)
+                break
+            width *= 2
+    return np.array(keptPos, dtype="int64")
+
+
+# Rolling statistics understood by TsIdxData.addRollingStat
+_ROLLING_STATS = ("mean", "std", "min", "max", "ewma")
+
+
+class _RollingStat(object):
+    """
+    One rolling statistic of a value column, kept up to date incrementally.
+    Used by TsIdxData.addRollingStat.
+
+    window is a number of rows (int), or a time period (like "5T" or a
+    Timedelta). Row windows need window valid values for a result, the same
+    as pandas rolling. Time windows hold the samples in (t - window, t], and
+    need one valid value. For ewma, window must be a number of rows, and is
+    used as the span (adjust=False, NaN values are skipped).
+
+    The samples in the current window are kept. Mean and std use running sums
+    of the window, and min and max use a monotonic deque, so each new sample
+    costs the same no matter how long the history is.
+    """
+
+    def __init__(self, stat, window):
+        self._stat = stat
+        if isinstance(window, (int, np.integer)):
+            if window < 1:
+                raise ValueError("A row window must be at least 1.")
+            self._byCount = True
+            self._window = int(window)
+            self._alpha = 2.0 / (self._window + 1.0)
+        else:
+            if stat == "ewma":
+                raise ValueError("The ewma window must be a number of rows (span).")
+            self._byCount = False
+            self._window = pd.Timedelta(to_offset(window)).value
+            if self._window <= 0:
+                raise ValueError("A time window must be longer than 0.")
+        self._reset()
+
+    def _reset(self):
+        # Keys are row numbers for row windows, or ns timestamps for time
+        # windows.
+        self._seq = 0
+        self._win = deque()  # (key, value) of every sample in the window
+        self._ext = deque()  # monotonic (key, value) for min or max
+        self._n = 0  # valid (not NaN) values in the window
+        # Sums are of the values minus _shift, which keeps the sum of squares
+        # from losing precision with large values.
+        self._shift = None
+        self._sum = 0.0
+        self._sumSq = 0.0
+        self._removed = 0
+        self._ewma = np.nan
+
+    def _push(self, ts, x):
+        """Add one sample, and return the statistic including it."""
+        key = self._seq if self._byCount else ts
+        self._seq += 1
+        isValid = x == x
+        if self._stat == "ewma":
+            if isValid:
+                if self._ewma != self._ewma:
+                    self._ewma = x
+                else:
+                    self._ewma += self._alpha * (x - self._ewma)
+            return self._ewma
+
+        cutoff = key - self._window
+        self._win.append((key, x))
+        if isValid:
+            self._n += 1
+            if self._stat in ("mean", "std"):
+                if self._shift is None:
+                    self._shift = x
+                d = x - self._shift
+                self._sum += d
+                self._sumSq += d * d
+            elif self._stat == "min":
+                while self._ext and self._ext[-1][1] >= x:
+                    self._ext.pop()
+                self._ext.append((key, x))
+            else:
+                while self._ext and self._ext[-1][1] <= x:
+                    self._ext.pop()
+                self._ext.append((key, x))
+
+        # Drop the samples which have left the window
+        while self._win[0][0] <= cutoff:
+            oldKey, old = self._win.popleft()
+            if old == old:
+                self._n -= 1
+                if self._stat in ("mean", "std"):
+                    d = old - self._shift
+                    self._sum -= d
+                    self._sumSq -= d * d
+                    self._removed += 1
+        while self._ext and self._ext[0][0] <= cutoff:
+            self._ext.popleft()
+
+        # Running sums build up rounding errors as values are removed. Sum
+        # the window again once as many values have been removed as it holds.
+        if self._removed > max(len(self._win), 1000):
+            d = np.array([val for k, val in self._win], dtype="float64") - self._shift
+            d = d[~np.isnan(d)]
+            self._sum = float(d.sum())
+            self._sumSq = float((d * d).sum())
+            self._removed = 0
+
+        minCount = self._window if self._byCount else 1
+        if self._n < minCount or self._n == 0:
+            return np.nan
+        if self._stat == "mean":
+            return self._shift + self._sum / self._n
+        if self._stat == "std":
+            if self._n < 2:
+                return np.nan
+            variance = (self._sumSq - self._sum * self._sum / self._n) / (self._n - 1)
+            return np.sqrt(max(variance, 0.0))
+        return self._ext[0][1]
+
+    def full(self, tsNs, vals):
+        """
+        Calculate the statistic for all the samples using pandas, and set up
+        the state from the last window, so update() can carry on from here.
+        Returns the results as an array.
+        """
+        self._reset()
+        if len(vals) == 0:
+            return np.empty(0)
+        if self._byCount:
+            srcSeries = pd.Series(vals)
+        else:
+            srcSeries = pd.Series(
+                vals, index=pd.DatetimeIndex(tsNs.view("datetime64[ns]"))
+            )
+        if self._stat == "ewma":
+            result = srcSeries.ewm(
+                span=self._window, adjust=False, ignore_na=True
+            ).mean()
+            result = result.to_numpy()
+            validResults = result[~np.isnan(result)]
+            if len(validResults) > 0:
+                self._ewma = validResults[-1]
+            return result
+
+        if self._byCount:
+            roller = srcSeries.rolling(self._window, min_periods=self._window)
+            tailStart = max(0, len(vals) - self._window)
+        else:
+            roller = srcSeries.rolling(pd.Timedelta(self._window), min_periods=1)
+            tailStart = int(
+                np.searchsorted(tsNs, tsNs[-1] - self._window, side="right")
+            )
+        result = getattr(roller, self._stat)().to_numpy()
+        # Only the samples in the last window make up the state.
+        self._seq = tailStart
+        for ts, x in zip(tsNs[tailStart:], vals[tailStart:]):
+            self._push(ts, x)
+        return result
+
+    def update(self, tsNs, vals):
+        """
+        Add new samples, which are all after the samples already added, and
+        return the results for them as an array.
+        """
+        return np.array(
+            [self._push(ts, x) for ts, x in zip(tsNs.tolist(), vals.tolist())],
+            dtype="float64",
+        )
+
+
 class TsIdxData(object):
     """
     Class: TsIdxData
@@ -54,6 +1192,10 @@ class TsIdxData(object):
                     For example, to filter out all values < 0 or > 100, you want
                     to keep everything else,so the filter string would be:
                       "val >= 0 and val <= 100".
+                    "val between 0 and 100" is the same thing.
+                    Simple queries (comparisons, between, and/or/not) are
+                    compiled once when the object is made. Anything else is
+                    run with DataFrame.query each time data is filtered.
 
       startQuery -- Datetime string used to filter the dataset.  Data timestamped
                     before this time will be filtered out. The default is empty,
@@ -72,6 +1214,35 @@ class TsIdxData(object):
                               %I hours (12 hr format), %M minutes, %S seconds,
                               %f for fractional seconds (e.g. %S.%f), %p AM/PM.
 
+      forceColNames -- If True, tsName and yName are used if they are in the
+                       source data. If not, a datetime index (or else the
+                       first column) is used as the timestamp, and the next
+                       column is used as the value. Default is False.
+
+      compact -- If True, the member data is stored in less memory. Value
+                 columns are stored as float32 if every value stays within
+                 compactTolerance (relative) of the float64 value, the index is
+                 stored as int64 epoch milliseconds, and string columns with
+                 repeated values (quality flags, units) are stored as
+                 categoricals. The dataframe with a datetime index is built
+                 from these when the data is next used, and kept until the data
+                 changes. Appended rows are compacted before they are merged,
+                 so only they are checked. Timestamps with sub-millisecond parts (from
+                 upsampling below 1 ms) keep the datetime index.
+                 Default is False.
+
+      compactTolerance -- Relative tolerance used to decide if a value column
+                          can be stored as float32. Default is 1e-6.
+
+      lazy -- If True, loading the source data, resample(), appendData(),
+              replaceData(), and filter() are not done right away. They are
+              recorded in a plan, which is run when the data is next needed
+              (by a property, save(), or printing the object). Before the
+              plan is run, adjacent filters are merged into one, adjacent
+              appends are merged into one, and a start/end time filter that
+              follows a downsample is pushed ahead of it, so rows outside
+              the window are not resampled. Default is False.
+
     Data Structure Notes
       The source data must have the following structure:
           Timestamp data: An index or value column must exist
@@ -93,14 +1264,18 @@ class TsIdxData(object):
     Resampling makes the most sense when the original data has time stamps at
     regular intervals, and the interval needs to be changed.
     If the data is being upsampled (increase the frequency),
-    than values will be forward filled to populate gaps in the data. If the data
-    is being downsampled (decrease in frequency), then the specified stats will
-    be calculated on values that fall between those being sampled.
+    than values will be forward filled to populate gaps in the data (or
+    interpolated, with resample(args, stats, interpolate="linear" or
+    "nearest")). If the data is being downsampled (decrease in frequency),
+    then the specified stats will be calculated on values that fall between
+    those being sampled.
 
     When resampling, and data is being downsampled, stats can be calculated. The
     stats parameter is used to specify which stats to calculate.  It is optional
     and defaults to 'm' if not specified. Choices are: (V)alue, m(I)n, ma(X),
-    (a)verage/(m)ean, and (s)tandard deviation.
+    (a)verage/(m)ean, and (s)tandard deviation. For irregular timestamps, the
+    time weighted stats are time (W)eighted mean, time weighted std (Q), and
+    totali(Z)er (the time integral of the value).
     The (a) and (m) options do the same thing. Choices are not case sensitive.
     Default is average/mean (m).  In the case of the Value option,
     the first value available which is on or after the timestamp is shown.
@@ -108,10 +1283,63 @@ class TsIdxData(object):
     For the other options, the intermediate values are used to calculate the
     statistic.  Note: The stats parameter is ignored when upsampling.
 
+    The upsampledView(args, interpolate) method returns a TsIdxUpsampledView,
+    which calculates upsampled values for a time range when asked, rather
+    than building every upsampled row.
+
+    The resampled(args, stats) method returns a new object with the data
+    resampled, and leaves the object unchanged. Results are cached until the
+    data changes. See setResampleCache(maxEntries, maxBytes).
+
+    A pyramid of pre-aggregated levels (like 1s, 1min, 1h, 1d) can be kept
+    using the buildPyramid(levels) method. Downsampling is then answered from
+    the pyramid rather than the raw data. The rangeStats(args, stats,
+    startQuery, endQuery) method downsamples part of the data without
+    changing the object.
+
+    For plots and reports, the downsampleLttb(points, startQuery, endQuery)
+    and downsampleM4(pixels, startQuery, endQuery) methods return a few rows
+    of the data which keep its visual shape (spikes are not averaged away).
+
+    Outages are found using the gaps(k, minGap) method, which returns the
+    spans where the time between rows is more than k times the time offset.
+    The isOnline(ts) and uptime(startQuery, endQuery) methods answer from an
+    interval index of the gaps.
+
+    Slowly changing data can be compressed the way process historians do,
+    using the compress(errorBound, method) method (swinging door or
+    deadband), and rebuilt using decompress().
+
+    Other threads should read the data using the snapshot() method, which
+    returns the last published TsIdxSnapshot without locking. One thread (the
+    writer) changes the data. Each change (append, resample, filter, and so
+    on) is published as a new snapshot when it is complete, in one step, so a
+    reader never sees a partly done change. Snapshots share the data with the
+    object and with each other rather than copying it.
+
     The member data can be appended to using the appendData(dataframe) method.
 
     The member data can be replaced using the replaceData(dataframe) method.
 
+    The member data can be filtered again using the filter(valueQuery,
+    startQuery, endQuery) method.
+
+    Rolling statistics (mean, std, min, max, ewma) of the value column can be
+    registered using the addRollingStat(stat, window, name) method, and
+    removed using removeRollingStat(name). They are kept up to date as data
+    is appended, calculating only the new rows. The results are in the
+    rollingData property.
+
+    Large csv files can be loaded using the from_csv(path, name, ...)
+    alternate constructor. The file is read in chunks, and each chunk is
+    converted and filtered before it is kept, so memory use tracks the size
+    of the filtered data rather than the size of the file.
+
+    The member data can be saved to a parquet file using the save(path)
+    method, and loaded again using the load(path) alternate constructor. Loading
+    can be limited to a time range, and does not massage the data again.
+    This requires the pyarrow library.
+
     The following read only properties are implemented
         name
             string -- object name
@@ -119,6 +1347,9 @@ class TsIdxData(object):
         tsName
             timestamp -- column name
 
+        yName
+            value -- column name
+
         valueQuery
             string used to query the source data during construction
 
@@ -138,11 +1369,20 @@ class TsIdxData(object):
             dictionary with column names as the key and the data type as a value {col name : datatype, ...}
 
         data
-            a copy of the dataframe
+            a read only view of the dataframe. It shares the data with the
+            object, so it is cheap to get. Values cannot be changed in place,
+            but columns can be set or added, which only changes the view.
+            Use data.copy() for a dataframe that can be changed freely.
 
         timeOffset
             time period between data samples
 
+        frequencyInfo
+            dictionary describing the sample period of the data:
+            period (dominant period), confidence (fraction of samples at that
+            period), jitter (spread of those periods), and irregular (True if
+            the data is not regularly sampled). See estimateFrequency().
+
         startTs
             the first time stamp associated with the data (the start time)
 
@@ -154,8 +1394,82 @@ class TsIdxData(object):
 
         isEmpty
             boolean true if data frame is empty
+
+        rollingData
+            a read only dataframe with a column for each registered rolling
+            statistic, with the same index as the data
+
+        memoryUsage
+            dictionary with the bytes used by each part of the member data:
+            index (the stored timestamps), values (numeric columns), extras
+            (other columns), and total.
     """
 
+    # The timestamp conversion that worked for the source data of this
+    # object. See __parseTimestamps.
+    _tsConverter = None
+
+    # Cached frequencyInfo, and the data version it was found for
+    _freqInfo = None
+    _freqInfoVersion = None
+
+    # Member data storage. See the _df property. In compact mode the index is
+    # held as int64 epoch milliseconds, and a dataframe view with a datetime
+    # index is built when it is needed. The view is kept (_compactView) until
+    # the data changes. _compactViewVersion is the data version it is for.
+    _compact = False
+    _compactTolerance = 1e-6
+    _dfStored = None
+    _tsMs = None
+    _compactView = None
+    _compactViewVersion = None
+
+    # Count of changes to the member data. See the _df property.
+    _dataVersion = 0
+
+    # Registered rolling statistics. See addRollingStat. The results are held
+    # in a 2-D array, one column per statistic, aligned with the last rows of
+    # the member data. _rollingVersion is the data version they were found
+    # for.
+    _rollingStats = None
+    _rollingVals = None
+    _rollingLen = 0
+    _rollingVersion = None
+    _rollingCol = None
+
+    # Pre-aggregate pyramid. See buildPyramid. _pyramidPeriods are the level
+    # periods (ns), and _pyramid the levels. The levels are for the data
+    # version _pyramidVersion, starting at the timestamp _pyramidFirstNs, of
+    # the column _pyramidCol.
+    _pyramidPeriods = None
+    _pyramid = None
+    _pyramidVersion = None
+    _pyramidFirstNs = None
+    _pyramidCol = None
+
+    # Gap interval index. See gaps. A tuple of the key (data version and
+    # gap threshold), the gap start and end timestamps (int64 ns), and the
+    # running total of the gap lengths.
+    _gapIndex = None
+
+    # The last published TsIdxSnapshot, and True while publishing is held
+    # (running a lazy plan). See snapshot.
+    _snapshot = None
+    _holdPublish = False
+
+    # Settings of the last compress(), used by decompress(). None if the
+    # data is not compressed.
+    _compression = None
+
+    # Stats string used by the last downsample. See resample.
+    _stats = ""
+
+    # Results of resampled(), newest last, and the limits on how many are
+    # kept. See setResampleCache.
+    _resampleCache = None
+    _resampleCacheEntries = 8
+    _resampleCacheBytes = 64 * 2**20
+
     def __init__(
         self,
         name,
@@ -167,9 +1481,24 @@ class TsIdxData(object):
         endQuery=None,
         sourceTimeFormat="%m/%d/%Y %H:%M:%S.%f",
         forceColNames=False,
+        lazy=False,
+        compact=False,
+        compactTolerance=1e-6,
     ):
         self._name = str(name)  # use the string version
         """ TsIdxData constructor (ctor). Details are in above class description."""
+        # Compact mode changes how the member data is stored. It needs to be
+        # set before the member data is.
+        self._compact = bool(compact)
+        self._compactTolerance = float(compactTolerance)
+
+        # Lazy mode records operations in a plan, and runs the plan when the
+        # data is needed. See __runPlan.
+        self._lazy = bool(lazy)
+        self._plan = []
+        self._rollingStats = {}
+        self._resampleCache = OrderedDict()
+
         # default x-axis (timestamp) label to 'timestamp' if nothing is specified
         if tsName is None:
             self._tsName = "timestamp"
@@ -193,6 +1522,14 @@ class TsIdxData(object):
             # make sure it is a string, and convert to lower case
             self._vq = str(valueQuery).lower()
 
+        # Compile the value query once into a mask function, so it does not
+        # need to be parsed every time data is filtered. If the query cannot be
+        # compiled, it is run using DataFrame.query instead.
+        if self._vq != "":
+            self._vqMask = _compileValueQuery(self._vq)
+        else:
+            self._vqMask = None
+
         # Convert the start and end times to datetimes if they are specified.
         # Use the dateutil.parser function to get input flexability, and then
         # convert to a datetime for max compatibility
@@ -296,101 +1633,102 @@ class TsIdxData(object):
             print(ve)
             self._df = None  # so that an empty dataframe will be used below
 
-        if df is None or self._df is None:
+        validSrc = not (df is None or self._df is None)
+        if not validSrc or self._lazy:
             # No (valid) source specified ...
             # create an empty data frame
             # not resampling ...
-            # create an empty data frame with the column names
-            self._df = pd.DataFrame(columns=[self._tsName, self._yName])
-            # force the columns to have the data types of datetime and float
-            self._df[self._yName] = self._df[self._yName].astype(
-                "float", errors="ignore"
+            # create an empty data frame with a float value column, indexed
+            # by a datetime timestamp. It is built first, and then stored
+            # once.
+            self._df = pd.DataFrame(
+                {self._yName: pd.Series([], dtype="float64")},
+                index=pd.DatetimeIndex([], name=self._tsName),
             )
 
-            # force the timestamp to a datetime
-            # should not raise an error, as there is no data
-            self._df[self._tsName] = pd.to_datetime(
-                self._df[self._tsName], errors="coerce"
-            )
-            # set the timestamp as the index
-            self._df.set_index(self._tsName, inplace=True)
-
             # set the other properties
             self._timeOffset = np.NaN
+
+            # In lazy mode, loading the source data is the first step of the
+            # plan. The plan keeps its own copy of the source, so changes to
+            # the caller's data before the plan runs are not seen.
+            if validSrc:
+                self._plan.append(("load", pd.DataFrame(df, copy=True), forceColNames))
         else:
             # Source data is specified ...
             # Use the member function to process it into the form we need.
-            self._df = pd.DataFrame(columns=[self._tsName, self._yName])
-            self._df = self.__massageData(srcDf=df, forceColNames=forceColNames)
-            # Use the member function to apply the filters
-            self._df = self.__filterData()
-
-            # Get the inferred frequency of the index. Store this internally,
-            # and expose below as a property.  Sometimes the data has repeated
-            # timestamps, and infer_freq does not work.Try it, but if it comes up
-            # empty, try it manually
-            try:
-                # try the inferred frequency
-                inferFreq = pd.infer_freq(self._df.index)
-            except TypeError as te:
-                print(
-                    "    WARNING: Timestamp column does not appear to be a datetime. \n \
-Cannot infer a frequency. Will try to do so manually by comparing the first few values."
-                )
-                print(te)
-                inferFreq = None
-            except ValueError as ve:
-                print(
-                    "    WARNING: There are not enough timestamps to infer a frequency. \n \
-Will try to do so manually by comparing the first few values."
-                )
-                print(ve)
-                inferFreq = None
-            finally:
-                # Try to get an inferred freq if the above did not work
-                # If that did not work, try to get it manually. When timestamps are
-                # repeated, it looks like the odd/even rows in that order are
-                # repeated.
-                if inferFreq is None or inferFreq == pd.Timedelta(0):
-                    print(
-                        "    WARNING: Data may have very few, skipped, missing, repeated or corrupted timestamps.\n \
-                    Determining sampling frequency manually."
-                    )
-                    # Use 3 and 4 if possible, just in case there is
-                    # something strange in the beginning. Otherwise, use entries 0
-                    # and 1, or give up, and use 1 second.
-                    if len(self._df.index) >= 4:
-                        inferFreq = pd.Timedelta(
-                            (self._df.index[3] - self._df.index[2])
-                        )
-                    elif len(self._df.index) >= 2:
-                        inferFreq = pd.Timedelta(
-                            (self._df.index[1] - self._df.index[0])
-                        )
-                    else:
-                        print(
-                            "    WARNING: Not enough data to determine the \
+            self.__loadData(df, forceColNames)
+
+        # ctor all done! Readers can now see the data.
+        self._publish()
+
+    def __loadData(self, srcDf, forceColNames=False, ownsData=False):
+        """
+        Private member function to massage and filter the source data into the
+        member data, and infer the time offset. ownsData is the same as for
+        __massageData.
+        """
+        self._df = pd.DataFrame(columns=[self._tsName, self._yName])
+        self._df = self.__massageData(
+            srcDf=srcDf, forceColNames=forceColNames, ownsData=ownsData
+        )
+        # Use the member function to apply the filters
+        self._df = self.__filterData()
+
+        # Get the inferred frequency of the index. Store this internally,
+        # and expose below as a property.
+        self._timeOffset = self.__inferTimeOffset()
+
+    def __inferTimeOffset(self):
+        """
+        Private member function to infer the time period between samples of the
+        member data. Returns the inferred period as a time offset.
+        The period comes from the frequencyInfo property (see
+        estimateFrequency), so one glitch in the timestamps does not change it.
+        """
+        if len(self.__timestampsNs()) < 2:
+            print(
+                "    WARNING: Not enough data to determine the \
 data frequency. Using 1 sec."
-                        )
-                        inferFreq = pd.Timedelta("1S")
+            )
+            return to_offset("1S")
 
-                # At this point, there is value for inferred frequency,
-                # but there may be repeated times due to sub-second times being
-                # truncated.  If this happens, the time delta will be 0. Deal
-                # with it by forcing 1 second
-                if inferFreq == pd.Timedelta(0):
-                    print(
-                        "    WARNING: Two rows have the same timestamp. \
+        freqInfo = self.frequencyInfo
+        if freqInfo["irregular"]:
+            print(
+                "    WARNING: "
+                + self._name
+                + ": Data may have skipped, missing, repeated or irregular \
+timestamps. Using the most common sample period of "
+                + str(freqInfo["period"])
+                + " ({:.0%} of samples).".format(freqInfo["confidence"])
+            )
+
+        # There may be repeated times due to sub-second times being truncated.
+        # If this happens, the time delta will be 0. Deal with it by forcing
+        # 1 second.
+        if freqInfo["period"] <= pd.Timedelta(0):
+            print(
+                "    WARNING: Two rows have the same timestamp. \
 Assuming a 1 second data frequency."
-                    )
-                    inferFreq = pd.Timedelta("1S")
+            )
+            return to_offset("1S")
 
-                # Frequency is ready. Convert it and store it as a time offset.
-                self._timeOffset = to_offset(inferFreq)
+        # Frequency is ready. Convert it and return it as a time offset.
+        return to_offset(freqInfo["period"])
 
-            # ctor all done!
+    def __timestampsNs(self):
+        """
+        Private member function to return the member data timestamps as int64
+        epoch nanoseconds. In compact mode they come from the stored ms
+        timestamps, so the dataframe view is not built.
+        """
+        if self._tsMs is not None:
+            return self._tsMs * 1000000
+        return self._df.index.asi8
 
     def __repr__(self):
+        self.__runPlan()
         outputMsg = "{:13} {}".format("\nName: ", self._name + "\n")
         if self.isEmpty:
             outputMsg += "Contains no data!\n"
@@ -416,7 +1754,7 @@ Assuming a 1 second data frequency."
             outputMsg += "Data:" + self._df.to_string()
             return outputMsg
 
-    def resample(self, resampleArg="S", stats="m", verbose=False):
+    def resample(self, resampleArg="S", stats="m", verbose=False, interpolate="step"):
         """
         Resample the data from the complete dataframe.
         The original data is replaced with the resampled data.
@@ -436,7 +1774,36 @@ Assuming a 1 second data frequency."
         which is on or after the timestamp is shown. The values between this and the
         next sample point are thrown away. For the other options, the intermediate
         values are used to calculate the statistic.
+        For irregular timestamps, there are also time weighted stats, where each
+        value counts for the time until the next sample: time (W)eighted mean,
+        time weighted std (Q) (the quadratic mean of the deviations), and
+        totali(Z)er, the time integral of the value in value * seconds.
+
+        interpolate (optional, default="step") Choose how values are found when
+        upsampling. "step" forward fills the last value, "linear"
+        interpolates in time between the values on either side, and "nearest"
+        uses the value of the nearest sample. When downsampling, it sets how
+        the value changes between samples for the time weighted stats.
+        To read a few upsampled values without building all the rows, use
+        upsampledView() instead.
+
+        In lazy mode, the resample is added to the plan.
         """
+        if self._lazy:
+            self._plan.append(("resample", resampleArg, stats, verbose, interpolate))
+            return
+
+        interpolate = str(interpolate).lower()
+        if interpolate not in _INTERPOLATE_MODES:
+            print(
+                '    WARNING: Unknown interpolate mode "'
+                + interpolate
+                + '". Use one of '
+                + ", ".join(_INTERPOLATE_MODES)
+                + '. Using "step".'
+            )
+            interpolate = "step"
+
         #
         # Make sure the resample argument is valid
         if resampleArg is None:
@@ -490,9 +1857,7 @@ Set "stats" to an empty string ("") or "None" to eliminate this warning.\n'
             dfResample.set_index(self._tsName, inplace=True)
             # upsample the data
             try:
-                dfResample[self._yName] = (
-                    self._df.iloc[:, 0].resample(resampleTo).fillna(method="ffill")
-                )
+                dfResample[self._yName] = self.__upsampleValues(resampleTo, interpolate)
                 # print a message
                 if verbose:
                     print(
@@ -505,10 +1870,13 @@ Set "stats" to an empty string ("") or "None" to eliminate this warning.\n'
                     )
                 # update the object frequency
                 self._timeOffset = resampleTo
+                # The data is no longer the compressed data
+                self._compression = None
                 # now overwrite the original dataframe with the resampled one
                 # and delete the resampled one
                 self._df = dfResample
                 del dfResample
+                self._publish()
                 return
             except ValueError as ve:
                 print(
@@ -526,104 +1894,30 @@ data. Data unchanged. Frequency is "
             # those being displayed.  Use the stats option to determine which
             # stats are to be calculated.
 
-            # make stats not case sensitive
-            if stats is not None:
-                self._stats = str(stats).lower()
-            else:
-                self._stats = ""
-
-            # Determine column names.
-            # Determine the stat flags. These are used below to decide which
-            # columns to make and calculate. Display the stat if the representative
-            # character is in the stats argument. Find returns -1 if not found
-            displayValStat = self._stats.find("v") > -1  # value
-            displayMinStat = self._stats.find("i") > -1  # minimum
-            displayMaxStat = self._stats.find("x") > -1  # maximum
-            # mean or average
-            displayMeanStat = self._stats.find("m") > -1 or self._stats.find("a") > -1
-            # standard deviation
-            displayStdStat = self._stats.find("s") > -1 or self._stats.find("d") > -1
-            # If none of the flags are set, an invalid string must have been
-            # passed. Display just the mean, and set the stats string accordingly
-            if (
-                not displayValStat
-                and not displayMinStat
-                and not displayMaxStat
-                and not displayMeanStat
-                and not displayStdStat
-            ):
-                displayMeanStat = True
-                self._stats = "m"
-
-            minColName = "min_" + self._name
-            maxColName = "max_" + self._name
-            meanColName = "mean_" + self._name
-            stdColName = "std_" + self._name
-
-            # Create a new data frame with a timestamp and value column(s), and
-            # force the data type(s) to timestamp and float
-            dfResample = pd.DataFrame(columns=[self._tsName])
-            if displayValStat:
-                dfResample[self._yName] = np.NaN
-                dfResample = dfResample.astype({self._yName: float}, errors="ignore")
-            if displayMinStat:
-                dfResample[minColName] = np.NaN
-                dfResample = dfResample.astype({minColName: float}, errors="ignore")
-            if displayMaxStat:
-                dfResample[maxColName] = np.NaN
-                dfResample = dfResample.astype({maxColName: float}, errors="ignore")
-            if displayMeanStat:
-                dfResample[meanColName] = np.NaN
-                dfResample = dfResample.astype({meanColName: float}, errors="ignore")
-            if displayStdStat:
-                dfResample[stdColName] = np.NaN
-                dfResample = dfResample.astype({stdColName: float}, errors="ignore")
-
-            # force the timestamp to a datetime datatype
-            dfResample[self._tsName] = pd.to_datetime(
-                dfResample[self._tsName], errors="coerce"
-            )
-
-            # set the timestamp as the index
-            dfResample.set_index(self._tsName, inplace=True)
-
-            # now do the resampling for each column
+            # make stats not case sensitive, and determine the stat flags.
+            # These are used below to decide which columns to make and
+            # calculate. If none of the flags are set, an invalid string must
+            # have been passed. Just the mean is displayed, and the stats
+            # string is set accordingly.
+            self._stats, statFlags = _statFlags(stats)
+            twFlags = _timeWeightedFlags(self._stats)
+
+            # Calculate all the requested stats in one binning pass (see
+            # _downsampleStats). The bins are found once, and because the
+            # index is sorted, each bin is a contiguous run of rows. The stats
+            # are then reduced over those runs using shared sum and sum of
+            # squares accumulators.
             # NOTE: fractional seconds can make merging appear to behave
             # strangely if precision gets truncated.
+            # If there is a pre-aggregate pyramid (see buildPyramid), use it.
+            # The pyramid does not hold the time weighted stats.
             try:
-                if displayValStat:
-                    dfResample[self._yName] = (
-                        self._df.iloc[:, 0]
-                        .resample(resampleTo, label="right", closed="right")
-                        .last()
-                    )
-
-                if displayMinStat:
-                    dfResample[minColName] = (
-                        self._df.iloc[:, 0]
-                        .resample(resampleTo, label="right", closed="right")
-                        .min()
-                    )
-
-                if displayMaxStat:
-                    dfResample[maxColName] = (
-                        self._df.iloc[:, 0]
-                        .resample(resampleTo, label="right", closed="right")
-                        .max()
-                    )
-
-                if displayMeanStat:
-                    dfResample[meanColName] = (
-                        self._df.iloc[:, 0]
-                        .resample(resampleTo, label="right", closed="right")
-                        .mean()
-                    )
-
-                if displayStdStat:
-                    dfResample[stdColName] = (
-                        self._df.iloc[:, 0]
-                        .resample(resampleTo, label="right", closed="right")
-                        .std()
+                dfResample = None
+                if not any(twFlags):
+                    dfResample = self.__pyramidStats(resampleTo, None, None, statFlags)
+                if dfResample is None:
+                    dfResample = self.__downsampleStats(
+                        resampleTo, statFlags, twFlags, interpolate
                     )
                 # print a message
                 if verbose:
@@ -637,10 +1931,13 @@ data. Data unchanged. Frequency is "
                     )
                 # update the object frequency
                 self._timeOffset = resampleTo
+                # The data is no longer the compressed data
+                self._compression = None
                 # now overwrite the original dataframe with the resampled one
                 # and delete the resampled one
                 self._df = dfResample
                 del dfResample
+                self._publish()
                 return
             except ValueError as ve:
                 print(
@@ -664,91 +1961,1658 @@ matches data frequency. Data unchanged. Frequency is "
                 )
             return
 
-    def appendData(self, srcDf, IgnoreFirstRows=1):
+    def resampled(self, resampleArg="S", stats="m", verbose=False, interpolate="step"):
         """
-        This function takes a source data frame (srcDf) and appends it to the
-        member data frame, as long as srcDf is a dataframe.
-        The column names of the source data are ignored, but
-        it is expected that index is or can be converted to a datetime, and the
-        values are or can be converted to a float.  Use IgnoreFirstRows to set
-        how many rows to throw away before merging the data. Default is 1, so as
-        to ignore a header row. Setting IgnoreFirstRows to 0 will treat every
-        row as data.
+        Return a new TsIdxData object with the data resampled, leaving this
+        object unchanged. The arguments are the same as resample().
+
+        Results are cached, keyed by the resample period, the stats, the
+        interpolate mode, and the version of the data, so asking for the same
+        resample again (like on each refresh of a display) does not calculate
+        it again. Changing the data (appendData, replaceData, resample, ...)
+        empties the cache. The size of the cache is limited to the most
+        recently used results. See setResampleCache.
+
+        The returned objects share the cached data, which is read only (see
+        the data property), so they are cheap to make.
         """
-
-        # Get the source data into a temp dataframe. Use member column names.
-        # This allows something like a dataframe to be used (like a list, dict,
-        # or other dataframe. If it isn't possible to build a dataframe from what
-        # was passed in, print a message and punt.
-        #
-        # If duplicate timestamps exist after the merge, duplicates will be dropped
-        # keeping the last value found in the list.
+        self.__runPlan()
         try:
-            df_temp = pd.DataFrame(data=srcDf, columns=[self._yName])
-        except ValueError:
-            print(
-                "    WARNING: The data specified for the appendData function \
-could not be turned into a dataframe. Nothing appended."
+            offsetKey = to_offset(resampleArg).freqstr
+        except (ValueError, TypeError):
+            offsetKey = str(resampleArg)
+        statsKey = "" if stats is None else "".join(sorted(set(str(stats).lower())))
+        cacheKey = (offsetKey, statsKey, str(interpolate).lower(), self._dataVersion)
+
+        # Drop results for older versions of the data. TsIdxRingData can
+        # change the data without emptying the cache.
+        for oldKey in [key for key in self._resampleCache if key[-1] != cacheKey[-1]]:
+            del self._resampleCache[oldKey]
+
+        if cacheKey in self._resampleCache:
+            self._resampleCache.move_to_end(cacheKey)
+            dfResample, timeOffset, statsUsed, cacheBytes = self._resampleCache[
+                cacheKey
+            ]
+        else:
+            # Resample a new object sharing the data. Resampling replaces
+            # the data of that object, so this object is not changed.
+            tsResample = self.__derived(self._df, self._timeOffset, self._stats)
+            # Let the new object answer from this object's pyramid, if it has
+            # one. Its data is the same, so the pyramid is current for it.
+            # The pyramid is only read, never updated, by the new object.
+            if self._pyramid is not None and self._pyramidVersion == self._dataVersion:
+                tsResample._pyramidPeriods = self._pyramidPeriods
+                tsResample._pyramid = self._pyramid
+                tsResample._pyramidVersion = tsResample._dataVersion
+                tsResample._pyramidFirstNs = self._pyramidFirstNs
+                tsResample._pyramidCol = self._pyramidCol
+            tsResample.resample(resampleArg, stats, verbose, interpolate)
+            tsResample.dropPyramid()
+            dfResample = tsResample._df
+            timeOffset = tsResample._timeOffset
+            statsUsed = tsResample._stats
+            cacheBytes = int(dfResample.memory_usage(index=True, deep=True).sum())
+            self._resampleCache[cacheKey] = (
+                dfResample,
+                timeOffset,
+                statsUsed,
+                cacheBytes,
             )
-            return
+            self.__trimResampleCache()
+        return self.__derived(dfResample, timeOffset, statsUsed)
 
-        # drop rows that should be ignored
-        if 1 <= IgnoreFirstRows:
-            df_temp.drop(df_temp.index[:IgnoreFirstRows], inplace=True)
+    def setResampleCache(self, maxEntries=8, maxBytes=64 * 2**20):
+        """
+        Set the limits of the resampled() cache: the number of results kept,
+        and the total bytes they use. The least recently used results are
+        dropped first. Use maxEntries=0 to turn off caching.
+        """
+        self._resampleCacheEntries = max(int(maxEntries), 0)
+        self._resampleCacheBytes = max(int(maxBytes), 0)
+        self.__trimResampleCache()
+        return
 
-        # condition and filter the passed in dataframe
-        df_temp = self.__massageData(df_temp)
-        df_temp = self.__filterData(df_temp)
+    def __trimResampleCache(self):
+        """
+        Private member function to drop the least recently used resampled()
+        results until the cache is within its limits.
+        """
+        cacheBytes = sum([entry[3] for entry in self._resampleCache.values()])
+        while self._resampleCache and (
+            len(self._resampleCache) > self._resampleCacheEntries
+            or cacheBytes > self._resampleCacheBytes
+        ):
+            oldKey, oldEntry = self._resampleCache.popitem(last=False)
+            cacheBytes -= oldEntry[3]
 
-        # now merge the conditioned data with the member data, along the index
-        # (timestamp) axis
-        self._df = self._df.append(df_temp)
-
-        # The merge may have made duplicate indexes. Drop them, but this requires
-        # resetting and rebuilding the index.
-        self._df.reset_index(drop=False, inplace=True)
-        self._df.drop_duplicates(subset=self._tsName, keep="last", inplace=True)
-        self._df.set_index(self._tsName, inplace=True)
-        self._df.sort_index(inplace=True)
+    def __derived(self, srcDf, timeOffset, stats):
+        """
+        Private member function to return a new TsIdxData object with the
+        same settings as this one, holding srcDf as its data. srcDf has already
+        been conditioned, so it is used as is.
+        """
+        tsDerived = TsIdxData(
+            self._name,
+            tsName=self._tsName,
+            yName=self._yName,
+            valueQuery=self._vq if self._vq != "" else None,
+            startQuery=self._startQuery,
+            endQuery=self._endQuery,
+            sourceTimeFormat=self._sourceTimeFormat,
+            compact=self._compact,
+            compactTolerance=self._compactTolerance,
+        )
+        tsDerived._df = srcDf
+        tsDerived._timeOffset = timeOffset
+        tsDerived._stats = stats
+        return tsDerived
+
+    def buildPyramid(self, levels=("1S", "1T", "1H", "1D")):
+        """
+        Build a pyramid of pre-aggregated levels of the data, which is kept up
+        to date as data is appended. Each level holds the count, sum, spread
+        (M2), min, max, and last value of each bin of its period.
+
+        Downsampling (resample, resampled, and rangeStats) is then answered
+        from the coarsest level whose period divides the new period, rather
+        than from the raw data, so the cost tracks the size of the result.
+        The results are the same as downsampling the raw data. This is used
+        when the new period is a fixed period (not months or years) that
+        divides evenly into a day. Otherwise the raw data is used.
+
+        levels is a list of periods, which must be fixed periods that divide
+        evenly into a day. The pyramid is of the first column of the data
+        (the value column), the same column resample uses.
+
+        Appending data which is all after the existing data only adds the new
+        rows to the pyramid. Any other change to the data means the pyramid
+        is built again the next time it is used.
+        """
+        periods = []
+        for level in levels:
+            try:
+                periodNs = pd.Timedelta(to_offset(level)).value
+            except (ValueError, TypeError) as ve:
+                print(
+                    '    WARNING: Invalid pyramid level "'
+                    + str(level)
+                    + '". It needs to be a fixed period. Ignoring it.'
+                )
+                print(ve)
+                continue
+            if periodNs <= 0 or _DAY_NS % periodNs != 0:
+                print(
+                    '    WARNING: Pyramid level "'
+                    + str(level)
+                    + '" does not divide evenly into a day. Ignoring it.'
+                )
+                continue
+            periods.append(periodNs)
+        self._pyramidPeriods = sorted(set(periods))
+        self.__runPlan()
+        self.__buildPyramid()
         return
 
-    def replaceData(self, srcDf, IgnoreFirstRows=1):
+    def dropPyramid(self):
         """
-        This function takes a source data frame (srcDf) and replaces the
-        member dataframe with it, as long as srcDf is a dataframe.
-        The column names of the source data are ignored, but
-        it is expected that index is or can be converted to a datetime, and the
-        values are or can be converted to a float.  Use IgnoreFirstRows to set
-        how many rows to throw away before merging the data. Default is 1, so as
-        to ignore a header row. Setting IgnoreFirstRows to 0 will treat every
-        row as data.
+        Stop keeping the pyramid made by buildPyramid, and free it.
         """
+        self._pyramidPeriods = None
+        self._pyramid = None
+        self._pyramidVersion = None
+        return
 
-        # Get the source data into a temp dataframe. Use member column names.
-        # This allows something like a dataframe to be used (like a list, dict,
-        # or other dataframe. If it isn't possible to build a dataframe from what
-        # was passed in, print a message and punt.
+    def __buildPyramid(self):
+        """
+        Private member function to build the pyramid levels from the member
+        data. The finest level is built from the raw data, and each coarser
+        level from the level below it.
+        """
+        dfData = self._df
+        self._pyramid = []
+        self._pyramidVersion = self._dataVersion
+        if dfData.empty or len(dfData.columns) == 0:
+            self._pyramidFirstNs = None
+            self._pyramidCol = None
+            labels = np.empty(0, dtype="int64")
+            binStats = np.empty((0, 6))
+        else:
+            self._pyramidFirstNs = dfData.index[0].value
+            self._pyramidCol = dfData.columns[0]
+            labels, binStats = _rawBinStats(
+                dfData.index.asi8, dfData.iloc[:, 0].to_numpy(dtype="float64")
+            )
+        for periodNs in self._pyramidPeriods:
+            labels, binStats = _binAggregate(labels, binStats, periodNs)
+            self._pyramid.append(_PyramidLevel(periodNs, labels, binStats))
 
-        try:
-            df_temp = pd.DataFrame(data=srcDf, columns=[self._yName])
-        except ValueError:
-            print(
+    def __updatePyramid(self, srcDf):
+        """
+        Private member function to add new rows appended after the existing
+        data to the pyramid levels.
+        """
+        if self._pyramidCol is None:
+            self._pyramidFirstNs = srcDf.index[0].value
+            self._pyramidCol = self._df.columns[0]
+        if self._pyramidCol in srcDf.columns:
+            vals = srcDf[self._pyramidCol].to_numpy(dtype="float64")
+        else:
+            # appended rows have no value in this column
+            vals = np.full(len(srcDf.index), np.nan)
+        rawLabels, rawStats = _rawBinStats(srcDf.index.asi8, vals)
+        for level in self._pyramid:
+            level.append(*_binAggregate(rawLabels, rawStats, level.periodNs))
+        self._pyramidVersion = self._dataVersion
+
+    def __pyramidStats(self, resampleTo, startTs, endTs, statFlags):
+        """
+        Private member function to downsample the rows from startTs to endTs
+        (None for no limit) using the pyramid. Returns the same dataframe as
+        __downsampleStats would for those rows, or None if the pyramid
+        cannot be used.
+
+        Bins which are wholly in the time range are taken from the coarsest
+        level whose period divides the new period. A first or last bin only
+        partly in the range is calculated from the raw rows.
+        """
+        if not self._pyramidPeriods or not isinstance(resampleTo, pd.offsets.Tick):
+            return None
+        periodNs = pd.Timedelta(resampleTo).value
+        if periodNs <= 0 or _DAY_NS % periodNs != 0:
+            return None
+        usable = [level for level in self._pyramidPeriods if periodNs % level == 0]
+        if not usable:
+            return None
+
+        dfData = self._df
+        if dfData.empty or len(dfData.columns) == 0:
+            return None
+        # Build the pyramid again if the data changed (or TsIdxRingData
+        # dropped old rows).
+        if (
+            self._pyramidVersion != self._dataVersion
+            or self._pyramidFirstNs != dfData.index[0].value
+            or self._pyramidCol != dfData.columns[0]
+        ):
+            self.__buildPyramid()
+        level = self._pyramid[self._pyramidPeriods.index(usable[-1])]
+
+        # The rows in range, and the first and last bins
+        tsIndex = dfData.index
+        tsNs = tsIndex.asi8
+        lo = 0 if startTs is None else tsIndex.searchsorted(startTs, side="left")
+        hi = len(tsNs) if endTs is None else tsIndex.searchsorted(endTs, side="right")
+        if hi <= lo:
+            return None
+        firstLabel = -((-tsNs[lo]) // periodNs) * periodNs
+        lastLabel = -((-tsNs[hi - 1]) // periodNs) * periodNs
+
+        # The bins wholly in range are from fullLo to fullHi
+        fullLo = firstLabel
+        if startTs is not None and startTs.value > firstLabel - periodNs + 1:
+            fullLo += periodNs
+        fullHi = lastLabel
+        if endTs is not None and endTs.value < lastLabel:
+            fullHi -= periodNs
+
+        # Raw rows before the whole bins, the pyramid bins, and the raw rows
+        # after the whole bins.
+        vals = dfData.iloc[:, 0].to_numpy(dtype="float64")
+        headEnd = min(int(np.searchsorted(tsNs, fullLo - periodNs, side="right")), hi)
+        headEnd = max(headEnd, lo)
+        tailStart = max(
+            int(np.searchsorted(tsNs, max(fullHi, fullLo - periodNs), side="right")),
+            headEnd,
+        )
+        parts = [_rawBinStats(tsNs[lo:headEnd], vals[lo:headEnd])]
+        if fullHi >= fullLo:
+            levelLabels = level.labels
+            levelLo = np.searchsorted(levelLabels, fullLo - periodNs, side="right")
+            levelHi = np.searchsorted(levelLabels, fullHi, side="right")
+            parts.append((levelLabels[levelLo:levelHi], level.stats[levelLo:levelHi]))
+        parts.append(_rawBinStats(tsNs[tailStart:hi], vals[tailStart:hi]))
+        labels, binStats = _binAggregate(
+            np.concatenate([part[0] for part in parts]),
+            np.concatenate([part[1] for part in parts]),
+            periodNs,
+        )
+
+        # Spread the bins with values over all the bins. Empty bins are NaN.
+        binCount = (lastLabel - firstLabel) // periodNs + 1
+        binPos = (labels - firstLabel) // periodNs
+        n = binStats[:, _PYR_N]
+
+        def _expand(binVals):
+            result = np.full(binCount, np.nan)
+            result[binPos] = binVals
+            return result
+
+        valStat, minStat, maxStat, meanStat, stdStat = statFlags
+        # build the columns in the same order as __downsampleStats
+        resampleCols = {}
+        if valStat:
+            resampleCols[self._yName] = _expand(binStats[:, _PYR_LAST])
+        if minStat:
+            resampleCols["min_" + self._name] = _expand(binStats[:, _PYR_MIN])
+        if maxStat:
+            resampleCols["max_" + self._name] = _expand(binStats[:, _PYR_MAX])
+        if meanStat:
+            resampleCols["mean_" + self._name] = _expand(binStats[:, _PYR_SUM] / n)
+        if stdStat:
+            with np.errstate(divide="ignore", invalid="ignore"):
+                stds = np.where(n > 1, np.sqrt(binStats[:, _PYR_M2] / (n - 1)), np.nan)
+            resampleCols["std_" + self._name] = _expand(stds)
+
+        binLabels = pd.date_range(
+            pd.Timestamp(firstLabel), periods=binCount, freq=resampleTo
+        )
+        dfResample = pd.DataFrame(resampleCols, index=binLabels, dtype="float64")
+        dfResample.index.name = self._tsName
+        return dfResample
+
+    def rangeStats(self, resampleArg="T", stats="m", startQuery=None, endQuery=None):
+        """
+        Return a dataframe with the stats of the data from startQuery to
+        endQuery, downsampled to resampleArg. The object is not changed. The
+        stats and the columns are the same as resample() when downsampling,
+        and the queries work the same as the ctor arguments.
+
+        If a pyramid has been built (see buildPyramid), it is used, so the
+        cost tracks the size of the result rather than the range.
+        """
+        self.__runPlan()
+        startTs, endTs = self.__queryRange(startQuery, endQuery)
+        try:
+            resampleTo = to_offset(resampleArg)
+        except ValueError:
+            resampleTo = None
+
+        statsUsed, statFlags = _statFlags(stats)
+        if (
+            resampleTo is not None
+            and not any(_timeWeightedFlags(statsUsed))
+            and (
+                not isinstance(self._timeOffset, pd.DateOffset)
+                or resampleTo > self._timeOffset
+            )
+        ):
+            dfStats = self.__pyramidStats(resampleTo, startTs, endTs, statFlags)
+            if dfStats is not None:
+                return dfStats
+
+        # Resample the rows in range the usual way
+        tsRange = self.__derived(
+            self._df.loc[startTs:endTs], self._timeOffset, self._stats
+        )
+        tsRange.resample(resampleArg, stats)
+        return tsRange._df
+
+    def __queryRange(self, startQuery, endQuery):
+        """
+        Private member function to convert the start and end queries of a
+        method the same way the ctor does. Invalid queries are ignored with a
+        warning. Returns (startTs, endTs), which are None for no limit.
+        """
+        try:
+            startTs = _toQueryTs(startQuery)
+            endTs = _toQueryTs(endQuery, isEnd=True)
+        except (ValueError, OverflowError) as voe:
+            print("    WARNING: Invalid start or end query. Ignoring.")
+            print(voe)
+            startTs = None
+            endTs = None
+        return startTs, endTs
+
+    def __plotRange(self, startQuery, endQuery):
+        """
+        Private member function used by downsampleLttb and downsampleM4.
+        Returns the position of the first row in range, the timestamps (int64
+        ns) and values of the value column in range, and the positions
+        (relative to the first row) of the rows with values. The arrays are
+        views of the member data where possible, so the full data is not
+        copied.
+        """
+        startTs, endTs = self.__queryRange(startQuery, endQuery)
+        dfData = self._df
+        lo = 0
+        hi = len(dfData.index)
+        if startTs is not None:
+            lo = dfData.index.searchsorted(startTs, side="left")
+        if endTs is not None:
+            hi = dfData.index.searchsorted(endTs, side="right")
+        hi = max(hi, lo)
+        if len(dfData.columns) == 0:
+            return lo, np.empty(0, dtype="int64"), np.empty(0), np.empty(0, "int64")
+        tsNs = dfData.index.asi8[lo:hi]
+        vals = dfData[self.__valueColumn(dfData)].to_numpy(dtype="float64")[lo:hi]
+        isNan = np.isnan(vals)
+        if isNan.any():
+            validPos = np.flatnonzero(~isNan)
+        else:
+            validPos = np.arange(len(vals))
+        return lo, tsNs, vals, validPos
+
+    def downsampleLttb(self, points=2000, startQuery=None, endQuery=None):
+        """
+        Return a dataframe with at most points rows of the data from
+        startQuery to endQuery, picked using Largest-Triangle-Three-Buckets.
+        The rows kept are the ones that best keep the visual shape of the
+        value column (peaks and dips are kept, rather than averaged away), so
+        the result is meant for plots and reports. The object is not changed.
+
+        The first and last rows are always kept. The rows between are split
+        into points - 2 buckets, and from each bucket the row making the
+        largest triangle with the row kept from the previous bucket and the
+        average of the next bucket is kept. Each bucket is done as one
+        vectorized step, so the data is passed over once.
+
+        The queries work the same as the ctor arguments. Rows with no value
+        are skipped.
+        """
+        self.__runPlan()
+        lo, tsNs, vals, validPos = self.__plotRange(startQuery, endQuery)
+        points = int(points)
+        rowCount = len(validPos)
+        if rowCount <= points or points < 3:
+            if points < 3 and rowCount > points:
+                # Too few points for buckets. Keep the first and last.
+                validPos = validPos[[0, -1]][: max(points, 0)]
+            return self._df.iloc[lo + validPos]
+
+        # Time as float seconds from the first row, so the triangle areas do
+        # not lose precision.
+        x = (tsNs[validPos] - tsNs[validPos[0]]) / 1e9
+        y = vals[validPos]
+
+        # Bucket i holds rows edges[i] to edges[i + 1] - 1. The first and last
+        # rows are not in a bucket.
+        bucketCount = points - 2
+        edges = (np.arange(bucketCount + 1) * ((rowCount - 2) / bucketCount)).astype(
+            "int64"
+        ) + 1
+        edges[-1] = rowCount - 1
+        # Average of each bucket, in one vectorized pass
+        sizes = np.diff(edges)
+        avgX = np.add.reduceat(x[:-1], edges[:-1]) / sizes
+        avgY = np.add.reduceat(y[:-1], edges[:-1]) / sizes
+        # The last bucket is followed by the last row
+        avgX = np.append(avgX, x[-1])
+        avgY = np.append(avgY, y[-1])
+
+        keptPos = np.empty(points, dtype="int64")
+        keptPos[0] = 0
+        keptPos[-1] = rowCount - 1
+        prevPos = 0
+        for bucket in range(bucketCount):
+            bucketStart = edges[bucket]
+            bucketEnd = edges[bucket + 1]
+            ax = x[prevPos]
+            ay = y[prevPos]
+            # twice the triangle area. The factor of 2 does not change the
+            # largest.
+            areas = np.abs(
+                (ax - avgX[bucket + 1]) * (y[bucketStart:bucketEnd] - ay)
+                - (ax - x[bucketStart:bucketEnd]) * (avgY[bucket + 1] - ay)
+            )
+            prevPos = bucketStart + int(np.argmax(areas))
+            keptPos[bucket + 1] = prevPos
+        return self._df.iloc[lo + validPos[keptPos]]
+
+    def downsampleM4(self, pixels=1000, startQuery=None, endQuery=None):
+        """
+        Return a dataframe with the rows of the data from startQuery to
+        endQuery needed to draw the value column pixels wide without losing
+        anything (M4). The time range is split into pixels columns of equal
+        time, and from each column the first, last, min, and max rows are
+        kept, so at most 4 * pixels rows are returned. A line drawn through
+        these rows looks the same at that width as one through all the data.
+        The object is not changed.
+
+        This is done with vectorized reductions in one pass over the data.
+        The queries work the same as the ctor arguments. Rows with no value
+        are skipped.
+        """
+        self.__runPlan()
+        lo, tsNs, vals, validPos = self.__plotRange(startQuery, endQuery)
+        pixels = max(int(pixels), 1)
+        rowCount = len(validPos)
+        if rowCount <= 4 * pixels:
+            return self._df.iloc[lo + validPos]
+
+        ts = tsNs[validPos]
+        y = vals[validPos]
+        # Pixel column of each row. Times are sorted, so each column is a
+        # contiguous run of rows.
+        span = ts[-1] - ts[0] + 1
+        column = ((ts - ts[0]) * (pixels / span)).astype("int64")
+        starts = np.flatnonzero(np.concatenate(([True], column[1:] != column[:-1])))
+        sizes = np.diff(np.concatenate((starts, [rowCount])))
+        ends = starts + sizes - 1
+
+        # The first row in each column with the column min (max)
+        segment = np.repeat(np.arange(len(starts)), sizes)
+        isMin = y == np.repeat(np.minimum.reduceat(y, starts), sizes)
+        isMax = y == np.repeat(np.maximum.reduceat(y, starts), sizes)
+        minPos = np.flatnonzero(isMin)
+        minPos = minPos[np.unique(segment[minPos], return_index=True)[1]]
+        maxPos = np.flatnonzero(isMax)
+        maxPos = maxPos[np.unique(segment[maxPos], return_index=True)[1]]
+
+        keptPos = np.unique(np.concatenate((starts, ends, minPos, maxPos)))
+        return self._df.iloc[lo + validPos[keptPos]]
+
+    def gaps(self, k=2.0, minGap=None):
+        """
+        Return a dataframe of the gaps (outages) in the data, one row per gap,
+        with the start (the last timestamp before the gap) and end (the first
+        timestamp after the gap) columns.
+
+        A gap is where the time between two rows is more than k times the
+        time offset (sampling period). If minGap is specified (a Timedelta or
+        something that can be converted to one, like "5T"), it is used as the
+        gap length instead.
+
+        The gaps are found in one vectorized pass over the timestamps, and are
+        kept (until the data changes) as an interval index used by isOnline
+        and uptime.
+        """
+        self.__runPlan()
+        gapStarts, gapEnds, gapTotals = self.__gapIndex(k, minGap)
+        return pd.DataFrame(
+            {
+                "start": gapStarts.view("datetime64[ns]"),
+                "end": gapEnds.view("datetime64[ns]"),
+            }
+        )
+
+    def isOnline(self, ts, k=2.0, minGap=None):
+        """
+        Return True if the tag was online at time ts, that is ts is between
+        the first and last timestamps, and not inside a gap. See gaps() for k
+        and minGap. ts can also be a list (or array) of times, in which case
+        an array of booleans is returned.
+        Each time is looked up in the gap interval index, so this is O(log n).
+        """
+        self.__runPlan()
+        gapStarts, gapEnds, gapTotals = self.__gapIndex(k, minGap)
+        isScalar = np.ndim(ts) == 0
+        tsNs = pd.DatetimeIndex(np.atleast_1d(pd.to_datetime(ts))).asi8
+        if self.isEmpty:
+            online = np.zeros(len(tsNs), dtype="bool")
+        else:
+            dataNs = self._df.index.asi8
+            online = (tsNs >= dataNs[0]) & (tsNs <= dataNs[-1])
+            # the last gap starting before each time
+            gapPos = np.searchsorted(gapStarts, tsNs, side="left") - 1
+            inGap = (gapPos >= 0) & (tsNs < gapEnds[np.maximum(gapPos, 0)])
+            online &= ~inGap
+        if isScalar:
+            return bool(online[0])
+        return online
+
+    def uptime(self, startQuery=None, endQuery=None, k=2.0, minGap=None):
+        """
+        Return the fraction (0 to 1) of the time from startQuery to endQuery
+        that the tag was online. See isOnline. The queries work the same as
+        the ctor arguments, and default to the first and last timestamps.
+        The gap interval index holds the running total of the gap lengths,
+        so this is O(log n). Returns NaN if the time range is empty.
+        """
+        self.__runPlan()
+        gapStarts, gapEnds, gapTotals = self.__gapIndex(k, minGap)
+        startTs, endTs = self.__queryRange(startQuery, endQuery)
+        if self.isEmpty:
+            if startTs is None or endTs is None or endTs <= startTs:
+                return np.nan
+            return 0.0
+        dataNs = self._df.index.asi8
+        rangeStart = dataNs[0] if startTs is None else startTs.value
+        rangeEnd = dataNs[-1] if endTs is None else endTs.value
+        if rangeEnd <= rangeStart:
+            return np.nan
+
+        # Online time is the part of the range with data, less the gaps.
+        onlineNs = min(rangeEnd, dataNs[-1]) - max(rangeStart, dataNs[0])
+        if onlineNs <= 0:
+            return 0.0
+        # Gaps from firstGap up to lastGap (not included) overlap the range.
+        firstGap = np.searchsorted(gapEnds, rangeStart, side="right")
+        lastGap = np.searchsorted(gapStarts, rangeEnd, side="left")
+        if lastGap > firstGap:
+            gapNs = gapTotals[lastGap] - gapTotals[firstGap]
+            # less the parts of the first and last gaps outside the range
+            gapNs -= max(0, rangeStart - gapStarts[firstGap])
+            gapNs -= max(0, gapEnds[lastGap - 1] - rangeEnd)
+            onlineNs -= gapNs
+        return float(onlineNs) / float(rangeEnd - rangeStart)
+
+    def __gapIndex(self, k, minGap):
+        """
+        Private member function to return the gap interval index for a gap
+        threshold: sorted arrays of the gap start and end timestamps (int64
+        ns), and the running total of the gap lengths (one longer, starting
+        at 0). It is kept until the data or threshold changes.
+        """
+        if minGap is not None:
+            thresholdNs = pd.Timedelta(minGap).value
+        elif isinstance(self._timeOffset, pd.offsets.Tick):
+            thresholdNs = int(float(k) * pd.Timedelta(self._timeOffset).value)
+        else:
+            # no time offset (no data), so no gaps
+            thresholdNs = None
+        indexKey = (self._dataVersion, thresholdNs)
+        if self._gapIndex is not None and self._gapIndex[0] == indexKey:
+            return self._gapIndex[1:]
+
+        tsNs = self._df.index.asi8
+        if thresholdNs is None or len(tsNs) < 2:
+            gapPos = np.empty(0, dtype="int64")
+        else:
+            gapPos = np.flatnonzero(np.diff(tsNs) > thresholdNs)
+        gapStarts = tsNs[gapPos]
+        gapEnds = tsNs[gapPos + 1]
+        gapTotals = np.concatenate(([0], np.cumsum(gapEnds - gapStarts)))
+        self._gapIndex = (indexKey, gapStarts, gapEnds, gapTotals)
+        return gapStarts, gapEnds, gapTotals
+
+    def __upsampleValues(self, resampleTo, interpolate="step"):
+        """
+        Private member function to return the first column upsampled to
+        resampleTo as a series, using _interpolateAt (step, linear, or
+        nearest). The grid is the same as pandas resample.
+        """
+        srcSeries = self._df.iloc[:, 0]
+        gridIndex = srcSeries.resample(resampleTo).asfreq().index
+        upsampled = _interpolateAt(
+            srcSeries.index.asi8,
+            srcSeries.to_numpy(dtype="float64"),
+            gridIndex.asi8,
+            interpolate,
+        )
+        return pd.Series(upsampled, index=gridIndex)
+
+    def upsampledView(self, resampleArg="S", interpolate="step"):
+        """
+        Return a TsIdxUpsampledView of the first column upsampled to
+        resampleArg, without building the upsampled rows. Values are
+        calculated when asked for, for a time range or for some times, by
+        binary search of the data index. The view holds the data as it is
+        now. Only fixed periods (like "100ms" or "S") can be used.
+        In lazy mode, the plan is run first.
+        """
+        self.__runPlan()
+        try:
+            resampleTo = to_offset(resampleArg)
+        except ValueError as ve:
+            print(
+                "    WARNING: "
+                + self._name
+                + ": Invalid resample period specified. Using 1 second."
+            )
+            print(ve)
+            resampleTo = to_offset("S")
+        if not isinstance(resampleTo, pd.offsets.Tick):
+            print(
+                "    WARNING: "
+                + self._name
+                + ": An upsampled view needs a fixed period. Using 1 second."
+            )
+            resampleTo = to_offset("S")
+        interpolate = str(interpolate).lower()
+        if interpolate not in _INTERPOLATE_MODES:
+            print(
+                '    WARNING: Unknown interpolate mode "'
+                + interpolate
+                + '". Use one of '
+                + ", ".join(_INTERPOLATE_MODES)
+                + '. Using "step".'
+            )
+            interpolate = "step"
+
+        srcSeries = self._df.iloc[:, 0] if len(self._df.columns) else None
+        return TsIdxUpsampledView(
+            self._name,
+            self._tsName,
+            self._yName,
+            self._df.index.asi8,
+            np.empty(0) if srcSeries is None else srcSeries.to_numpy(dtype="float64"),
+            resampleTo,
+            interpolate,
+        )
+
+    def compress(
+        self, errorBound, method="swingingdoor", maxInterval=None, verbose=False
+    ):
+        """
+        Compress the data the way process historians do, keeping only the rows
+        needed to rebuild the value column to within errorBound. The other
+        rows are dropped. Slowly changing tags typically keep 1 row in 10 to 50.
+
+        method (optional, default="swingingdoor")
+          "swingingdoor" -- A row is kept when no straight line from the last
+                            kept row can pass within errorBound of all the rows
+                            since. Linear interpolation between the kept rows
+                            is within errorBound of every dropped value.
+          "deadband" -- A row is kept when its value differs from the last kept
+                        value by more than errorBound. Forward filling the kept
+                        values (step) is within errorBound of every dropped
+                        value.
+
+        maxInterval (optional) A time period (like "1H"). A row is also kept
+        if it is more than this long after the last kept row.
+
+        The first and last rows are always kept. Use decompress() to rebuild
+        the data at the original time offset with the matching interpolation,
+        or resample(..., interpolate="linear") (swingingdoor) or
+        interpolate="step" (deadband) for another period.
+
+        The rows are searched with vectorized steps (doubling the search each
+        time a row is not found), so only one step is run per kept row.
+        In lazy mode, the plan is run first.
+        """
+        self.__runPlan()
+        method = str(method).lower()
+        if method not in ("swingingdoor", "deadband"):
+            print(
+                '    WARNING: Unknown compression method "'
+                + method
+                + '". Use "swingingdoor" or "deadband". Data unchanged.'
+            )
+            return
+        errorBound = float(errorBound)
+        if errorBound < 0:
+            print("    WARNING: errorBound can not be negative. Data unchanged.")
+            return
+        maxIntervalNs = None if maxInterval is None else pd.Timedelta(maxInterval).value
+
+        dfData = self._df
+        if len(dfData.index) < 3 or len(dfData.columns) == 0:
+            return
+        vals = dfData[self.__valueColumn(dfData)].to_numpy(dtype="float64")
+        validPos = np.flatnonzero(~np.isnan(vals))
+        if len(validPos) < 3:
+            return
+        tsNs = dfData.index.asi8[validPos]
+        keptPos = _compressKeep(
+            (tsNs - tsNs[0]).astype("float64"),
+            vals[validPos],
+            errorBound,
+            method == "swingingdoor",
+            None if maxIntervalNs is None else float(maxIntervalNs),
+        )
+        if verbose:
+            print(
+                "    "
+                + self._name
+                + ": Compressed ("
+                + method
+                + ") from "
+                + str(len(dfData.index))
+                + " to "
+                + str(len(keptPos))
+                + " rows"
+            )
+        # Remember how to rebuild the data, unless it was compressed already
+        if self._compression is None:
+            self._compression = {
+                "method": method,
+                "errorBound": errorBound,
+                "timeOffset": self._timeOffset,
+            }
+        self._df = dfData.iloc[validPos[keptPos]]
+        # Compressed data is irregular on purpose, so use the most common
+        # period without warning about it.
+        self._timeOffset = to_offset(self.frequencyInfo["period"])
+        self._publish()
+        return
+
+    def decompress(self, verbose=False):
+        """
+        Rebuild compressed data (see compress) at the time offset it had
+        before it was compressed, using linear interpolation for swingingdoor,
+        and forward fill (step) for deadband. Rebuilt values are within the
+        compress errorBound of the original values.
+        Like upsampling, only the value column is kept.
+        """
+        self.__runPlan()
+        if self._compression is None:
+            print("    WARNING: " + self._name + " is not compressed. Data unchanged.")
+            return
+        if not isinstance(self._compression["timeOffset"], pd.DateOffset):
+            self._compression = None
+            return
+        resampleTo = self._compression["timeOffset"]
+        if self._compression["method"] == "swingingdoor":
+            interpolate = "linear"
+        else:
+            interpolate = "step"
+        dfResample = self.__upsampleValues(resampleTo, interpolate).to_frame(
+            self._yName
+        )
+        dfResample.index.name = self._tsName
+        if verbose:
+            print(
+                "    "
+                + self._name
+                + ": Decompressed from "
+                + str(len(self._df.index))
+                + " to "
+                + str(len(dfResample.index))
+                + " rows"
+            )
+        self._df = dfResample
+        self._timeOffset = resampleTo
+        self._compression = None
+        self._publish()
+        return
+
+    def __downsampleStats(self, resampleTo, statFlags, twFlags, interpolate="step"):
+        """
+        Private member function used when downsampling to calculate all the
+        requested statistics of the value column in a single binning pass
+        (see _downsampleStats). Bins are labeled and closed on the right, the
+        same as resample(resampleTo, label="right", closed="right").
+
+        Returns a dataframe indexed by the bin timestamps with a column for
+        each requested stat (value, min_<name>, max_<name>, mean_<name>,
+        std_<name>, twmean_<name>, twstd_<name>, total_<name>).
+        """
+        # Find the bin labels once. Only the index is used.
+        valSeries = self._df.iloc[:, 0]
+        binLabels = (
+            valSeries.resample(resampleTo, label="right", closed="right").size().index
+        )
+        statCols = _downsampleStats(
+            valSeries.index.asi8,
+            valSeries.to_numpy(dtype="float64"),
+            binLabels,
+            resampleTo,
+            statFlags,
+            twFlags,
+            interpolate,
+        )
+        resampleCols = {
+            (self._yName if prefix == "" else prefix + self._name): statCol
+            for prefix, statCol in statCols.items()
+        }
+        dfResample = pd.DataFrame(resampleCols, index=binLabels, dtype="float64")
+        dfResample.index.name = self._tsName
+        return dfResample
+
+    def appendData(self, srcDf, IgnoreFirstRows=1):
+        """
+        This function takes a source data frame (srcDf) and appends it to the
+        member data frame, as long as srcDf is a dataframe.
+        The column names of the source data are ignored, but
+        it is expected that index is or can be converted to a datetime, and the
+        values are or can be converted to a float.  Use IgnoreFirstRows to set
+        how many rows to throw away before merging the data. Default is 1, so as
+        to ignore a header row. Setting IgnoreFirstRows to 0 will treat every
+        row as data.
+        """
+
+        # Get the source data into a temp dataframe. Use member column names.
+        # This allows something like a dataframe to be used (like a list, dict,
+        # or other dataframe. If it isn't possible to build a dataframe from what
+        # was passed in, print a message and punt.
+        #
+        # If duplicate timestamps exist after the merge, duplicates will be dropped
+        # keeping the last value found in the list.
+        try:
+            df_temp = pd.DataFrame(data=srcDf, columns=[self._yName])
+        except ValueError:
+            print(
+                "    WARNING: The data specified for the appendData function \
+could not be turned into a dataframe. Nothing appended."
+            )
+            return
+
+        # drop rows that should be ignored. This is a slice, so the data is
+        # not copied.
+        if 1 <= IgnoreFirstRows:
+            df_temp = df_temp.iloc[IgnoreFirstRows:]
+
+        # In lazy mode, add a copy of the data to the plan, so changes to the
+        # caller's data before the plan runs are not seen.
+        if self._lazy:
+            self._plan.append(("append", df_temp.copy()))
+            return
+
+        self.__appendFrame(df_temp)
+        return
+
+    def __appendFrame(self, srcDf, ownsData=False):
+        """
+        Private member function to condition, filter, and merge a dataframe
+        with the value column into the member data. This is appendData after
+        the source is turned into a dataframe. ownsData is the same as for
+        __massageData.
+        """
+        # condition and filter the passed in dataframe
+        df_temp = self.__massageData(srcDf, ownsData=ownsData)
+        df_temp = self.__filterData(df_temp)
+
+        # Rolling statistics and the pyramid can be updated with only the new
+        # rows if they are up to date, and the new rows are all after the
+        # existing ones.
+        newerRows = not df_temp.empty and (
+            self.isEmpty or df_temp.index[0] > self.endTs
+        )
+        rollingUpdate = (
+            newerRows
+            and bool(self._rollingStats)
+            and self._rollingVersion == self._dataVersion
+        )
+        pyramidUpdate = (
+            newerRows
+            and self._pyramid is not None
+            and self._pyramidVersion == self._dataVersion
+        )
+
+        # now merge the conditioned data with the member data, along the index
+        # (timestamp) axis
+        self._appendConditioned(df_temp)
+
+        if rollingUpdate:
+            self.__updateRolling(df_temp)
+        if pyramidUpdate:
+            self.__updatePyramid(df_temp)
+        self._publish()
+        return
+
+    def addRollingStat(self, stat, window, name=None):
+        """
+        Register a rolling statistic of the value column, which is then kept
+        up to date as data is appended. See the rollingData property.
+
+        stat is one of "mean", "std", "min", "max", or "ewma".
+        window is a number of rows (int), or a time period like "5T" or "1H".
+        Row windows give NaN until there are window values, the same as
+        pandas rolling. Time windows hold the samples in the period up to and
+        including each sample. For ewma, window must be a number of rows, and
+        is used as the span.
+        name is the result column name. The default is
+        <stat>_<window>_<object name>, for example mean_5T_FIC101.
+
+        Appending data which is all after the existing data only calculates
+        the statistics for the new rows, using the samples held from the last
+        window. Any other change to the data (resample, replaceData, filter,
+        or appending older data) means the statistics are calculated again
+        for all rows the next time they are used.
+
+        If the data has been resampled without the value column, the first
+        column is used.
+        """
+        stat = str(stat).lower()
+        if stat not in _ROLLING_STATS:
+            print(
+                '    WARNING: Unknown rolling stat "'
+                + stat
+                + '". Use one of '
+                + ", ".join(_ROLLING_STATS)
+                + ". Nothing added."
+            )
+            return
+        try:
+            rollingStat = _RollingStat(stat, window)
+        except (ValueError, TypeError) as ve:
+            print("    WARNING: Invalid rolling window. Nothing added.")
+            print(ve)
+            return
+        if name is None:
+            name = stat + "_" + str(window) + "_" + self._name
+        self._rollingStats[str(name)] = rollingStat
+        # calculated when next used
+        self._rollingVersion = None
+        return
+
+    def removeRollingStat(self, name):
+        """
+        Remove a rolling statistic added with addRollingStat.
+        """
+        del self._rollingStats[name]
+        self._rollingVersion = None
+        return
+
+    def __valueColumn(self, srcDf):
+        """
+        Private member function to return the name of the value column of
+        srcDf. This is yName, or the first column if the data has been
+        resampled without the value column.
+        """
+        if self._yName in srcDf.columns:
+            return self._yName
+        return srcDf.columns[0]
+
+    def __computeRolling(self):
+        """
+        Private member function to calculate the rolling statistics for all
+        the member data.
+        """
+        dfData = self._df
+        if dfData.empty or len(dfData.columns) == 0:
+            self._rollingCol = None
+            tsNs = np.empty(0, dtype="int64")
+            vals = np.empty(0)
+        else:
+            self._rollingCol = self.__valueColumn(dfData)
+            tsNs = dfData.index.asi8
+            vals = dfData[self._rollingCol].to_numpy(dtype="float64")
+        self._rollingVals = np.empty((len(vals), len(self._rollingStats)))
+        for statNum, rollingStat in enumerate(self._rollingStats.values()):
+            self._rollingVals[:, statNum] = rollingStat.full(tsNs, vals)
+        self._rollingLen = len(vals)
+        self._rollingVersion = self._dataVersion
+
+    def __updateRolling(self, srcDf):
+        """
+        Private member function to update the rolling statistics with new
+        rows appended after the existing data. Only the new rows are
+        calculated.
+        """
+        valCol = self.__valueColumn(self._df)
+        if self._rollingCol is not None and valCol != self._rollingCol:
+            # The value column changed. Calculate everything when next used.
+            return
+        self._rollingCol = valCol
+        tsNs = srcDf.index.asi8
+        if valCol in srcDf.columns:
+            vals = srcDf[valCol].to_numpy(dtype="float64")
+        else:
+            vals = np.full(len(tsNs), np.nan)
+
+        # Make room for the new rows, growing geometrically. Rows that are
+        # no longer in the data (TsIdxRingData drops old rows) are not kept.
+        dataCount = self.count
+        newLen = self._rollingLen + len(tsNs)
+        if newLen > len(self._rollingVals):
+            keepCount = min(dataCount - len(tsNs), self._rollingLen)
+            keepCount = max(keepCount, 0)
+            oldVals = self._rollingVals[self._rollingLen - keepCount : self._rollingLen]
+            self._rollingVals = np.empty(
+                (max(2 * (keepCount + len(tsNs)), 1024), len(self._rollingStats))
+            )
+            self._rollingVals[:keepCount] = oldVals
+            self._rollingLen = keepCount
+            newLen = keepCount + len(tsNs)
+        for statNum, rollingStat in enumerate(self._rollingStats.values()):
+            self._rollingVals[self._rollingLen : newLen, statNum] = rollingStat.update(
+                tsNs, vals
+            )
+        self._rollingLen = newLen
+        self._rollingVersion = self._dataVersion
+
+    def _appendConditioned(self, srcDf):
+        """
+        Merge conditioned and filtered data into the member data. This is the
+        last step of appendData, and is separate so a subclass with a different
+        storage backend can replace how the data is stored.
+        In compact mode, the new rows are compacted before they are merged, so
+        only they are checked for smaller data types.
+        """
+        if self._compact:
+            srcDf = self.__compactData(srcDf)
+            if self.__appendCompact(srcDf):
+                return
+        self._df = self.__mergeSorted(srcDf)
+
+    def __appendCompact(self, srcDf):
+        """
+        Private member function used in compact mode to append compacted rows
+        which are all after the member data straight to the stored data, so
+        the timestamps of the stored rows are not converted again. Returns
+        False, and changes nothing, if the rows cannot be appended this way
+        (they overlap, have other columns or data types, or timestamps finer
+        than 1 ms).
+        """
+        tsMs = self._tsMs
+        if tsMs is None or len(tsMs) == 0 or srcDf.empty:
+            return False
+        tsNs = srcDf.index.asi8
+        if (
+            tsNs[0] <= tsMs[-1] * 1000000
+            or not srcDf.columns.equals(self._dfStored.columns)
+            or not srcDf.dtypes.equals(self._dfStored.dtypes)
+            or (tsNs % 1000000).any()
+        ):
+            return False
+        dfStored = pd.concat(
+            [self._dfStored, srcDf.reset_index(drop=True)], ignore_index=True
+        )
+        tsMs = np.concatenate([tsMs, tsNs // 1000000])
+        self.__dataChanged()
+        self._dfStored = dfStored
+        self._tsMs = tsMs
+        return True
+
+    def _filterConditioned(self, srcDf):
+        """
+        Apply the value query and the start/end queries to conditioned data
+        (sorted, no duplicate timestamps), and return the result. This is the
+        filter step of appendData, for a subclass which loads data that is
+        already conditioned, like data read back from a store.
+        """
+        return self.__filterData(srcDf)
+
+    def _inferTimeOffset(self):
+        """
+        Infer the time period between samples of the member data, and return
+        it as a time offset. This is how the ctor sets the timeOffset property,
+        for a subclass which loads the member data itself.
+        """
+        return self.__inferTimeOffset()
+
+    def __mergeSorted(self, srcDf):
+        """
+        Private member function to merge a conditioned (sorted, no duplicate
+        timestamps) dataframe into the member data, and return the result.
+        If duplicate timestamps exist after the merge, the value from srcDf is
+        kept, the same as appending and keeping the last duplicate.
+
+        Both dataframes are already sorted, so a full sort of the member data
+        is not needed:
+          srcDf is strictly after the member data -- the two are concatenated,
+            and nothing is sorted or checked for duplicates.
+          srcDf overlaps the member data -- only the member rows at or after the
+            first srcDf timestamp are merged with srcDf. Rows before that are
+            kept as is.
+        """
+        dfData = self._df
+        if srcDf.empty:
+            return dfData
+        if dfData.empty:
+            return srcDf
+
+        # Most common case. The new data is all newer than the existing data.
+        if srcDf.index[0] > dfData.index[-1]:
+            return pd.concat([dfData, srcDf])
+
+        # The new data overlaps the existing data. Find where the overlap
+        # starts. Rows before this are not affected by the merge.
+        splitPos = dfData.index.searchsorted(srcDf.index[0], side="left")
+        dfTail = pd.concat([dfData.iloc[splitPos:], srcDf])
+        # Drop duplicates keeping the last (srcDf) value, and merge the two
+        # sorted runs. A stable merge sort of two sorted runs is linear.
+        # The row order is found from the index alone, and the rows are taken
+        # in one step.
+        notDup = np.flatnonzero(~dfTail.index.duplicated(keep="last"))
+        tailOrder = notDup[dfTail.index[notDup].argsort(kind="mergesort")]
+        dfTail = dfTail.take(tailOrder)
+        if splitPos == 0:
+            return dfTail
+        return pd.concat([dfData.iloc[:splitPos], dfTail])
+
+    def replaceData(self, srcDf, IgnoreFirstRows=1):
+        """
+        This function takes a source data frame (srcDf) and replaces the
+        member dataframe with it, as long as srcDf is a dataframe.
+        The column names of the source data are ignored, but
+        it is expected that index is or can be converted to a datetime, and the
+        values are or can be converted to a float.  Use IgnoreFirstRows to set
+        how many rows to throw away before merging the data. Default is 1, so as
+        to ignore a header row. Setting IgnoreFirstRows to 0 will treat every
+        row as data.
+        """
+
+        # Get the source data into a temp dataframe. Use member column names.
+        # This allows something like a dataframe to be used (like a list, dict,
+        # or other dataframe. If it isn't possible to build a dataframe from what
+        # was passed in, print a message and punt.
+
+        try:
+            df_temp = pd.DataFrame(data=srcDf, columns=[self._yName])
+        except ValueError:
+            print(
                 "    WARNING: The data specified for the replaceData function \
 could not be turned into a dataframe. The data was not replaced."
             )
             return
 
-        # drop rows that should be ignored
+        # drop rows that should be ignored. This is a slice, so the data is
+        # not copied.
         if 1 <= IgnoreFirstRows:
-            df_temp.drop(df_temp.index[:IgnoreFirstRows], inplace=True)
+            df_temp = df_temp.iloc[IgnoreFirstRows:]
+
+        # In lazy mode, add a copy of the data to the plan, so changes to the
+        # caller's data before the plan runs are not seen.
+        if self._lazy:
+            self._plan.append(("replace", df_temp.copy()))
+            return
+
+        self.__replaceFrame(df_temp)
+        return
 
+    def __replaceFrame(self, srcDf, ownsData=False):
+        """
+        Private member function to condition and filter a dataframe with the
+        value column, and make it the member data. This is replaceData after
+        the source is turned into a dataframe. ownsData is the same as for
+        __massageData.
+        """
         # condition and filter the passed in dataframe.
         # The member data will be updated.
-        self._df = self.__massageData(df_temp)
+        self._df = self.__massageData(srcDf, ownsData=ownsData)
         self._df = self.__filterData()
+        self._publish()
+
+    def filter(self, valueQuery=None, startQuery=None, endQuery=None):
+        """
+        Filter the member data. valueQuery, startQuery, and endQuery work the
+        same as the ctor arguments, but only apply to the current data. They do
+        not change the queries used to filter appended data.
+
+        The value query is applied to the value column, or if the data has
+        been resampled without the value column, the first column.
+
+        In lazy mode, the filter is added to the plan.
+        """
+        # Convert the start and end times the same way the ctor does.
+        startTs, endTs = self.__queryRange(startQuery, endQuery)
+        valueQuery = "" if valueQuery is None else str(valueQuery).lower()
+
+        if self._lazy:
+            self._plan.append(
+                (
+                    "filter",
+                    {
+                        "valueQuery": valueQuery,
+                        "startQuery": startTs,
+                        "endQuery": endTs,
+                    },
+                )
+            )
+            return
+
+        df_temp = self._df.loc[startTs:endTs]
+        if valueQuery != "" and not df_temp.empty:
+            if self._yName in df_temp.columns:
+                valCol = self._yName
+            else:
+                valCol = df_temp.columns[0]
+            valueMask = _compileValueQuery(valueQuery)
+            if valueMask is not None:
+                df_temp = df_temp[valueMask(df_temp[valCol].to_numpy())]
+            else:
+                try:
+                    df_temp = df_temp.query(
+                        valueQuery.replace("val", "`" + valCol + "`")
+                    )
+                except ValueError:
+                    print(
+                        "    WARNING: Invalid query string. Ignoring the \
+specified query when filtering data."
+                    )
+        self._df = df_temp
+        self._publish()
         return
 
-    def __massageData(self, srcDf=None, forceColNames=False):
+    def __optimizePlan(self, plan):
+        """
+        Private member function to return an optimized copy of a lazy mode
+        plan. Adjacent filters are merged into one filter, and adjacent appends
+        are merged into one append.
+        """
+        optimized = []
+        for step in plan:
+            prevKind = optimized[-1][0] if optimized else None
+            if step[0] == "filter" and prevKind == "filter":
+                prev = optimized[-1][1]
+                cur = step[1]
+                starts = [ts for ts in (prev["startQuery"], cur["startQuery"]) if ts]
+                ends = [ts for ts in (prev["endQuery"], cur["endQuery"]) if ts]
+                queries = [vq for vq in (prev["valueQuery"], cur["valueQuery"]) if vq]
+                optimized[-1] = (
+                    "filter",
+                    {
+                        "valueQuery": " and ".join(["(" + vq + ")" for vq in queries]),
+                        "startQuery": max(starts) if starts else None,
+                        "endQuery": min(ends) if ends else None,
+                    },
+                )
+            elif step[0] == "append" and prevKind == "append":
+                # Appending is kept last on duplicates, so the order is kept.
+                optimized[-1] = ("append", pd.concat([optimized[-1][1], step[1]]))
+            else:
+                optimized.append(step)
+        return optimized
+
+    def __runPlan(self):
+        """
+        Private member function to run the lazy mode plan, if there is one.
+        This is called before the member data is used.
+
+        The plan is optimized first (see __optimizePlan). When a downsample is
+        followed by a filter with a start or end time, the data is trimmed to
+        the rows that can fall into the kept bins before downsampling, so rows
+        that would be thrown away are not resampled.
+        """
+        if not self._plan:
+            return
+        plan = self.__optimizePlan(self._plan)
+        self._plan = []
+        # Run each step in eager mode. The whole plan is published as one
+        # change, once it has run.
+        self._lazy = False
+        self._holdPublish = True
+        try:
+            for i, step in enumerate(plan):
+                # The plan holds copies of the source data (see the ctor,
+                # appendData and replaceData), so they are not copied again.
+                if step[0] == "load":
+                    self.__loadData(step[1], step[2], ownsData=True)
+                elif step[0] == "append":
+                    self.__appendFrame(step[1], ownsData=True)
+                elif step[0] == "replace":
+                    self.__replaceFrame(step[1], ownsData=True)
+                elif step[0] == "filter":
+                    self.filter(**step[1])
+                elif step[0] == "resample":
+                    if i + 1 < len(plan) and plan[i + 1][0] == "filter":
+                        self.__pushDownRange(step[1], plan[i + 1][1])
+                    self.resample(step[1], step[2], step[3], step[4])
+        finally:
+            self._lazy = True
+            self._holdPublish = False
+        self._publish()
+
+    def __pushDownRange(self, resampleArg, filterArgs):
+        """
+        Private member function used by __runPlan. Before a downsample which
+        is followed by a filter with start/end times, trim the member data to
+        the rows that fall in bins which will be kept. Bins are closed and
+        labeled on the right, so a bin labeled t holds rows after t - period,
+        up to and including t.
+        Only done for fixed periods that divide evenly into a day, so the bin
+        edges do not change when the first row changes.
+        """
+        if self._df.empty or not isinstance(self._timeOffset, pd.DateOffset):
+            return
+        try:
+            resampleTo = to_offset(resampleArg)
+        except (ValueError, TypeError):
+            return
+        if (
+            not isinstance(resampleTo, pd.offsets.Tick)
+            or resampleTo <= self._timeOffset
+        ):
+            return
+        period = pd.Timedelta(resampleTo)
+        if pd.Timedelta("1D") % period != pd.Timedelta(0):
+            return
+        startTs = filterArgs["startQuery"]
+        endTs = filterArgs["endQuery"]
+        if startTs is not None:
+            startTs = startTs - period + pd.Timedelta(1, "ns")
+        if startTs is not None or endTs is not None:
+            self._df = self._df.loc[startTs:endTs]
+
+    @classmethod
+    def from_csv(
+        cls,
+        path,
+        name,
+        tsName=None,
+        yName=None,
+        valueQuery=None,
+        startQuery=None,
+        endQuery=None,
+        sourceTimeFormat="%m/%d/%Y %H:%M:%S.%f",
+        forceColNames=False,
+        chunksize=100000,
+        **readCsvArgs
+    ):
+        """
+        Alternate constructor which builds a TsIdxData object by streaming a csv
+        file in chunks, rather than requiring the whole source to already be
+        loaded as a dataframe.
+
+        Each chunk of chunksize rows is read, the timestamps and values are
+        converted, and the value query and start/end queries are applied before
+        the chunk is kept. Only the filtered rows of each chunk are held in
+        memory (and the timestamps of the rows the value query drops, so a
+        duplicate timestamp in a later chunk is handled the same as the ctor),
+        so peak memory tracks the size of the filtered result rather than the
+        size of the raw file.
+
+        The name, tsName, yName, valueQuery, startQuery, endQuery,
+        sourceTimeFormat, and forceColNames arguments are the same as the
+        constructor arguments. Any additional keyword arguments (usecols, sep,
+        skiprows, etc.) are passed along to pandas.read_csv.
+        """
+        # Build an empty object so the name and query arguments are validated
+        # and converted the same way as the normal ctor.
+        obj = cls(
+            name,
+            tsName=tsName,
+            yName=yName,
+            df=None,
+            valueQuery=valueQuery,
+            startQuery=startQuery,
+            endQuery=endQuery,
+            sourceTimeFormat=sourceTimeFormat,
+            forceColNames=forceColNames,
+        )
+
+        # Read, condition, and filter the file one chunk at a time. Only the
+        # filtered chunks are kept, along with the timestamps of the rows in
+        # the time range that the value query dropped. A later duplicate
+        # timestamp replaces an earlier one (the same as the ctor), so a
+        # dropped row also drops a row kept from an earlier chunk.
+        filteredChunks = []
+        eventTs = []
+        eventDropped = []
+        for chunk in pd.read_csv(path, chunksize=chunksize, **readCsvArgs):
+            dfChunk = obj.__massageData(
+                srcDf=chunk, forceColNames=forceColNames, ownsData=True
+            )
+            del chunk
+            dfKept = obj.__filterData(dfChunk)
+            droppedTs = dfChunk.loc[obj._startQuery : obj._endQuery].index
+            if len(droppedTs) != len(dfKept.index):
+                droppedTs = droppedTs.difference(dfKept.index)
+            else:
+                droppedTs = droppedTs[:0]
+            del dfChunk
+            eventTs += [dfKept.index, droppedTs]
+            eventDropped += [
+                np.zeros(len(dfKept.index), dtype=bool),
+                np.ones(len(droppedTs), dtype=bool),
+            ]
+            if not dfKept.empty:
+                filteredChunks.append(dfKept)
+
+        # Chunks are each sorted and without duplicates, but duplicate
+        # timestamps can span chunk boundaries, and the file is not required
+        # to be sorted. Drop duplicates keeping the last one found, and only
+        # sort if needed. Then drop the kept rows whose timestamp was last seen
+        # in a dropped row.
+        dfAll = None
+        if filteredChunks:
+            dfAll = pd.concat(filteredChunks, copy=False)
+            del filteredChunks
+            if not dfAll.index.is_unique:
+                dfAll = dfAll[~dfAll.index.duplicated(keep="last")]
+            if not dfAll.index.is_monotonic_increasing:
+                dfAll.sort_index(inplace=True)
+            eventDropped = np.concatenate(eventDropped)
+            if eventDropped.any():
+                eventTs = eventTs[0].append(eventTs[1:])
+                isLast = ~eventTs.duplicated(keep="last")
+                droppedTs = eventTs[isLast & eventDropped].asi8
+                dfAll = dfAll[~np.isin(dfAll.index.asi8, droppedTs)]
+        del eventTs, eventDropped
+
+        # Nothing left after filtering. Leave the object empty.
+        if dfAll is None or dfAll.empty:
+            print(
+                "    WARNING: No data from "
+                + str(path)
+                + " remains after filtering. "
+                + obj.name
+                + " is empty."
+            )
+            return obj
+
+        obj._df = dfAll
+        obj._timeOffset = obj.__inferTimeOffset()
+        obj._publish()
+        return obj
+
+    def save(self, path, rowGroupSize=100000):
+        """
+        Save the (already massaged and filtered) data to a parquet file, along
+        with the settings needed to rebuild the object: name, tsName, yName,
+        valueQuery, startQuery, endQuery, sourceTimeFormat, and timeOffset.
+
+        The data is written in row groups of rowGroupSize rows. The row groups
+        are in time order, so load() can skip the ones outside a requested
+        time range.
+
+        Requires the pyarrow library.
+        """
+        self.__runPlan()
+        pa, pq = _importPyarrow()
+
+        # Settings are kept as text in the file metadata.
+        meta = {
+            "name": self._name,
+            "tsName": self._tsName,
+            "yName": self._yName,
+            "valueQuery": self._vq,
+            "startQuery": None
+            if self._startQuery is None
+            else pd.Timestamp(self._startQuery).isoformat(),
+            "endQuery": None
+            if self._endQuery is None
+            else pd.Timestamp(self._endQuery).isoformat(),
+            "sourceTimeFormat": self._sourceTimeFormat,
+            "timeOffset": None
+            if not isinstance(self._timeOffset, pd.DateOffset)
+            else self._timeOffset.freqstr,
+        }
+
+        # The timestamp index is stored as the first column.
+        table = pa.Table.from_pandas(self._df, preserve_index=True)
+        table = table.replace_schema_metadata(
+            {
+                **(table.schema.metadata or {}),
+                b"bpsTsIdxData": json.dumps(meta).encode("utf-8"),
+            }
+        )
+        pq.write_table(table, path, row_group_size=max(int(rowGroupSize), 1))
+        return
+
+    @classmethod
+    def load(
+        cls,
+        path,
+        mmap=True,
+        startTs=None,
+        endTs=None,
+        compact=False,
+        compactTolerance=1e-6,
+        lazy=False,
+    ):
+        """
+        Alternate constructor which builds a TsIdxData object from a parquet
+        file written by save(). The data is not massaged or filtered again.
+
+        If mmap is True (default), the file is memory mapped rather than read
+        into a buffer, and the values are converted to a dataframe without
+        copying where possible.
+
+        If startTs and/or endTs are specified, only the data in that time range
+        is loaded. Row groups entirely outside the range are not read. They
+        are converted the same way as the ctor startQuery and endQuery, so an
+        endTs without a time loads the whole day.
+
+        compact, compactTolerance, and lazy are the same as the ctor arguments.
+
+        Requires the pyarrow library.
+        """
+        pq = _importPyarrow()[1]
+
+        pqFile = pq.ParquetFile(path, memory_map=mmap)
+        try:
+            meta = json.loads(pqFile.schema_arrow.metadata[b"bpsTsIdxData"])
+        except (KeyError, TypeError) as ke:
+            print(
+                "    ERROR: "
+                + str(path)
+                + " was not written by TsIdxData.save(). It cannot be loaded."
+            )
+            raise ke
+
+        # compact and lazy are only passed when set, so a subclass without
+        # them (like TsIdxRingData) can still be loaded.
+        modeArgs = {}
+        if compact:
+            modeArgs["compact"] = True
+            modeArgs["compactTolerance"] = compactTolerance
+        if lazy:
+            modeArgs["lazy"] = True
+        obj = cls(
+            meta["name"],
+            tsName=meta["tsName"],
+            yName=meta["yName"],
+            df=None,
+            valueQuery=meta["valueQuery"] or None,
+            startQuery=meta["startQuery"],
+            endQuery=meta["endQuery"],
+            sourceTimeFormat=meta["sourceTimeFormat"],
+            **modeArgs
+        )
+
+        # Only read the row groups that overlap the time range.
+        startTs = _toQueryTs(startTs)
+        endTs = _toQueryTs(endTs, isEnd=True)
+        filters = []
+        if startTs is not None:
+            filters.append((meta["tsName"], ">=", startTs))
+        if endTs is not None:
+            filters.append((meta["tsName"], "<=", endTs))
+        table = pq.read_table(
+            path, memory_map=mmap, filters=filters if filters else None
+        )
+
+        # split_blocks and self_destruct let each column be converted without
+        # consolidating into a new block, which avoids copies.
+        dfLoaded = table.to_pandas(split_blocks=True, self_destruct=True)
+        del table
+        if dfLoaded.index.name != meta["tsName"]:
+            dfLoaded.set_index(meta["tsName"], inplace=True)
+
+        obj._df = dfLoaded
+        if meta["timeOffset"] is not None:
+            obj._timeOffset = to_offset(meta["timeOffset"])
+        elif not dfLoaded.empty:
+            obj._timeOffset = obj.__inferTimeOffset()
+        obj._publish()
+        return obj
+
+    def snapshot(self):
+        """
+        Return the last published TsIdxSnapshot, an unchanging view of the
+        data. This does not lock or copy, so it can be called often from any
+        thread, while one writer thread changes the data. A reader keeps using
+        the same snapshot for a consistent view, and calls snapshot() again to
+        see newer data.
+        In lazy mode, the plan is not run, as that would change the data. The
+        snapshot has the data as of the last time the plan was run.
+        """
+        snap = self._snapshot
+        if snap is None:
+            # Made without a publish (like a subclass ctor). Publish now.
+            self._publish()
+            snap = self._snapshot
+        return snap
+
+    def _publish(self):
+        """
+        Publish the current data as a new snapshot. Called by the writer when
+        a change is complete. The snapshot is made first, and then stored in
+        one assignment, so readers see the old or the new snapshot, never a
+        mix.
+        """
+        if self._holdPublish:
+            return
+        self._snapshot = TsIdxSnapshot(
+            self._dataVersion,
+            self._name,
+            self._tsName,
+            self._yName,
+            self._timeOffset,
+            self._snapshotFrame(),
+        )
+
+    def _snapshotFrame(self):
+        """
+        Return the member data for a snapshot, as a dataframe or a function
+        which returns one. The member data is replaced (never changed in place)
+        when it changes, and does not share arrays with the caller's data (see
+        __massageData), so the snapshot can hold it without a copy. In
+        compact mode, the dataframe view is shared if it has been built, or
+        else built by the snapshot when first used, from the stored data.
+        """
+        if self._tsMs is None:
+            return self._dfStored
+        if self._compactViewVersion == self._dataVersion:
+            return self._compactView
+        dfStored = self._dfStored
+        tsMs = self._tsMs
+        tsName = self._tsName
+
+        def _buildView():
+            dfView = dfStored.copy(deep=False)
+            dfView.index = pd.DatetimeIndex(
+                (tsMs * 1000000).view("datetime64[ns]"), name=tsName
+            )
+            return dfView
+
+        return _buildView
+
+    def __massageData(self, srcDf=None, forceColNames=False, ownsData=False):
         """
         Private member function to massage a specified dataframe, and return
         the resulting dataframe.
@@ -786,6 +3650,11 @@ could not be turned into a dataframe. The data was not replaced."
         string in self._tsName, and the value name must match the string in
         self._yName.
 
+        The returned dataframe never shares data with a source passed in by a
+        caller, so later changes to the caller's data do not change it. If
+        ownsData is true, nothing else uses srcDf (for example a chunk just
+        read from a file), and its data can be kept without a copy.
+
         Returns a DataFrame
 
         Exceptions raised:
@@ -799,11 +3668,18 @@ could not be turned into a dataframe. The data was not replaced."
         # do this as a work around
         if srcDf is None:
             srcDf = self._df
+            ownsData = True
 
         # make sure a dataframe, or something that can be converted to
         # dataframe is passed in, otherwise leave.
+        # A dataframe is shallow copied. This does not copy the data, but
+        # changing the columns or index below does not change the caller's
+        # dataframe.
         try:
-            df_srcTemp = pd.DataFrame(srcDf)
+            if isinstance(srcDf, pd.DataFrame):
+                df_srcTemp = srcDf.copy(deep=False)
+            else:
+                df_srcTemp = pd.DataFrame(srcDf)
         except TypeError as te:
             print(
                 "    ERROR Processing "
@@ -839,9 +3715,11 @@ be converted to a dataframe. No data was changed."
                 # be the timestamp column and name it. Otherwise, assume the
                 # leftmost column is the timestamp.
                 if "datetime64[ns]" == df_srcTemp.index.dtype:
-                    df_srcTemp.index.rename(self._tsName, inplace=True)
+                    df_srcTemp.index = df_srcTemp.index.rename(self._tsName)
                 else:
-                    df_srcTemp.rename(columns={dfCols[0]: self._tsName}, inplace=True)
+                    df_srcTemp = df_srcTemp.rename(
+                        columns={dfCols[0]: self._tsName}, copy=False
+                    )
 
             # value column name
             if self._yName in dfCols:
@@ -854,9 +3732,13 @@ be converted to a dataframe. No data was changed."
                 # If the index is a datetime, assume the value is the 1st column,
                 # otherwise, assume the value is the second column.
                 if "datetime64[ns]" == df_srcTemp.index.dtype:
-                    df_srcTemp.rename(columns={dfCols[0]: self._yName}, inplace=True)
+                    df_srcTemp = df_srcTemp.rename(
+                        columns={dfCols[0]: self._yName}, copy=False
+                    )
                 else:
-                    df_srcTemp.rename(columns={dfCols[1]: self._yName}, inplace=True)
+                    df_srcTemp = df_srcTemp.rename(
+                        columns={dfCols[1]: self._yName}, copy=False
+                    )
 
             # update the column and index names
             dfCols = df_srcTemp.columns
@@ -927,35 +3809,30 @@ value into a float. The conversion did the best conversion possible."
                     "float", errors="ignore"
                 )
 
-        # As an intermediate step, we want the df_srcTemp to have the timestamp as a
-        # datetime value column (not the index) so we can more easily drop dups,
-        # round time, etc.  The following matrix is used to decide what to do
-        # ----------------------------------------------------------------------------
-        # idx name      |col name   |           |
-        # matches       |matches    |datetype is|
-        # self._tsName  |self._yName|datetime   |action
-        # ----------------------------------------------------------------------------
-        # No            | No        | don't care| Delt with above. Not poss. here
-        # ----------------------------------------------------------------------------
-        # Yes           | No        | No        | Reset index to a val col
-        #               |           |           | Change datatype to datetime
+        # The timestamp can be the index or a value column. The following
+        # matrix is used to decide where to get it from.
         # ----------------------------------------------------------------------------
-        # Yes           | No        | Yes       | Reset index to val col
+        # idx name      |col name    |
+        # matches       |matches     |
+        # self._tsName  |self._tsName|action
         # ----------------------------------------------------------------------------
-        # Yes           | Yes       | No        | Drop col
-        #               |           |           | Reset index to a val col
-        #               |           |           | Change datatype to datetime
+        # No            | No         | Delt with above. Not poss. here
         # ----------------------------------------------------------------------------
-        # Yes           | Yes       | Yes       | Drop col
-        #               |           |           | Reset index to a val col
+        # Yes           | No         | Use the index
         # ----------------------------------------------------------------------------
-        # No            | Yes       | No        | Change datatype to datetime
+        # Yes           | Yes        | Use the index, drop the col
         # ----------------------------------------------------------------------------
-        # No            | Yes       | Yes       | No action needed here
+        # No            | Yes        | Use the col, and drop it
         # ----------------------------------------------------------------------------
+        #
+        # The timestamps and values are conditioned as arrays, and the rows to
+        # keep (in time order) are found. The rows are then taken from the
+        # source data in one step, so the data is copied at most once. If every
+        # row is kept in the same order, the data is copied only if it belongs
+        # to the caller.
 
         # See if there is an index and column that match the timestamp name.
-        # If there is, print a message, and drop the column.
+        # If there is, print a message. The column is dropped below.
         if self._tsName == dfIndex and (self._tsName in dfCols):
             print(
                 "Processing "
@@ -966,74 +3843,168 @@ both match the timestamp name "'
                 + '". Dropping the column, \
 and keeping the index.'
             )
-            df_srcTemp.drop(columns=[self._tsName], inplace=True, errors="ignore")
+        if self._tsName == dfIndex and "datetime64[ns]" == df_srcTemp.index.dtype:
+            # Already datetimes. The index is used as is, without a copy.
+            tsIndex = df_srcTemp.index.rename(self._tsName)
+        else:
+            if self._tsName == dfIndex:
+                tsSeries = pd.Series(df_srcTemp.index, copy=False)
+            else:
+                tsSeries = pd.Series(df_srcTemp[self._tsName].to_numpy(), copy=False)
 
-        # Now see if the index name matches the timestamp name. If it does,
-        # reset the index so the indexed timestamp becomes a normal value column.
-        if self._tsName == dfIndex:
-            df_srcTemp.reset_index(drop=False, inplace=True)
-
-        # Now there is a timestamp value column. See if it is the correct datatype.
-        # Convert it if needed.
-        if "datetime64[ns]" != df_srcTemp[self._tsName].dtype:
-            try:
-                # For changing to timestamps, coerce option for errors may  mark
-                # some dates as NaT.
-                # Try it with raise first and then resort to coerce if needed.
-                df_srcTemp[self._tsName] = pd.to_datetime(
-                    df_srcTemp[self._tsName],
-                    errors="raise",
-                    format=self._sourceTimeFormat,
-                    exact=False,
-                    # infer_datetime_format = True,
-                    origin="unix",
-                )
-            except ValueError as ve:
-                print(
-                    "    WARNING: Processing "
-                    + self._name
-                    + ". There was \
-a problem converting some timestamps. Timestamps may be incorrect, and/or some \
-rows may be missing."
-                )
-                print(ve)
-                df_srcTemp[self._tsName] = pd.to_datetime(
-                    df_srcTemp[self._tsName],
-                    errors="coerce",
-                    infer_datetime_format=True,
-                    origin="unix",
-                )
+            # See if the timestamps are the correct datatype. Convert them if
+            # needed.
+            if "datetime64[ns]" != tsSeries.dtype:
+                tsSeries = self.__parseTimestamps(tsSeries)
+            tsIndex = pd.DatetimeIndex(tsSeries, name=self._tsName)
 
         # Now the column names and data types are correct.
         # Condition the data and (re)index it.
         # Get rid of any NaN/NaT values in either column. These can be from the
         # original data or from invalid conversions to float or datetime.
-        df_srcTemp.dropna(subset=[self._tsName, self._yName], how="any", inplace=True)
-        # Rround the timestamp to the nearest ms. Unseen ns and
+        keepRows = ~(tsIndex.isna() | pd.isna(df_srcTemp[self._yName].to_numpy()))
+        allKept = keepRows.all()
+        rowPos = None
+        if not allKept:
+            tsIndex = tsIndex[keepRows]
+            rowPos = np.flatnonzero(keepRows)
+
+        # Round the timestamp to the nearest ms. Unseen ns and
         # fractional ms values are not always displayed, and can cause
-        # unexpected merge and up/downsample results.
-        try:
-            df_srcTemp[self._tsName] = df_srcTemp[self._tsName].dt.round("L")
-        except ValueError as ve:
-            print("    WARNING: Timestamp cannot be rounded.")
-            print(ve)
-
-        # Get rid of any duplicate timestamps. Done after rounding in case rouding
-        # introduced dups.
-        df_srcTemp.drop_duplicates(subset=self._tsName, keep="last", inplace=True)
+        # unexpected merge and up/downsample results. Timestamps already in
+        # whole ms are not rounded, which would copy them.
+        if (tsIndex.asi8 % 1000000).any():
+            try:
+                tsIndex = tsIndex.round("L")
+            except ValueError as ve:
+                print("    WARNING: Timestamp cannot be rounded.")
+                print(ve)
 
-        # Now the data type is correct, and foreseen data errors are removed.
-        # Set the index to the timestamp column and sort it.
-        # Set the member dataframe to the massaged data
-        df_srcTemp.set_index(self._tsName, inplace=True)
+        # Sort by timestamp, if needed. The sort is stable, so duplicate
+        # timestamps stay in the order they were in.
+        if not tsIndex.is_monotonic_increasing:
+            sortOrder = tsIndex.argsort(kind="stable")
+            if rowPos is None:
+                rowPos = sortOrder
+            else:
+                rowPos = rowPos[sortOrder]
+            tsIndex = tsIndex[sortOrder]
+
+        # Get rid of any duplicate timestamps, keeping the last one. Done
+        # after rounding in case rounding introduced dups. The timestamps are
+        # sorted, so duplicates are next to each other, and no hash table is
+        # needed to find them.
+        tsNs = tsIndex.asi8
+        isLast = np.ones(len(tsNs), dtype=bool)
+        np.not_equal(tsNs[1:], tsNs[:-1], out=isLast[:-1])
+        if not isLast.all():
+            lastPos = np.flatnonzero(isLast)
+            if rowPos is None:
+                rowPos = lastPos
+            else:
+                rowPos = rowPos[lastPos]
+            tsIndex = tsIndex[lastPos]
+
+        # Take the rows needed (the only copy of the data), drop a timestamp
+        # column, and set the index to the timestamps. Clean data from the
+        # caller is copied, so the member data does not share the caller's
+        # arrays. The peak memory of this is measured by the ctor operation
+        # of bpsTsIdxBench.py (peakMB, and checkIngestMemory). The timestamp
+        # column is dropped first, so it is not copied.
+        if self._tsName in df_srcTemp.columns:
+            del df_srcTemp[self._tsName]
+        if rowPos is not None:
+            df_srcTemp = df_srcTemp.take(rowPos)
+        elif not ownsData:
+            df_srcTemp = df_srcTemp.copy()
+        df_srcTemp.index = tsIndex
 
         # All done. Data in indexed by timestamp, and there is a correctly
         # named value column.  There are no NaN/NaT values, timestamps have been
         # rounded to mSec, and there are no duplicate timestamps.
-        return df_srcTemp.sort_index(inplace=False)
+        return df_srcTemp
 
         # end of def __massageData(self, srcDf):
 
+    def __parseTimestamps(self, tsSeries):
+        """
+        Private member function to convert a series of timestamps (usually
+        strings) to datetimes, and return the converted series.
+
+        Historian exports repeat many timestamps, so each unique value is only
+        converted once, and the results are spread back over the series.
+
+        The unique values are converted using the first of these that works:
+          fixed  -- A fast parser for fixed width layouts like the default
+                    "%m/%d/%Y %H:%M:%S.%f" (see _parseFixedLayout).
+          format -- pandas to_datetime using sourceTimeFormat.
+          infer  -- pandas to_datetime inferring the format. Values that cannot
+                    be converted become NaT, and a warning is printed.
+        The fixed or format conversion that works is remembered by the object,
+        and is tried first the next time, so later appendData calls go
+        straight to it. It is not shared with other objects, whose sources may
+        have a different layout with the same sourceTimeFormat.
+        """
+        # Find the unique values. codes maps each row to its unique value,
+        # and is -1 for missing values.
+        codes, uniques = pd.factorize(tsSeries, sort=False)
+
+        converters = ["fixed", "format"]
+        if self._tsConverter is not None:
+            converters.remove(self._tsConverter)
+            converters.insert(0, self._tsConverter)
+
+        parsed = None
+        for converter in converters:
+            if converter == "fixed":
+                tsNs = _parseFixedLayout(uniques, self._sourceTimeFormat)
+                if tsNs is not None:
+                    parsed = pd.DatetimeIndex(tsNs.view("datetime64[ns]"))
+            else:
+                try:
+                    parsed = pd.DatetimeIndex(
+                        pd.to_datetime(
+                            uniques,
+                            errors="raise",
+                            format=self._sourceTimeFormat,
+                            exact=False,
+                            origin="unix",
+                        )
+                    )
+                except (ValueError, TypeError) as ve:
+                    convertErr = ve
+            if parsed is not None:
+                self._tsConverter = converter
+                break
+
+        if parsed is None:
+            # For changing to timestamps, coerce option for errors may mark
+            # some dates as NaT.
+            print(
+                "    WARNING: Processing "
+                + self._name
+                + ". There was \
+a problem converting some timestamps. Timestamps may be incorrect, and/or some \
+rows may be missing."
+            )
+            print(convertErr)
+            parsed = pd.DatetimeIndex(
+                pd.to_datetime(
+                    uniques,
+                    errors="coerce",
+                    infer_datetime_format=True,
+                    origin="unix",
+                )
+            )
+
+        # Spread the converted unique values back over the rows. Missing
+        # values become NaT.
+        return pd.Series(
+            parsed.take(codes, allow_fill=True, fill_value=pd.NaT),
+            index=tsSeries.index,
+            name=tsSeries.name,
+        )
+
     def __filterData(self, srcDf=None):
         """
         Private member function to apply the value query and the timestamp filter
@@ -1049,8 +4020,12 @@ rows may be missing."
 
         # make sure a dataframe, or something that can be converted to a
         # dataframe is passed in, otherwise leave.
+        # A dataframe is used as is, rather than copied.
         try:
-            df_temp = pd.DataFrame(srcDf)
+            if isinstance(srcDf, pd.DataFrame):
+                df_temp = srcDf
+            else:
+                df_temp = pd.DataFrame(srcDf)
         except TypeError as te:
             print(
                 "    ERROR Processing "
@@ -1062,13 +4037,28 @@ be converted to a dataframe. No data was changed."
             print(te)
             raise te
 
+        # Timestamp is the index, so filter based on the specified
+        # start and end times.
+        # Non specified times will be None, so the filter still works as
+        # is. If both are none, no filtering is performed.
+        # This is a slice, so it is done first. It does not copy the data, and
+        # the query below only looks at the rows in the time range.
+        df_temp = df_temp.loc[self._startQuery : self._endQuery]
+
         # Apply the query string if one is specified.
-        # Replace "val" with the column name.
-        if self._vq != "":
+        # Use the compiled mask if the query could be compiled. It is a single
+        # vectorized pass over the values. If every row passes, nothing is
+        # copied.
+        if self._vqMask is not None:
+            valueMask = self._vqMask(df_temp[self._yName].to_numpy())
+            if not valueMask.all():
+                df_temp = df_temp[valueMask]
+        elif self._vq != "":
+            # Not compiled. Replace "val" with the column name and use query.
             queryStr = self._vq.replace("val", self._yName)
             # try to run the query string, but ignore it on error
             try:
-                df_temp.query(queryStr, inplace=True)
+                df_temp = df_temp.query(queryStr)
 
             except ValueError:
                 print(
@@ -1076,12 +4066,7 @@ be converted to a dataframe. No data was changed."
 specified query when appending data."
                 )
 
-        # Timestamp is the index, so filter based on the specified
-        # start and end times.
-        # Non specified times will be None, so the filter still works as
-        # is. If both are none, no filtering is performed.
-        # Either way, set the member dataframe to the result
-        return df_temp.loc[self._startQuery : self._endQuery]
+        return df_temp
         # end of def __filterData(self, srcDf=None):
 
     # read only properties
@@ -1093,6 +4078,10 @@ specified query when appending data."
     def tsName(self):
         return self._tsName
 
+    @property
+    def yName(self):
+        return self._yName
+
     @property
     def valueQuery(self):
         return self._vq
@@ -1107,35 +4096,467 @@ specified query when appending data."
 
     @property
     def indexName(self):
+        self.__runPlan()
         return self._df.index.name
 
     @property
     def index(self):
+        self.__runPlan()
         return self._df.index
 
     @property
     def columns(self):
+        self.__runPlan()
         # this dictionary will include column names as the key and the data
         # type as a value
         # {col name : datatype, ...}
         return dict(self._df.dtypes)
 
+    @property
+    def _df(self):
+        # The member dataframe. Outside of compact mode, this is the stored
+        # dataframe. In compact mode, a dataframe view with a datetime index
+        # is built when first used, and kept until the data changes. The
+        # columns are shared with the stored data, so only the index is new.
+        # Paths which only need the timestamps use _tsMs rather than building
+        # the view.
+        if self._tsMs is None:
+            return self._dfStored
+        if self._compactViewVersion != self._dataVersion:
+            dfView = self._dfStored.copy(deep=False)
+            dfView.index = pd.DatetimeIndex(
+                (self._tsMs * 1000000).view("datetime64[ns]"), name=self._tsName
+            )
+            self._compactView = dfView
+            self._compactViewVersion = self._dataVersion
+            # The snapshot of this data version shares the view, rather than
+            # building its own.
+            snap = self._snapshot
+            if (
+                snap is not None
+                and snap._version == self._dataVersion
+                and callable(snap._frame)
+            ):
+                snap._frame = dfView
+        return self._compactView
+
+    @_df.setter
+    def _df(self, srcDf):
+        self.__dataChanged()
+        if not self._compact or not isinstance(
+            getattr(srcDf, "index", None), pd.DatetimeIndex
+        ):
+            self._dfStored = srcDf
+            return
+        self._dfStored = self.__compactData(srcDf)
+        # The index can be held as milliseconds if it has nothing finer.
+        tsNs = srcDf.index.asi8
+        if not srcDf.index.hasnans and not (tsNs % 1000000).any():
+            self._tsMs = tsNs // 1000000
+            self._dfStored = self._dfStored.reset_index(drop=True)
+
+    def __dataChanged(self):
+        """
+        Private member function called when the member data is replaced. Bumps
+        the data version, and drops what was kept for the old data.
+        """
+        self._dataVersion += 1
+        # Cached resample results are for the old data
+        if self._resampleCache:
+            self._resampleCache.clear()
+        self._tsMs = None
+        self._compactView = None
+
+    def __compactData(self, srcDf):
+        """
+        Private member function used in compact mode to return the columns of
+        srcDf in smaller data types. Float columns become float32 if every
+        value stays within the compact tolerance. String columns where at most
+        half the values are unique become categoricals. Columns which are
+        already float32 or categorical are kept without being checked, so
+        appending compacted rows to the stored data only checks the new rows
+        (see _appendConditioned). The columns are not copied.
+        """
+        # Columns are keyed by position, so duplicate names are kept.
+        compactCols = {}
+        for colNum, col in enumerate(srcDf.columns):
+            colData = srcDf.iloc[:, colNum]
+            if colData.dtype == "float64":
+                vals = colData.to_numpy()
+                vals32 = vals.astype("float32")
+                with np.errstate(over="ignore", invalid="ignore"):
+                    fits = np.allclose(
+                        vals32,
+                        vals,
+                        rtol=self._compactTolerance,
+                        atol=0.0,
+                        equal_nan=True,
+                    )
+                if fits:
+                    colData = pd.Series(vals32, index=srcDf.index, name=col)
+            elif colData.dtype == "object" and len(colData) > 0:
+                if colData.nunique(dropna=True) <= len(colData) // 2:
+                    colData = colData.astype("category")
+            compactCols[colNum] = colData
+        dfCompact = pd.DataFrame(compactCols, index=srcDf.index, copy=False)
+        dfCompact.columns = srcDf.columns
+        return dfCompact
+
+    @property
+    def memoryUsage(self):
+        self.__runPlan()
+        if self._tsMs is not None:
+            # Use the stored data, so the datetime index is not built just to
+            # measure it.
+            dfData = self._dfStored
+            indexBytes = self._tsMs.nbytes
+        else:
+            dfData = self._df
+            indexBytes = dfData.index.memory_usage(deep=True)
+        colBytes = dfData.memory_usage(index=False, deep=True)
+        numCols = dfData.select_dtypes(include="number").columns
+        valueBytes = int(colBytes[numCols].sum())
+        extraBytes = int(colBytes.sum()) - valueBytes
+        return {
+            "index": int(indexBytes),
+            "values": valueBytes,
+            "extras": extraBytes,
+            "total": int(indexBytes) + valueBytes + extraBytes,
+        }
+
+    @property
+    def rollingData(self):
+        self.__runPlan()
+        if self._rollingVersion != self._dataVersion:
+            self.__computeRolling()
+        # The results for the rows in the data are the last rows held.
+        dataCount = self.count
+        rollingVals = self._rollingVals[
+            self._rollingLen - dataCount : self._rollingLen
+        ].view()
+        rollingVals.flags.writeable = False
+        return pd.DataFrame(
+            rollingVals,
+            index=self._df.index,
+            columns=list(self._rollingStats.keys()),
+            copy=False,
+        )
+
     @property
     def data(self):
-        return self._df
+        self.__runPlan()
+        return _readOnlyView(self._df)
 
     @property
     def timeOffset(self):
+        self.__runPlan()
         return self._timeOffset
 
+    @property
+    def frequencyInfo(self):
+        self.__runPlan()
+        # Estimated once for each version of the member data, and kept until
+        # the data changes.
+        if self._freqInfoVersion != self._dataVersion:
+            self._freqInfo = estimateFrequency(self.__timestampsNs())
+            self._freqInfoVersion = self._dataVersion
+        return self._freqInfo
+
     @property
     def startTs(self):
+        self.__runPlan()
         # assumes index is sorted and start is at the top
+        if self._tsMs is not None:
+            return pd.Timestamp(self._tsMs[0], unit="ms")
         return self._df.index[0]
 
     @property
     def endTs(self):
+        self.__runPlan()
         # assumes index is sorted and end is at the bottom
+        if self._tsMs is not None:
+            return pd.Timestamp(self._tsMs[-1], unit="ms")
+        return self._df.index[-1]
+
+    @property
+    def count(self):
+        self.__runPlan()
+        if self._tsMs is not None:
+            return len(self._tsMs)
+        return len(self._df.index)
+
+    @property
+    def isEmpty(self):
+        self.__runPlan()
+        if self._tsMs is not None:
+            return self._dfStored.empty
+        return self._df.empty
+
+
+class TsIdxUpsampledView(object):
+    """
+    Class: TsIdxUpsampledView
+    File: bpsTsIdxData.py
+
+    Virtual upsampled view of TsIdxData
+
+    Made using TsIdxData.upsampledView(resampleArg, interpolate). The view
+    has the rows resample() would make when upsampling, but they are not
+    built. Values are calculated when asked for, by binary search of the
+    original timestamps, so the cost tracks the number of values asked for
+    rather than the number of upsampled rows.
+
+    The view holds the original timestamps and values (without copying them),
+    as they were when the view was made.
+
+    Methods
+        range(startQuery=None, endQuery=None)
+            Return a dataframe with the upsampled rows from startQuery to
+            endQuery. The queries work the same as the TsIdxData ctor
+            arguments.
+
+        valuesAt(times)
+            Return an array of the values at any times (anything that can be
+            converted to a DatetimeIndex), on the grid or not.
+
+    The following read only properties are implemented
+        name, tsName, yName
+            the same as the TsIdxData the view was made from
+
+        timeOffset
+            the upsampled period
+
+        interpolate
+            "step", "linear", or "nearest". See TsIdxData.resample
+
+        startTs, endTs
+            the first and last times of the upsampled rows
+
+        count
+            the number of upsampled rows
+
+        data
+            a dataframe with all the upsampled rows. This builds every row.
+    """
+
+    def __init__(self, name, tsName, yName, tsNs, vals, timeOffset, interpolate):
+        """
+        TsIdxUpsampledView constructor (ctor). Details are in above class
+        description.
+        """
+        self._name = name
+        self._tsName = tsName
+        self._yName = yName
+        self._tsNs = tsNs
+        self._vals = vals
+        self._timeOffset = timeOffset
+        self._interpolate = interpolate
+        self._periodNs = pd.Timedelta(timeOffset).value
+        if len(tsNs) > 0:
+            self._gridFirstNs, self._gridLastNs = _upsampleGrid(
+                int(tsNs[0]), int(tsNs[-1]), self._periodNs
+            )
+        else:
+            self._gridFirstNs = 0
+            self._gridLastNs = -self._periodNs
+
+    def __repr__(self):
+        outputMsg = "{:13} {}".format("\nName: ", self._name + "\n")
+        outputMsg += "{:13} {}".format("Period: ", str(self._timeOffset) + "\n")
+        outputMsg += "{:13} {}".format("Interpolate: ", self._interpolate + "\n")
+        outputMsg += "{:13} {}".format("Rows: ", str(self.count) + "\n")
+        return outputMsg
+
+    def __frame(self, gridNs):
+        """
+        Private member function to return a dataframe of the values at the
+        grid times gridNs.
+        """
+        tsIndex = pd.DatetimeIndex(gridNs.view("datetime64[ns]"), name=self._tsName)
+        return pd.DataFrame(
+            {
+                self._yName: _interpolateAt(
+                    self._tsNs, self._vals, gridNs, self._interpolate
+                )
+            },
+            index=tsIndex,
+        )
+
+    def range(self, startQuery=None, endQuery=None):
+        """
+        Return a dataframe with the upsampled rows from startQuery to endQuery
+        (inclusive). Only the rows in range are calculated.
+        """
+        startTs = _toQueryTs(startQuery)
+        endTs = _toQueryTs(endQuery, isEnd=True)
+        firstNs = self._gridFirstNs
+        lastNs = self._gridLastNs
+        if startTs is not None and startTs.value > firstNs:
+            # first grid time at or after startTs
+            firstNs += -((firstNs - startTs.value) // self._periodNs) * self._periodNs
+        if endTs is not None and endTs.value < lastNs:
+            # last grid time at or before endTs
+            lastNs = (
+                self._gridFirstNs
+                + ((endTs.value - self._gridFirstNs) // self._periodNs) * self._periodNs
+            )
+        if lastNs < firstNs:
+            return self.__frame(np.empty(0, dtype="int64"))
+        return self.__frame(
+            np.arange(firstNs, lastNs + 1, self._periodNs, dtype="int64")
+        )
+
+    def valuesAt(self, times):
+        """
+        Return an array with the values at the specified times, which do not
+        need to be on the grid.
+        """
+        atNs = pd.DatetimeIndex(pd.to_datetime(np.atleast_1d(times))).asi8
+        return _interpolateAt(self._tsNs, self._vals, atNs, self._interpolate)
+
+    # read only properties
+    @property
+    def name(self):
+        return self._name
+
+    @property
+    def tsName(self):
+        return self._tsName
+
+    @property
+    def yName(self):
+        return self._yName
+
+    @property
+    def timeOffset(self):
+        return self._timeOffset
+
+    @property
+    def interpolate(self):
+        return self._interpolate
+
+    @property
+    def startTs(self):
+        if self.count == 0:
+            raise IndexError("index 0 is out of bounds for axis 0 with size 0")
+        return pd.Timestamp(self._gridFirstNs)
+
+    @property
+    def endTs(self):
+        if self.count == 0:
+            raise IndexError("index -1 is out of bounds for axis 0 with size 0")
+        return pd.Timestamp(self._gridLastNs)
+
+    @property
+    def count(self):
+        return max((self._gridLastNs - self._gridFirstNs) // self._periodNs + 1, 0)
+
+    @property
+    def data(self):
+        return self.range()
+
+
+class TsIdxSnapshot(object):
+    """
+    Class: TsIdxSnapshot
+    File: bpsTsIdxData.py
+
+    Unchanging view of the data of a TsIdxData
+
+    Made using TsIdxData.snapshot(). A snapshot is one published version of
+    the data, and does not change when the TsIdxData does, so any number of
+    reader threads can use it without locking while a writer thread appends.
+
+    Snapshots hold the member dataframe the TsIdxData had when the snapshot
+    was published, not a copy. The TsIdxData replaces its dataframe rather
+    than changing it, and copies data passed in by a caller when it is
+    ingested, so neither later changes nor the caller's own data can change
+    the data in a snapshot. Versions share
+    any data which did not change (a TsIdxRingData appends into the same
+    arrays, so its snapshots share all but the new rows). A version is freed
+    once no snapshot of it is in use.
+
+    The following read only properties are implemented
+        version
+            the data version of the TsIdxData when this was published. It is
+            larger for newer data.
+
+        name, tsName, yName, timeOffset
+            the same as the TsIdxData when this was published
+
+        data
+            a read only shallow copy of the data (see TsIdxData.data)
+
+        index, columns, startTs, endTs, count, isEmpty
+            the same as the TsIdxData properties, for this version
+    """
+
+    def __init__(self, version, name, tsName, yName, timeOffset, frame):
+        """TsIdxSnapshot constructor (ctor). Details are in above class description."""
+        self._version = version
+        self._name = name
+        self._tsName = tsName
+        self._yName = yName
+        self._timeOffset = timeOffset
+        # The dataframe, or a function which builds it when first needed
+        self._frame = frame
+
+    def __repr__(self):
+        outputMsg = "{:13} {}".format("\nName: ", self._name + "\n")
+        outputMsg += "{:13} {}".format("Version: ", str(self._version) + "\n")
+        outputMsg += "{:13} {}".format("Rows: ", str(self.count) + "\n")
+        return outputMsg
+
+    @property
+    def _df(self):
+        frame = self._frame
+        if callable(frame):
+            # Two readers may both build it. Both get the same data, and one
+            # is kept.
+            frame = frame()
+            self._frame = frame
+        return frame
+
+    # read only properties
+    @property
+    def version(self):
+        return self._version
+
+    @property
+    def name(self):
+        return self._name
+
+    @property
+    def tsName(self):
+        return self._tsName
+
+    @property
+    def yName(self):
+        return self._yName
+
+    @property
+    def timeOffset(self):
+        return self._timeOffset
+
+    @property
+    def data(self):
+        return _readOnlyView(self._df)
+
+    @property
+    def index(self):
+        return self._df.index
+
+    @property
+    def columns(self):
+        # {col name : datatype, ...}, the same as TsIdxData.columns
+        return dict(self._df.dtypes)
+
+    @property
+    def startTs(self):
+        return self._df.index[0]
+
+    @property
+    def endTs(self):
         return self._df.index[-1]
 
     @property
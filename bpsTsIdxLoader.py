@@ -0,0 +1,239 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# bpsTsIdxLoader.py
+#
+# imports
+#
+# system related
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import resource_tracker, shared_memory
+
+# numerical manipulation libraries
+import numpy as np
+import pandas as pd
+from pandas.tseries.frequencies import to_offset
+
+# Local application and user library imports
+# TimeStamped Indexed Data Class
+from bpsTsIdxData import TsIdxData
+
+# Order of the fields when a load spec is given as a tuple or list
+SPEC_FIELDS = (
+    "file",
+    "name",
+    "tsName",
+    "yName",
+    "valueQuery",
+    "startQuery",
+    "endQuery",
+    "sourceTimeFormat",
+)
+
+
+def loadTsIdxFiles(specs, maxWorkers=None, chunksize=100000, verbose=False):
+    """
+    Build TsIdxData objects from many historian csv files in parallel, using
+    a pool of maxWorkers processes (default is the number of CPUs).
+
+    Each spec describes one file, and is either a dictionary with the keys
+    below, or a tuple/list with the values in this order:
+        file, name, tsName, yName, valueQuery, startQuery, endQuery,
+        sourceTimeFormat
+    Only file and name are required. Any others are the same as the
+    TsIdxData ctor arguments. A dictionary can also have a "readCsvArgs"
+    dictionary, which is passed along to pandas.read_csv.
+
+    Each file is read with TsIdxData.from_csv (see chunksize there). The
+    numeric results come back from the worker processes through shared
+    memory, rather than as pickled dataframes.
+
+    A failed file does not stop the others. Returns a list, in the same order
+    as specs, of dictionaries with these keys:
+        name -- the spec name
+        file -- the spec file
+        data -- the TsIdxData object, or None if it failed
+        rows -- the number of rows loaded
+        loadSec -- seconds taken by the worker to read and build the data
+        totalSec -- seconds from submitting the file to having the object
+        error -- None, or a string describing the failure
+    """
+    specDicts = [_specToDict(spec) for spec in specs]
+    results = []
+    with ProcessPoolExecutor(max_workers=maxWorkers) as pool:
+        submitTimes = []
+        futures = []
+        for spec in specDicts:
+            submitTimes.append(time.perf_counter())
+            futures.append(pool.submit(_loadWorker, spec, chunksize))
+
+        for spec, future, submitTime in zip(specDicts, futures, submitTimes):
+            result = {
+                "name": spec.get("name"),
+                "file": spec.get("file"),
+                "data": None,
+                "rows": 0,
+                "loadSec": None,
+                "totalSec": None,
+                "error": None,
+            }
+            try:
+                workerResult = future.result()
+            except Exception as e:
+                # Something went wrong in the pool itself (like a worker
+                # crashing). Record it and carry on.
+                result["error"] = type(e).__name__ + ": " + str(e)
+                workerResult = None
+
+            if workerResult is not None:
+                result["loadSec"] = workerResult["loadSec"]
+                if workerResult["error"] is not None:
+                    result["error"] = workerResult["error"]
+                else:
+                    try:
+                        result["data"] = _buildFromShared(spec, workerResult)
+                        result["rows"] = workerResult["rows"]
+                    except Exception as e:
+                        result["error"] = type(e).__name__ + ": " + str(e)
+            result["totalSec"] = time.perf_counter() - submitTime
+
+            if verbose:
+                if result["error"] is None:
+                    print(
+                        "    Loaded {} from {}: {} rows in {:.3f} sec".format(
+                            result["name"],
+                            result["file"],
+                            result["rows"],
+                            result["loadSec"],
+                        )
+                    )
+                else:
+                    print(
+                        "    WARNING: Failed to load {} from {}: {}".format(
+                            result["name"], result["file"], result["error"]
+                        )
+                    )
+            results.append(result)
+    return results
+
+
+def _specToDict(spec):
+    """
+    Return a load spec as a dictionary. Tuples and lists are matched with
+    SPEC_FIELDS in order.
+    """
+    if isinstance(spec, dict):
+        return dict(spec)
+    return dict(zip(SPEC_FIELDS, spec))
+
+
+def _loadWorker(spec, chunksize):
+    """
+    Run in a worker process. Build the TsIdxData for a spec, and copy the
+    index and numeric columns into a block of shared memory. Return a small
+    dictionary describing the block, which is cheap to send back.
+    Errors are returned rather than raised, so one file does not stop the
+    batch.
+    """
+    startTime = time.perf_counter()
+    try:
+        tsData = TsIdxData.from_csv(
+            spec["file"],
+            spec["name"],
+            tsName=spec.get("tsName"),
+            yName=spec.get("yName"),
+            valueQuery=spec.get("valueQuery"),
+            startQuery=spec.get("startQuery"),
+            endQuery=spec.get("endQuery"),
+            sourceTimeFormat=spec.get("sourceTimeFormat", "%m/%d/%Y %H:%M:%S.%f"),
+            chunksize=chunksize,
+            **spec.get("readCsvArgs", {})
+        )
+    except Exception as e:
+        return {
+            "error": type(e).__name__ + ": " + str(e),
+            "loadSec": time.perf_counter() - startTime,
+        }
+
+    dfData = tsData.data
+    numCols = list(dfData.select_dtypes(include="number").columns)
+    otherCols = [col for col in dfData.columns if col not in numCols]
+    rows = len(dfData.index)
+
+    # Layout of the block: int64 timestamps (ns), then one float64 row per
+    # numeric column.
+    shm = shared_memory.SharedMemory(
+        create=True, size=max(8 * rows * (1 + len(numCols)), 1)
+    )
+    # The parent unlinks the block once it has the data. Stop this process
+    # from unlinking it when it exits.
+    resource_tracker.unregister(shm._name, "shared_memory")
+    block = np.ndarray((1 + len(numCols), rows), dtype="int64", buffer=shm.buf)
+    block[0] = dfData.index.asi8
+    block[1:].view("float64")[:] = dfData[numCols].to_numpy(dtype="float64").T
+    del block
+    shm.close()
+
+    timeOffset = tsData.timeOffset
+    return {
+        "error": None,
+        "shmName": shm.name,
+        "rows": rows,
+        "numCols": numCols,
+        "columns": list(dfData.columns),
+        # Non-numeric columns (like quality flags) are sent the normal way.
+        "otherData": dfData[otherCols] if otherCols else None,
+        "tsName": tsData.tsName,
+        "yName": tsData.yName,
+        "valueQuery": tsData.valueQuery,
+        "startQuery": tsData.startQuery,
+        "endQuery": tsData.endQuery,
+        "timeOffset": timeOffset.freqstr
+        if isinstance(timeOffset, pd.DateOffset)
+        else None,
+        "loadSec": time.perf_counter() - startTime,
+    }
+
+
+def _buildFromShared(spec, workerResult):
+    """
+    Build a TsIdxData in this process from the shared memory block made by
+    _loadWorker. The data was already massaged and filtered by the worker, so
+    it is used as is. The block is freed once the data is copied out.
+    """
+    rows = workerResult["rows"]
+    numCols = workerResult["numCols"]
+    shm = shared_memory.SharedMemory(name=workerResult["shmName"])
+    try:
+        block = np.ndarray((1 + len(numCols), rows), dtype="int64", buffer=shm.buf)
+        tsIndex = pd.DatetimeIndex(
+            block[0].copy().view("datetime64[ns]"), name=workerResult["tsName"]
+        )
+        values = block[1:].view("float64").T.copy()
+        del block
+    finally:
+        shm.close()
+        shm.unlink()
+
+    dfData = pd.DataFrame(values, index=tsIndex, columns=numCols)
+    if workerResult["otherData"] is not None:
+        dfData = dfData.join(workerResult["otherData"])
+        dfData = dfData[workerResult["columns"]]
+
+    # Make an empty object with the same settings, and give it the data
+    # the worker already conditioned.
+    tsData = TsIdxData(
+        spec["name"],
+        tsName=workerResult["tsName"],
+        yName=workerResult["yName"],
+        valueQuery=workerResult["valueQuery"] or None,
+        startQuery=workerResult["startQuery"],
+        endQuery=workerResult["endQuery"],
+        sourceTimeFormat=spec.get("sourceTimeFormat", "%m/%d/%Y %H:%M:%S.%f"),
+    )
+    tsData._df = dfData
+    if workerResult["timeOffset"] is not None:
+        tsData._timeOffset = to_offset(workerResult["timeOffset"])
+    tsData._publish()
+    return tsData
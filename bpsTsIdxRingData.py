@@ -0,0 +1,329 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# bpsTsIdxRingData.py
+#
+# imports
+#
+# numerical manipulation libraries
+import numpy as np
+import pandas as pd
+
+# Local application and user library imports
+# TimeStamped Indexed Data Class
+from bpsTsIdxData import TsIdxData
+
+
+class TsIdxRingData(TsIdxData):
+    """
+    Class: TsIdxRingData
+    File: bpsTsIdxRingData.py
+
+    Timestamped Indexed Data backed by preallocated arrays
+
+    This is a TsIdxData intended for live data feeds. Rather than rebuilding a
+    Pandas Dataframe each time data is appended, the timestamps and values are
+    kept in preallocated NumPy arrays. The timestamps are stored as int64
+    nanoseconds since the epoch (the timestamps are already rounded to
+    milliseconds, and nanoseconds are the native Pandas unit, so the index can
+    be viewed without a copy), and the values are stored as float64.
+
+    Appending data that is newer than the last timestamp only writes the new
+    samples into the arrays, so the cost per sample is constant. Appending
+    data that overlaps existing data is still supported, but falls back to the
+    TsIdxData merge.
+
+    The live data is always a contiguous run of the arrays. When the end of
+    the arrays is reached, the live data is moved to the start of new arrays,
+    which are grown geometrically if needed. Because only the live data is
+    moved, and at most every capacity/2 samples, this is cheap on average.
+
+    The data property (and the other TsIdxData methods) use a dataframe that
+    is built lazily, only when needed, and is a view of the arrays.
+
+    The constructor (ctor) has the same arguments as TsIdxData, and these
+    additional arguments:
+      capacity -- The initial number of rows to allocate. Default is 1024.
+
+      maxCount -- If specified, the data is a fixed size ring. Once maxCount
+                  rows are held, the oldest rows are dropped as new rows are
+                  appended. Default is None, so the arrays grow as needed.
+
+      retention -- If specified, a time period (Timedelta or something that
+                   can be converted to one, like "1H" or "7D"). Rows older than
+                   the last timestamp minus this period are dropped as new rows
+                   are appended. Default is None, so nothing is dropped.
+
+    Only numeric columns are held. Other columns in the source data are
+    ignored.
+
+    The memoryUsage property counts the whole of the allocated arrays, not
+    just the live rows.
+
+    Snapshots (see TsIdxData.snapshot) share the arrays, so publishing a new
+    version after an append does not copy the rows.
+    """
+
+    def __init__(
+        self,
+        name,
+        tsName=None,
+        yName=None,
+        df=None,
+        valueQuery=None,
+        startQuery=None,
+        endQuery=None,
+        sourceTimeFormat="%m/%d/%Y %H:%M:%S.%f",
+        forceColNames=False,
+        capacity=1024,
+        maxCount=None,
+        retention=None,
+    ):
+        """TsIdxRingData constructor (ctor). Details are in above class description."""
+        self._capacity = max(int(capacity), 1)
+        if maxCount is None:
+            self._maxCount = None
+        else:
+            self._maxCount = max(int(maxCount), 1)
+        if retention is None:
+            self._retention = None
+        else:
+            self._retention = pd.Timedelta(retention)
+
+        # Start with empty arrays. The base ctor fills them using the _df
+        # property setter below.
+        self._ringCols = []
+        self._tsArr = np.empty(0, dtype="int64")
+        self._valArr = np.empty((0, 0), dtype="float64")
+        self._head = 0
+        self._tail = 0
+        self._dfView = None
+
+        super().__init__(
+            name,
+            tsName=tsName,
+            yName=yName,
+            df=df,
+            valueQuery=valueQuery,
+            startQuery=startQuery,
+            endQuery=endQuery,
+            sourceTimeFormat=sourceTimeFormat,
+            forceColNames=forceColNames,
+        )
+
+    @property
+    def _df(self):
+        # Build the dataframe view of the live rows the first time it is
+        # needed after a change.
+        if self._dfView is None:
+            tsView = self._tsArr[self._head : self._tail].view("datetime64[ns]")
+            self._dfView = pd.DataFrame(
+                self._valArr[self._head : self._tail],
+                index=pd.DatetimeIndex(tsView, name=self._tsName, copy=False),
+                columns=self._ringCols,
+                copy=False,
+            )
+        return self._dfView
+
+    @_df.setter
+    def _df(self, srcDf):
+        # Replace the contents of the arrays with the specified dataframe.
+        self._dataVersion += 1
+        # Only numeric columns can be held. Columns of an empty dataframe have
+        # no values, so they are all kept.
+        if srcDf.empty:
+            dfNum = srcDf
+        else:
+            dfNum = srcDf.select_dtypes(include="number")
+        if len(dfNum.columns) != len(srcDf.columns):
+            print(
+                "    WARNING: "
+                + self._name
+                + " only holds numeric columns. These columns are ignored: "
+                + str([col for col in srcDf.columns if col not in dfNum.columns])
+            )
+
+        # Keep only the newest rows if this is a fixed size ring
+        if self._maxCount is not None and len(dfNum.index) > self._maxCount:
+            dfNum = dfNum.iloc[-self._maxCount :]
+
+        rowCount = len(dfNum.index)
+        self._ringCols = list(dfNum.columns)
+        self.__allocate(max(self.__physicalSize(rowCount), rowCount))
+        if rowCount > 0:
+            self._tsArr[:rowCount] = pd.DatetimeIndex(dfNum.index).asi8
+            self._valArr[:rowCount] = dfNum.to_numpy(dtype="float64", na_value=np.nan)
+        self._head = 0
+        self._tail = rowCount
+        self.__applyRetention()
+        self._dfView = None
+
+    def _snapshotFrame(self):
+        """
+        Return a function which builds the dataframe view of the live rows,
+        for a snapshot. Rows are only ever written after the live rows, or
+        into new arrays, so the rows the snapshot holds are not changed by
+        later appends, and the arrays are shared rather than copied.
+        """
+        if self._dfView is not None:
+            return self._dfView
+        tsArr = self._tsArr
+        valArr = self._valArr
+        head = self._head
+        tail = self._tail
+        ringCols = list(self._ringCols)
+        tsName = self._tsName
+
+        def _buildView():
+            return pd.DataFrame(
+                valArr[head:tail],
+                index=pd.DatetimeIndex(
+                    tsArr[head:tail].view("datetime64[ns]"), name=tsName, copy=False
+                ),
+                columns=ringCols,
+                copy=False,
+            )
+
+        return _buildView
+
+    def __physicalSize(self, rowCount):
+        """
+        Return the number of rows to allocate to hold rowCount live rows and
+        leave room to append.
+        """
+        if self._maxCount is not None:
+            # Twice the ring size, so the live rows only need to be moved
+            # every maxCount appended rows.
+            return 2 * self._maxCount
+        # Grow geometrically so the live rows are moved rarely.
+        size = self._capacity
+        while size < 2 * rowCount:
+            size *= 2
+        return size
+
+    def __allocate(self, size):
+        """
+        Allocate new arrays with room for size rows. Existing arrays are not
+        reused, so dataframes already handed out as views stay valid.
+        """
+        self._tsArr = np.empty(size, dtype="int64")
+        self._valArr = np.full((size, len(self._ringCols)), np.nan, dtype="float64")
+
+    def __applyRetention(self):
+        """
+        Drop the oldest live rows that are outside the retention period or
+        beyond the ring size.
+        """
+        if self._tail <= self._head:
+            return
+        if self._retention is not None:
+            cutoff = self._tsArr[self._tail - 1] - self._retention.value
+            self._head += int(
+                np.searchsorted(
+                    self._tsArr[self._head : self._tail], cutoff, side="left"
+                )
+            )
+        if self._maxCount is not None and self._tail - self._head > self._maxCount:
+            self._head = self._tail - self._maxCount
+
+    def _appendConditioned(self, srcDf):
+        """
+        Write conditioned and filtered data into the arrays. Data that is all
+        newer than the last timestamp is written directly after the live rows.
+        Anything else is merged using the TsIdxData merge.
+        """
+        if srcDf.empty:
+            return
+
+        if (
+            self._tail == self._head
+            or self._yName not in self._ringCols
+            or srcDf.index[0].value <= self._tsArr[self._tail - 1]
+        ):
+            # Overlapping data or a new column. Use the general merge.
+            super()._appendConditioned(srcDf)
+            return
+
+        newTs = pd.DatetimeIndex(srcDf.index).asi8
+        newCount = len(newTs)
+        newVals = np.full((newCount, len(self._ringCols)), np.nan, dtype="float64")
+        newVals[:, self._ringCols.index(self._yName)] = srcDf[self._yName].to_numpy(
+            dtype="float64"
+        )
+
+        # For a fixed size ring, only the newest maxCount rows can be kept.
+        if self._maxCount is not None and newCount > self._maxCount:
+            newTs = newTs[-self._maxCount :]
+            newVals = newVals[-self._maxCount :]
+            newCount = self._maxCount
+            self._head = self._tail
+
+        # Make room if the new rows do not fit after the live rows. Drop rows
+        # that will fall out of the ring first, so they are not moved.
+        if self._tail + newCount > len(self._tsArr):
+            if self._maxCount is not None:
+                liveCount = self._tail - self._head
+                self._head += max(0, liveCount + newCount - self._maxCount)
+            liveCount = self._tail - self._head
+            oldTs = self._tsArr
+            oldVals = self._valArr
+            self.__allocate(
+                max(self.__physicalSize(liveCount + newCount), liveCount + newCount)
+            )
+            self._tsArr[:liveCount] = oldTs[self._head : self._tail]
+            self._valArr[:liveCount] = oldVals[self._head : self._tail]
+            self._head = 0
+            self._tail = liveCount
+
+        self._tsArr[self._tail : self._tail + newCount] = newTs
+        self._valArr[self._tail : self._tail + newCount] = newVals
+        self._tail += newCount
+        self.__applyRetention()
+        self._dfView = None
+        self._dataVersion += 1
+
+    # read only properties
+    # These are read directly from the arrays, so the dataframe view is not
+    # built just to get them.
+    @property
+    def maxCount(self):
+        return self._maxCount
+
+    @property
+    def retention(self):
+        return self._retention
+
+    @property
+    def capacity(self):
+        return len(self._tsArr)
+
+    @property
+    def memoryUsage(self):
+        # The whole of the allocated arrays is counted, since that is what is
+        # held. The dataframe view shares the arrays.
+        return {
+            "index": self._tsArr.nbytes,
+            "values": self._valArr.nbytes,
+            "extras": 0,
+            "total": self._tsArr.nbytes + self._valArr.nbytes,
+        }
+
+    @property
+    def startTs(self):
+        if self._tail == self._head:
+            raise IndexError("index 0 is out of bounds for axis 0 with size 0")
+        return pd.Timestamp(self._tsArr[self._head])
+
+    @property
+    def endTs(self):
+        if self._tail == self._head:
+            raise IndexError("index -1 is out of bounds for axis 0 with size 0")
+        return pd.Timestamp(self._tsArr[self._tail - 1])
+
+    @property
+    def count(self):
+        return self._tail - self._head
+
+    @property
+    def isEmpty(self):
+        return self._tail == self._head
@@ -0,0 +1,342 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# bpsTsIdxStore.py
+#
+# imports
+#
+# system related
+import os
+from bisect import bisect_right
+
+# saving the manifest
+import json
+
+# numerical manipulation libraries
+import pandas as pd
+
+# Local application and user library imports
+# TimeStamped Indexed Data Class
+from bpsTsIdxData import TsIdxData, _toQueryTs
+
+
+class TsIdxStore(object):
+    """
+    Class: TsIdxStore
+    File: bpsTsIdxStore.py
+
+    Time partitioned on-disk store of TsIdxData
+
+    The data of each tag (TsIdxData object) is kept in its own directory
+    under the store root directory, split into one parquet file per day or
+    per month. A small manifest.json file in each tag directory lists the
+    time range and row count of each partition, along with the tag settings
+    (tsName, yName).
+
+    Opening a tag with a start and/or end query only reads the partitions
+    that overlap the query window, so the cost of opening a tag tracks the
+    window size rather than the history size.
+
+    The constructor (ctor) has these arguments:
+      root -- The directory holding the store. It is created if needed.
+
+      partition -- "D" for one file per day (default), or "M" for one file
+                   per month. Only used when a tag is first written. After
+                   that, the setting in the tag manifest is used.
+
+    Requires the pyarrow library.
+
+    Methods
+        write(tsIdxData)
+            Write (merge) the data of a TsIdxData object into the store.
+            Rows with timestamps already in the store are replaced.
+
+        open(tag, startQuery=None, endQuery=None, valueQuery=None)
+            Return a TsIdxStoreData holding the tag data in the query window.
+
+        readRange(tag, startTs=None, endTs=None)
+            Return a dataframe of the tag data between startTs and endTs,
+            reading only the partitions that overlap the range.
+
+    The following read only properties are implemented
+        root
+            the store directory
+
+        tags
+            list of the tag names in the store
+    """
+
+    def __init__(self, root, partition="D"):
+        """TsIdxStore constructor (ctor). Details are in above class description."""
+        self._root = str(root)
+        partition = str(partition).upper()
+        if partition not in ("D", "M"):
+            print(
+                '    WARNING: Invalid partition "'
+                + partition
+                + '". Use "D" or "M". Using "D".'
+            )
+            partition = "D"
+        self._partition = partition
+        os.makedirs(self._root, exist_ok=True)
+
+    def __repr__(self):
+        outputMsg = "{:13} {}".format("\nStore: ", self._root + "\n")
+        outputMsg += "{:13} {}".format("Partition: ", self._partition + "\n")
+        for tag in self.tags:
+            manifest = self.manifest(tag)
+            outputMsg += "{:4} {:20} {:6} {}".format(
+                " ",
+                tag,
+                len(manifest["partitions"]),
+                "partitions, "
+                + str(sum([part["count"] for part in manifest["partitions"]]))
+                + " rows\n",
+            )
+        return outputMsg
+
+    def manifest(self, tag):
+        """
+        Return the manifest of the specified tag as a dictionary. The
+        "partitions" entry is a list, sorted by time, with the file name, start
+        time, end time, and row count of each partition.
+        """
+        manifestPath = os.path.join(self._root, str(tag), "manifest.json")
+        try:
+            with open(manifestPath, "r") as manifestFile:
+                return json.load(manifestFile)
+        except FileNotFoundError as fnfe:
+            print(
+                '    ERROR: There is no tag "' + str(tag) + '" in store ' + self._root
+            )
+            raise fnfe
+
+    def write(self, tsIdxData):
+        """
+        Write the data of a TsIdxData object into the store, using the object
+        name as the tag. Data is merged into any existing partitions, and where
+        timestamps are already in the store, the written rows are kept.
+        Only the partitions the data falls in are read and rewritten.
+        """
+        tag = tsIdxData.name
+        tagDir = os.path.join(self._root, tag)
+        if os.path.isfile(os.path.join(tagDir, "manifest.json")):
+            manifest = self.manifest(tag)
+        else:
+            os.makedirs(tagDir, exist_ok=True)
+            manifest = {
+                "tsName": tsIdxData.tsName,
+                "yName": tsIdxData.yName,
+                "partition": self._partition,
+                "partitions": [],
+            }
+
+        if tsIdxData.isEmpty:
+            self.__writeManifest(tag, manifest)
+            return
+
+        partitions = {part["file"]: part for part in manifest["partitions"]}
+        dfSrc = tsIdxData.data
+        periods = dfSrc.index.to_period(manifest["partition"])
+        for period, dfPart in dfSrc.groupby(periods, sort=False):
+            fileName = str(period) + ".parquet"
+            filePath = os.path.join(tagDir, fileName)
+            if fileName in partitions:
+                # Merge with the existing partition, keeping the new rows
+                dfOld = pd.read_parquet(filePath)
+                dfPart = pd.concat([dfOld, dfPart])
+                dfPart = dfPart[~dfPart.index.duplicated(keep="last")]
+                dfPart = dfPart.sort_index(kind="mergesort")
+            # Written to a temporary file first and then moved, like the
+            # manifest, so a reader never sees a partially written partition.
+            dfPart.to_parquet(filePath + ".tmp")
+            os.replace(filePath + ".tmp", filePath)
+            partitions[fileName] = {
+                "file": fileName,
+                "start": dfPart.index[0].isoformat(),
+                "end": dfPart.index[-1].isoformat(),
+                "count": len(dfPart.index),
+            }
+
+        manifest["partitions"] = sorted(
+            partitions.values(), key=lambda part: part["start"]
+        )
+        self.__writeManifest(tag, manifest)
+        return
+
+    def __writeManifest(self, tag, manifest):
+        """
+        Private member function to write the manifest of a tag. It is written
+        to a temporary file first and then moved, so a reader never sees a
+        partially written manifest.
+        """
+        manifestPath = os.path.join(self._root, tag, "manifest.json")
+        with open(manifestPath + ".tmp", "w") as manifestFile:
+            json.dump(manifest, manifestFile, indent=1)
+        os.replace(manifestPath + ".tmp", manifestPath)
+
+    def readRange(self, tag, startTs=None, endTs=None):
+        """
+        Return a dataframe with the data of the specified tag from startTs to
+        endTs (inclusive). None means no limit. Only the partitions which
+        overlap the range are read.
+        """
+        manifest = self.manifest(tag)
+        partitions = manifest["partitions"]
+        startTs = None if startTs is None else pd.Timestamp(startTs)
+        endTs = None if endTs is None else pd.Timestamp(endTs)
+
+        # Partitions are sorted and do not overlap, so the ones needed are a
+        # contiguous run. Find the last partition starting at or before endTs.
+        if endTs is None:
+            lastPart = len(partitions)
+        else:
+            lastPart = bisect_right(
+                [pd.Timestamp(part["start"]) for part in partitions], endTs
+            )
+        dfParts = []
+        for part in partitions[:lastPart]:
+            if startTs is not None and pd.Timestamp(part["end"]) < startTs:
+                continue
+            dfParts.append(pd.read_parquet(os.path.join(self._root, tag, part["file"])))
+
+        if not dfParts:
+            # nothing in range. Return an empty frame with the right layout
+            dfEmpty = pd.DataFrame(
+                {manifest["yName"]: pd.Series([], dtype="float64")},
+                index=pd.DatetimeIndex([], name=manifest["tsName"]),
+            )
+            return dfEmpty
+        dfRange = pd.concat(dfParts)
+        return dfRange.loc[startTs:endTs]
+
+    def open(self, tag, startQuery=None, endQuery=None, valueQuery=None):
+        """
+        Return a TsIdxStoreData object with the data of the specified tag,
+        limited to the startQuery/endQuery window, and filtered by valueQuery.
+        The queries work the same as the TsIdxData ctor arguments.
+        """
+        return TsIdxStoreData(
+            self,
+            tag,
+            startQuery=startQuery,
+            endQuery=endQuery,
+            valueQuery=valueQuery,
+        )
+
+    # read only properties
+    @property
+    def root(self):
+        return self._root
+
+    @property
+    def tags(self):
+        return sorted(
+            [
+                entry
+                for entry in os.listdir(self._root)
+                if os.path.isfile(os.path.join(self._root, entry, "manifest.json"))
+            ]
+        )
+
+
+class TsIdxStoreData(TsIdxData):
+    """
+    Class: TsIdxStoreData
+    File: bpsTsIdxStore.py
+
+    TsIdxData opened against a TsIdxStore
+
+    Made using TsIdxStore.open(tag, startQuery, endQuery, valueQuery). Only
+    the store partitions overlapping the startQuery/endQuery window are read.
+
+    The window can later be widened using the
+    widen(startQuery, endQuery, noStart, noEnd) method, including to no start
+    or end limit. Only the partitions overlapping the added part of the window
+    are read, and merged with the data already loaded.
+
+    Data appended using appendData is limited to the window (like any
+    TsIdxData), which has already been loaded, so appended data is merged
+    with the stored data as expected. Use TsIdxStore.write(obj) to write the
+    data back to the store.
+
+    The following additional read only properties are implemented
+        store
+            the TsIdxStore the data came from
+    """
+
+    def __init__(self, store, tag, startQuery=None, endQuery=None, valueQuery=None):
+        """TsIdxStoreData constructor (ctor). Details are in above class description."""
+        self._store = store
+        manifest = store.manifest(tag)
+
+        # Let the base ctor convert the queries, and make an empty object.
+        super().__init__(
+            tag,
+            tsName=manifest["tsName"],
+            yName=manifest["yName"],
+            df=None,
+            valueQuery=valueQuery,
+            startQuery=startQuery,
+            endQuery=endQuery,
+        )
+
+        # Read the partitions in the window, and filter them. The stored data
+        # is already massaged, so it does not need to be massaged again.
+        dfWindow = store.readRange(tag, self._startQuery, self._endQuery)
+        self._df = self._filterConditioned(dfWindow)
+        if not self._df.empty:
+            self._timeOffset = self._inferTimeOffset()
+        self._publish()
+
+    def widen(self, startQuery=None, endQuery=None, noStart=False, noEnd=False):
+        """
+        Widen the query window to include startQuery and/or endQuery, and load
+        the stored data in the added part of the window. Arguments which do not
+        widen the window are ignored. Set noStart and/or noEnd to remove the
+        start and/or end limit of the window, and load all the stored data
+        before and/or after it.
+        """
+        newStart = None if noStart else _toQueryTs(startQuery)
+        newEnd = None if noEnd else _toQueryTs(endQuery, isEnd=True)
+
+        dfAdded = []
+        if self._startQuery is not None and (
+            noStart or (newStart is not None and newStart < self._startQuery)
+        ):
+            dfAdded.append(
+                self._store.readRange(
+                    self._name,
+                    newStart,
+                    self._startQuery - pd.Timedelta(1, "ns"),
+                )
+            )
+            self._startQuery = newStart
+        if self._endQuery is not None and (
+            noEnd or (newEnd is not None and newEnd > self._endQuery)
+        ):
+            dfAdded.append(
+                self._store.readRange(
+                    self._name,
+                    self._endQuery + pd.Timedelta(1, "ns"),
+                    newEnd,
+                )
+            )
+            self._endQuery = newEnd
+
+        # Apply the value query to the added data, and merge it in.
+        for dfPart in dfAdded:
+            dfPart = self._filterConditioned(dfPart)
+            if not dfPart.empty:
+                self._appendConditioned(dfPart)
+        if dfAdded and not isinstance(self._timeOffset, pd.DateOffset):
+            if not self._df.empty:
+                self._timeOffset = self._inferTimeOffset()
+        if dfAdded:
+            self._publish()
+        return
+
+    # read only properties
+    @property
+    def store(self):
+        return self._store
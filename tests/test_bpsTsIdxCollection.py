@@ -0,0 +1,111 @@
+# test_bpsTsIdxCollection.py
+#
+# Tests for TsIdxCollection
+import numpy as np
+import pandas as pd
+import pytest
+
+from bpsTsIdxData import TsIdxData
+from bpsTsIdxCollection import TsIdxCollection
+
+
+def makeTag(name, start, rows, period):
+    tsIndex = pd.date_range(start, periods=rows, freq=period, name="ts")
+    df = pd.DataFrame({"val": np.arange(rows, dtype="float64")}, index=tsIndex)
+    return TsIdxData(name, "ts", "val", df)
+
+
+def test_resampleKeepsTagsOfEmptyGroups():
+    coll = TsIdxCollection(
+        "c",
+        [
+            makeTag("a", "2024-01-01 00:00", 600, "1S"),
+            makeTag("b", "2024-01-01 00:30", 600, "10S"),
+        ],
+    )
+    # only the 10S tag has data after the start
+    coll.filter(startQuery="2024-01-01 00:20")
+    coll.resample("1T", "vixm")
+
+    assert coll.tags == ["a", "b"]
+    assert coll.columns["a"] == ["a", "min_a", "max_a", "mean_a"]
+    dfData = coll.data
+    assert dfData[coll.columns["a"]].isna().all().all()
+    assert dfData[coll.columns["b"]].notna().any().all()
+
+
+def makeIrregularData(start, rows, period, seed):
+    rng = np.random.default_rng(seed)
+    tsIndex = pd.date_range(start, periods=rows, freq=period, name="ts")
+    # drop some samples, so the tags do not share every timestamp
+    tsIndex = tsIndex[rng.random(rows) > 0.1]
+    df = pd.DataFrame({"val": np.cumsum(rng.normal(size=len(tsIndex)))}, index=tsIndex)
+    return df
+
+
+@pytest.mark.parametrize(
+    "resampleArg, stats, interpolate",
+    [
+        ("30S", "vixmswqz", "step"),
+        ("1T", "wqz", "linear"),
+        ("1T", "", "nearest"),
+        ("250L", "", "linear"),
+        ("500L", "", "nearest"),
+        ("500L", "", "step"),
+    ],
+)
+def test_resampleMatchesTsIdxData(resampleArg, stats, interpolate):
+    srcDfs = {
+        "a": makeIrregularData("2024-01-01 00:00:00", 3000, "1S", 1),
+        "b": makeIrregularData("2024-01-01 00:07:13", 2000, "1S", 2),
+        "c": makeIrregularData("2024-01-01 00:02:00", 500, "5S", 3),
+    }
+    coll = TsIdxCollection(
+        "c", [TsIdxData(tag, "ts", "val", df) for tag, df in srcDfs.items()]
+    )
+    # filtered out values become NaN holes in the shared index
+    coll.filter(valueQuery="val > -5")
+    tagData = {tag: coll.getTag(tag) for tag in coll.tags}
+
+    coll.resample(resampleArg, stats, interpolate=interpolate)
+    dfColl = coll.data
+    for tag, tsData in tagData.items():
+        tsData.resample(resampleArg, stats, interpolate=interpolate)
+        dfTag = tsData.data
+        dfGot = dfColl[coll.columns[tag]]
+        # rows outside the range of the tag are NaN
+        assert dfGot.drop(dfTag.index).isna().all().all()
+        dfGot = dfGot.loc[dfTag.index]
+        dfGot.columns = dfTag.columns
+        pd.testing.assert_frame_equal(dfGot, dfTag, check_names=False, check_freq=False)
+
+
+def test_addTagsMatchesAddTag():
+    tagData = [
+        TsIdxData(tag, "ts", "val", makeIrregularData(start, 600, period, seed))
+        for tag, start, period, seed in (
+            ("a", "2024-01-01 00:00", "1S", 1),
+            ("b", "2024-01-01 00:03", "1S", 2),
+            ("c", "2024-01-01 00:00", "10S", 3),
+            ("a", "2024-01-01 00:05", "1S", 4),
+        )
+    ]
+    collBulk = TsIdxCollection("bulk", tagData)
+    collOne = TsIdxCollection("one")
+    for tsData in tagData:
+        collOne.addTag(tsData)
+
+    assert collBulk.tags == collOne.tags == ["b", "c", "a"]
+    assert collBulk.columns == collOne.columns
+    # Replacing a tag one at a time leaves the rows only it had, all NaN
+    pd.testing.assert_frame_equal(collBulk.data, collOne.data.dropna(how="all"))
+    # the last tag named "a" is used
+    assert collBulk.getTag("a").startTs == pd.Timestamp("2024-01-01 00:05")
+
+
+def test_dataIsReadOnly():
+    coll = TsIdxCollection("c", [makeTag("a", "2024-01-01", 10, "1S")])
+    dfData = coll.data
+    with pytest.raises(ValueError):
+        dfData.iloc[0, 0] = 100.0
+    assert coll.data.iloc[0, 0] == 0.0
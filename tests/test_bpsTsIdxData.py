@@ -0,0 +1,103 @@
+# test_bpsTsIdxData.py
+#
+# Tests for TsIdxData and the module functions of bpsTsIdxData
+import contextlib
+import io
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from bpsTsIdxData import TsIdxData, estimateFrequency
+
+
+def makeJittered(rows, period, jitter, seed=0):
+    rng = np.random.default_rng(seed)
+    periodNs = pd.Timedelta(period).value
+    jitterNs = pd.Timedelta(jitter).value
+    tsNs = pd.Timestamp("2024-01-01").value + np.arange(rows) * periodNs
+    tsNs = tsNs + rng.integers(-jitterNs, jitterNs + 1, rows)
+    return pd.DatetimeIndex(np.sort(tsNs), name="ts").round("L")
+
+
+@pytest.mark.parametrize(
+    "period, jitter, rows",
+    [
+        ("1S", "0S", 1000),
+        ("1500L", "0S", 1000),
+        ("1050L", "10L", 5000),
+        ("1S", "300L", 100000),
+        ("1S", "300L", 200),
+        ("1H", "5S", 2000),
+    ],
+)
+def test_estimateFrequency(period, jitter, rows):
+    freqInfo = estimateFrequency(makeJittered(rows, period, jitter))
+    assert freqInfo["period"] == pd.Timedelta(period)
+
+
+def test_jitteredDataIsNotUpsampled():
+    tsIndex = makeJittered(3600, "1S", "300L")
+    df = pd.DataFrame({"val": np.arange(len(tsIndex), dtype="float64")}, index=tsIndex)
+    with contextlib.redirect_stdout(io.StringIO()):
+        tsData = TsIdxData("a", "ts", "val", df)
+        assert tsData.timeOffset == pd.Timedelta("1S")
+        # the same period, so the data is not changed
+        tsData.resample("1S", "m")
+        assert tsData.count == len(tsIndex)
+        tsData.resample("1T", "m")
+    assert tsData.timeOffset == pd.Timedelta("1T")
+    assert tsData.count <= 61
+
+
+def test_timestampConverterIsPerObject():
+    fixedDf = pd.DataFrame(
+        {"ts": ["01/02/2024 03:04:05.000", "01/02/2024 03:04:06.000"], "val": [1, 2]}
+    )
+    # not zero padded, so the fixed width parser cannot be used
+    looseDf = pd.DataFrame(
+        {"ts": ["1/2/2024 3:04:05.000", "1/2/2024 3:04:06.000"], "val": [1, 2]}
+    )
+    with contextlib.redirect_stdout(io.StringIO()):
+        fixedData = TsIdxData("fixed", "ts", "val", fixedDf)
+        looseData = TsIdxData("loose", "ts", "val", looseDf)
+    assert fixedData._tsConverter == "fixed"
+    assert looseData._tsConverter == "format"
+    assert looseData.data.index.equals(fixedData.data.index)
+
+
+def test_loadEndDateLoadsTheWholeDay(tmp_path):
+    pytest.importorskip("pyarrow")
+    tsIndex = pd.date_range("2024-01-01", periods=3 * 24, freq="1H", name="ts")
+    df = pd.DataFrame({"val": np.arange(len(tsIndex), dtype="float64")}, index=tsIndex)
+    path = str(tmp_path / "a.parquet")
+    with contextlib.redirect_stdout(io.StringIO()):
+        TsIdxData("a", "ts", "val", df).save(path)
+        loaded = TsIdxData.load(path, startTs="2024-01-02", endTs="2024-01-02")
+        compactData = TsIdxData.load(path, compact=True, lazy=True)
+    assert loaded.count == 24
+    assert loaded.endTs == pd.Timestamp("2024-01-02 23:00")
+    assert compactData._compact and compactData._lazy
+    assert compactData.data["val"].dtype == "float32"
+    pd.testing.assert_index_equal(compactData.data.index, tsIndex)
+
+
+def test_fromCsvKeepsTheLastDuplicateAcrossChunks(tmp_path):
+    # The last row of a duplicate timestamp is used before filtering, so the
+    # 01:00 row is dropped, even though an earlier chunk has a row that passes.
+    path = tmp_path / "a.csv"
+    path.write_text(
+        "ts,val\n"
+        "01/01/2024 00:00:00.000,1\n"
+        "01/01/2024 01:00:00.000,2\n"
+        "01/01/2024 02:00:00.000,3\n"
+        "01/01/2024 01:00:00.000,-2\n"
+        "01/01/2024 00:00:00.000,4\n"
+    )
+    with contextlib.redirect_stdout(io.StringIO()):
+        chunked = TsIdxData.from_csv(
+            str(path), "a", "ts", "val", "val > 0", chunksize=2
+        )
+        whole = TsIdxData("a", "ts", "val", pd.read_csv(path), "val > 0")
+    pd.testing.assert_frame_equal(chunked.data, whole.data)
+    assert list(chunked.data["val"]) == [4.0, 3.0]
@@ -0,0 +1,106 @@
+# test_bpsTsIdxMemory.py
+#
+# Peak memory tests for TsIdxData operations. The peak memory of each
+# operation is measured with tracemalloc (numpy and pandas report to it), and
+# compared with the size of the source data. An extra copy of the data adds
+# about 1 to the ratio, so the limits are tight enough to find one.
+import contextlib
+import gc
+import io
+import tracemalloc
+
+import pandas as pd
+import pytest
+
+import bpsTsIdxBench as bench
+
+ROWS = 100000
+
+# Most operations peak at the same ratio for every kind of series. Building
+# from duplicated data also needs the sort order and the positions of the
+# rows kept.
+MAX_RATIOS = {
+    "ctor": 2.4,
+    "ctorDuplicated": 3.8,
+    "ctorCompact": 3.1,
+    "ctorCompactDuplicated": 3.8,
+    "appendNewer": 1.3,
+    "data": 0.05,
+    "snapshot": 0.05,
+    "filter": 1.6,
+    "resampleDown": 1.8,
+}
+
+
+def peakRatio(srcBytes, func, *args):
+    gc.collect()
+    tracemalloc.start()
+    with contextlib.redirect_stdout(io.StringIO()):
+        result = func(*args)
+    peakBytes = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    del result
+    return peakBytes / srcBytes
+
+
+def quietData(srcDf, compact=False):
+    with contextlib.redirect_stdout(io.StringIO()):
+        return bench._newData(srcDf, compact=compact)
+
+
+def maxRatio(op, kind):
+    if kind == "duplicated" and op + "Duplicated" in MAX_RATIOS:
+        return MAX_RATIOS[op + "Duplicated"]
+    return MAX_RATIOS[op]
+
+
+@pytest.fixture(scope="module", params=bench.SERIES_KINDS)
+def source(request):
+    srcDf = bench.makeSeries(ROWS, request.param)
+    return request.param, srcDf, srcDf.memory_usage(index=True, deep=True).sum()
+
+
+def test_ctorMemory(source):
+    kind, srcDf, srcBytes = source
+    assert peakRatio(srcBytes, bench._newData, srcDf) <= maxRatio("ctor", kind)
+
+
+def test_ctorCompactMemory(source):
+    kind, srcDf, srcBytes = source
+    ratio = peakRatio(srcBytes, lambda: bench._newData(srcDf, compact=True))
+    assert ratio <= maxRatio("ctorCompact", kind)
+
+
+@pytest.mark.parametrize("compact", [False, True])
+def test_appendNewerMemory(source, compact):
+    kind, srcDf, srcBytes = source
+    tsData = quietData(srcDf, compact=compact)
+    chunk = bench.makeSeries(ROWS // 10, "regular", seed=1)
+    chunk.index = chunk.index + (tsData.endTs - bench.SERIES_START) + pd.Timedelta("1S")
+    ratio = peakRatio(srcBytes, tsData.appendData, chunk, 0)
+    assert ratio <= maxRatio("appendNewer", kind)
+
+
+@pytest.mark.parametrize("compact", [False, True])
+def test_dataAndSnapshotDoNotCopy(source, compact):
+    kind, srcDf, srcBytes = source
+    tsData = quietData(srcDf, compact=compact)
+    # In compact mode, the view is built once, and then kept.
+    tsData.data
+    assert peakRatio(srcBytes, lambda: tsData.data) <= maxRatio("data", kind)
+    ratio = peakRatio(srcBytes, lambda: tsData.snapshot().data)
+    assert ratio <= maxRatio("snapshot", kind)
+
+
+def test_filterMemory(source):
+    kind, srcDf, srcBytes = source
+    tsData = quietData(srcDf)
+    ratio = peakRatio(srcBytes, tsData.filter, "val > 0")
+    assert ratio <= maxRatio("filter", kind)
+
+
+def test_resampleDownMemory(source):
+    kind, srcDf, srcBytes = source
+    tsData = quietData(srcDf)
+    ratio = peakRatio(srcBytes, tsData.resample, "1T", "vixms")
+    assert ratio <= maxRatio("resampleDown", kind)
@@ -0,0 +1,45 @@
+# test_bpsTsIdxStore.py
+#
+# Tests for TsIdxStore and TsIdxStoreData
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from bpsTsIdxData import TsIdxData
+from bpsTsIdxStore import TsIdxStore
+
+pytest.importorskip("pyarrow")
+
+
+@pytest.fixture
+def store(tmp_path):
+    tsIndex = pd.date_range("2024-01-01", periods=5 * 1440, freq="1T", name="ts")
+    df = pd.DataFrame({"val": np.arange(len(tsIndex), dtype="float64")}, index=tsIndex)
+    tsStore = TsIdxStore(tmp_path)
+    tsStore.write(TsIdxData("tag", "ts", "val", df))
+    return tsStore
+
+
+def test_writeLeavesNoTemporaryFiles(store):
+    tagFiles = os.listdir(os.path.join(store.root, "tag"))
+    assert len([f for f in tagFiles if f.endswith(".parquet")]) == 5
+    assert not [f for f in tagFiles if f.endswith(".tmp")]
+
+
+def test_widenToNoLimit(store):
+    tsData = store.open("tag", "2024-01-02", "2024-01-03")
+    assert tsData.count == 2 * 1440
+
+    tsData.widen(noStart=True)
+    assert tsData.count == 3 * 1440
+    assert tsData.startTs == pd.Timestamp("2024-01-01")
+
+    # a start query does not narrow a window with no start limit
+    tsData.widen("2024-01-02")
+    assert tsData.count == 3 * 1440
+
+    tsData.widen(noEnd=True)
+    assert tsData.count == 5 * 1440
+    pd.testing.assert_frame_equal(tsData.data, store.open("tag").data)